@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptes', '0003_formation_niveau_formation_type_formation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='formation',
+            index=models.Index(fields=['type_formation', 'niveau', 'departement'], name='formation_type_niveau_idx'),
+        ),
+    ]
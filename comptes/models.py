@@ -117,6 +117,11 @@ class Formation(models.Model):
         related_name='formations'
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['type_formation', 'niveau', 'departement'], name='formation_type_niveau_idx'),
+        ]
+
     def __str__(self):
         # Un nom plus clair, ex: "Licence S3 - Génie Logiciel (INFO)"
         return f"{self.get_type_formation_display()} {self.niveau} - {self.nom} ({self.departement.code})"
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Cours, SessionCours, Presence
+from .resumes import supprimer_presences
 
 
 class CoursAdmin(admin.ModelAdmin):
@@ -32,6 +33,13 @@ class PresenceAdmin(admin.ModelAdmin):
     list_display = ('etudiant', 'session', 'horodatage_scan', 'valide')
     list_filter = ('session__cours', 'valide')
 
+    # Pas de signal de suppression sur Presence : les résumés sont mis à jour ici
+    def delete_model(self, request, obj):
+        supprimer_presences(Presence.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        supprimer_presences(queryset)
+
 
 admin.site.register(Cours, CoursAdmin)
 admin.site.register(SessionCours)
@@ -0,0 +1,218 @@
+"""
+Analyse vectorisée de l'assiduité d'un cours, d'une formation ou d'un
+département.
+
+La matrice étudiants × séances est chargée en une requête : une ligne par
+case attendue (étudiant inscrit au cours de la séance) avec sa présence
+éventuelle (LEFT JOIN sur presence, limité par index aux séances du
+périmètre, données par une sous-requête). Les cases sont gardées sous
+forme de tableaux NumPy parallèles (ligne, colonne, présent), triés par
+étudiant puis par date de séance : taux, séries d'absences, étudiants à
+risque et taux de remplissage des séances sont calculés sans boucle Python
+sur les cases.
+
+Pour un département, la matrice dense (étudiants × toutes les séances des
+cours suivis) serait presque vide ; elle n'est construite qu'à la demande
+(MatricePresence.dense).
+"""
+from operator import itemgetter
+
+import numpy as np
+from django.db.models import BooleanField, ExpressionWrapper, F, Q, FilteredRelation, Subquery
+
+from comptes.models import Utilisateur
+from .models import Cours, SessionCours
+
+# Seuil de taux de présence en dessous duquel un étudiant est signalé
+# (même limite que le badge « Critique » des statistiques de cours)
+SEUIL_RISQUE = 0.5
+
+
+class MatricePresence:
+    """
+    Cases attendues (étudiant, séance) d'un périmètre et leur état de présence.
+
+    etudiant_ids : identifiants des étudiants (lignes), triés
+    session_ids  : identifiants des séances (colonnes), par date de début
+    ligne, colonne, present : une entrée par case attendue, triées par
+                   (ligne, colonne), donc chronologiquement pour chaque étudiant
+    """
+
+    def __init__(self, etudiant_ids, session_ids, ligne, colonne, present):
+        self.etudiant_ids = etudiant_ids
+        self.session_ids = session_ids
+        self.ligne = ligne
+        self.colonne = colonne
+        self.present = present
+
+    @classmethod
+    def depuis_cases(cls, cases):
+        """ Construit la matrice depuis des tuples (etudiant_id, session_id, date_debut, present). """
+        cases = list(cases)
+        n = len(cases)
+        if not n:
+            vide = np.empty(0, dtype=np.int64)
+            return cls(vide, vide, vide, vide, np.empty(0, dtype=bool))
+
+        # np.fromiter évite les tuples intermédiaires de zip(*cases)
+        etudiants = np.fromiter(map(itemgetter(0), cases), dtype=np.int64, count=n)
+        sessions = np.fromiter(map(itemgetter(1), cases), dtype=np.int64, count=n)
+        present = np.fromiter(map(itemgetter(3), cases), dtype=bool, count=n)
+        etudiant_ids, ligne = np.unique(etudiants, return_inverse=True)
+
+        # Colonnes ordonnées par date de début (puis id) de la séance
+        session_ids, premiere, colonne_brute = np.unique(sessions, return_index=True, return_inverse=True)
+        instants = np.array([cases[i][2].timestamp() for i in premiere], dtype=np.float64)
+        ordre = np.lexsort((session_ids, instants))
+        rang = np.empty_like(ordre)
+        rang[ordre] = np.arange(len(ordre))
+        colonne = rang[colonne_brute]
+
+        tri = np.lexsort((colonne, ligne))
+        return cls(etudiant_ids, session_ids[ordre], ligne[tri], colonne[tri], present[tri])
+
+    # --- Agrégats ---
+
+    @property
+    def nb_etudiants(self):
+        return len(self.etudiant_ids)
+
+    @property
+    def nb_sessions(self):
+        return len(self.session_ids)
+
+    def dense(self):
+        """ Matrice booléenne étudiants × séances (False pour les cases non attendues). """
+        matrice = np.zeros((self.nb_etudiants, self.nb_sessions), dtype=bool)
+        matrice[self.ligne[self.present], self.colonne[self.present]] = True
+        return matrice
+
+    def seances_attendues(self):
+        return np.bincount(self.ligne, minlength=self.nb_etudiants)
+
+    def presences(self):
+        return np.bincount(self.ligne, weights=self.present, minlength=self.nb_etudiants).astype(np.int64)
+
+    def taux_etudiants(self):
+        """ Taux de présence de chaque étudiant (0 s'il n'avait aucune séance). """
+        attendues = self.seances_attendues()
+        return np.divide(self.presences(), attendues, out=np.zeros(self.nb_etudiants), where=attendues > 0)
+
+    def taux_remplissage(self):
+        """ Part des inscrits présents à chaque séance. """
+        attendus = np.bincount(self.colonne, minlength=self.nb_sessions)
+        presents = np.bincount(self.colonne, weights=self.present, minlength=self.nb_sessions)
+        return np.divide(presents, attendus, out=np.zeros(self.nb_sessions), where=attendus > 0)
+
+    def series_absences(self):
+        """
+        Pour chaque étudiant, (plus longue série d'absences consécutives, série
+        en cours à la dernière séance). Les séances d'autres cours ne
+        coupent pas une série.
+        """
+        plus_longue = np.zeros(self.nb_etudiants, dtype=np.int64)
+        en_cours = np.zeros(self.nb_etudiants, dtype=np.int64)
+        n = len(self.ligne)
+        if n == 0:
+            return plus_longue, en_cours
+
+        indices = np.arange(n)
+        absent = ~self.present
+        debut = np.r_[True, self.ligne[1:] != self.ligne[:-1]]
+
+        # Dernière case « présent » de l'étudiant (ou la case précédant sa première séance)
+        repere = np.where(absent, -1, indices)
+        repere[debut] = np.maximum(repere[debut], indices[debut] - 1)
+        repere = np.maximum.accumulate(repere)
+        serie = np.where(absent, indices - repere, 0)
+
+        lignes_debut = self.ligne[debut]
+        plus_longue[lignes_debut] = np.maximum.reduceat(serie, indices[debut])
+        fin = np.r_[indices[debut][1:] - 1, n - 1]
+        en_cours[lignes_debut] = serie[fin]
+        return plus_longue, en_cours
+
+    def etudiants_a_risque(self, seuil=SEUIL_RISQUE):
+        """ Indices (lignes) des étudiants ayant eu au moins une séance et un taux inférieur au seuil. """
+        return np.flatnonzero((self.seances_attendues() > 0) & (self.taux_etudiants() < seuil))
+
+    def resume(self, seuil=SEUIL_RISQUE):
+        """ Indicateurs du périmètre, sérialisables en JSON. """
+        taux = self.taux_etudiants()
+        plus_longue, en_cours = self.series_absences()
+        a_risque = self.etudiants_a_risque(seuil)
+        remplissage = self.taux_remplissage()
+
+        noms = dict(
+            Utilisateur.objects.filter(pk__in=self.etudiant_ids[a_risque].tolist()).values_list('pk', 'nom')
+        ) if len(a_risque) else {}
+
+        return {
+            'nb_etudiants': self.nb_etudiants,
+            'nb_sessions': self.nb_sessions,
+            'taux_global': round(float(self.present.mean()), 4) if len(self.present) else 0.0,
+            'taux_moyen_etudiants': round(float(taux.mean()), 4) if self.nb_etudiants else 0.0,
+            'remplissage_moyen': round(float(remplissage.mean()), 4) if self.nb_sessions else 0.0,
+            'seuil_risque': seuil,
+            'etudiants_a_risque': [
+                {
+                    'etudiant_id': int(self.etudiant_ids[i]),
+                    'nom': noms.get(int(self.etudiant_ids[i]), ''),
+                    'taux': round(float(taux[i]), 4),
+                    'plus_longue_serie_absences': int(plus_longue[i]),
+                    'serie_absences_en_cours': int(en_cours[i]),
+                }
+                for i in a_risque[np.argsort(taux[a_risque], kind='stable')]
+            ],
+            'remplissage_sessions': [
+                {'session_id': int(session_id), 'taux': round(float(valeur), 4)}
+                for session_id, valeur in zip(self.session_ids, remplissage)
+            ],
+        }
+
+
+def _cases(filtre, depuis=None, jusqu_a=None):
+    """ Cases attendues du périmètre, LEFT JOIN sur la présence de l'étudiant à la séance. """
+    # Sans la restriction aux séances du périmètre, PostgreSQL lit toute la
+    # table presence pour la jointure ; avec elle, seules les présences de ces
+    # séances (index session_id). Sous-requête plutôt que liste : sa taille ne
+    # dépend pas du nombre de séances.
+    seances = SessionCours.objects.filter(cours__in=Cours.etudiants.through.objects.filter(filtre).values('cours_id'))
+    if depuis is not None:
+        filtre &= Q(cours__sessioncours__date_debut__gte=depuis)
+        seances = seances.filter(date_debut__gte=depuis)
+    if jusqu_a is not None:
+        filtre &= Q(cours__sessioncours__date_debut__lt=jusqu_a)
+        seances = seances.filter(date_debut__lt=jusqu_a)
+    inscriptions = Cours.etudiants.through.objects.filter(filtre, cours__sessioncours__isnull=False)
+    # Le filtre précède l'annotation : la jointure sur session_cours est partagée.
+    return inscriptions.annotate(
+        presence_etudiant=FilteredRelation(
+            'cours__sessioncours__presence',
+            condition=Q(
+                cours__sessioncours__presence__etudiant_id=F('etudiant_id'),
+                cours__sessioncours__presence__session_id__in=Subquery(seances.values('id')),
+            ),
+        ),
+    ).annotate(
+        present=ExpressionWrapper(Q(presence_etudiant__id__isnull=False), output_field=BooleanField()),
+    ).values_list(
+        'etudiant_id', 'cours__sessioncours__id', 'cours__sessioncours__date_debut', 'present'
+    ).order_by()
+
+
+def matrice_cours(cours_id, depuis=None, jusqu_a=None):
+    """ Matrice des inscrits d'un cours × ses séances. """
+    return MatricePresence.depuis_cases(_cases(Q(cours_id=cours_id), depuis, jusqu_a))
+
+
+def matrice_formation(formation_id, depuis=None, jusqu_a=None):
+    """ Matrice des étudiants d'une formation × les séances des cours qu'ils suivent. """
+    return MatricePresence.depuis_cases(_cases(Q(etudiant__formation_id=formation_id), depuis, jusqu_a))
+
+
+def matrice_departement(departement_code, depuis=None, jusqu_a=None):
+    """ Matrice des étudiants des formations d'un département × les séances des cours qu'ils suivent. """
+    return MatricePresence.depuis_cases(
+        _cases(Q(etudiant__formation__departement_id=departement_code), depuis, jusqu_a)
+    )
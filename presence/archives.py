@@ -0,0 +1,335 @@
+"""
+Archives froides des années universitaires closes.
+
+Une fois l'année terminée (1er septembre → 31 août), ses séances et ses
+présences sont exportées dans un fichier colonnaire compressé, puis
+supprimées de la base (commande archives_presence) :
+
+    archives/annee_2024.npz (np.savez_compressed), une colonne par tableau :
+        session_id, session_cours, session_enseignant,
+        session_debut, session_fin     séances, triées par id ; instants en
+                                       secondes Unix, fin -1 si absente
+        presence_etudiant, presence_session,
+        presence_horodatage, presence_valide
+                                       présences, triées par (étudiant, séance)
+        inscription_etudiant, inscription_cours
+                                       inscriptions aux cours de l'année au
+                                       moment de l'export, triées par étudiant
+        seances_cours, seances_nombre  nombre de séances de chaque cours
+
+Lecture : au premier accès, les colonnes sont décompressées une fois en
+fichiers .npy (répertoire annee_2024/) puis projetées en mémoire
+(np.load(mmap_mode='r')). Les tableaux étant triés par étudiant, le taux
+de présence d'un étudiant se lit par recherche dichotomique : seules les
+quelques pages qui le concernent sont lues sur le disque.
+
+Les résumés de présence des cours touchés sont recalculés après la
+suppression. Exporter l'année avant d'archiver ses partitions
+(presence.partitions) : l'export lit la table presence.
+
+Réglage PRESENCE_ARCHIVES (settings) :
+    REPERTOIRE : dossier des archives
+"""
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Cours, SessionCours, Presence, ResumePresenceSession
+from .partitions import MOIS_DEBUT_SEMESTRES
+from .resumes import reconstruire_resumes, invalider_bilans_cours, invalider_tableaux_enseignants
+
+REGLAGES_PAR_DEFAUT = {
+    'REPERTOIRE': os.path.join(settings.BASE_DIR, 'archives'),
+}
+
+# Séances lues ou supprimées par requête
+TAILLE_LOT = 500
+
+
+class ErreurArchive(Exception):
+    """ Export ou lecture d'archive impossible. """
+
+
+def reglages():
+    return {**REGLAGES_PAR_DEFAUT, **getattr(settings, 'PRESENCE_ARCHIVES', {})}
+
+
+def bornes_annee(annee):
+    """ [début, fin) de l'année universitaire annee-(annee+1), en heure locale. """
+    mois = MOIS_DEBUT_SEMESTRES[0]
+    return (timezone.make_aware(datetime.datetime(annee, mois, 1)),
+            timezone.make_aware(datetime.datetime(annee + 1, mois, 1)))
+
+
+def chemin_archive(annee, repertoire=None):
+    return os.path.join(repertoire or reglages()['REPERTOIRE'], f'annee_{annee}.npz')
+
+
+def _entiers(valeurs):
+    """ Tableau d'entiers sur 32 bits si les valeurs y tiennent, 64 sinon. """
+    tableau = np.asarray(valeurs, dtype=np.int64)
+    if len(tableau) and (tableau.max() > np.iinfo(np.int32).max or tableau.min() < np.iinfo(np.int32).min):
+        return tableau
+    return tableau.astype(np.int32)
+
+
+def _secondes(instant):
+    return int(instant.timestamp()) if instant else -1
+
+
+# --- Export ---
+
+def exporter_annee(annee, supprimer=True, repertoire=None):
+    """
+    Exporte les séances de l'année universitaire et leurs présences dans
+    annee_<annee>.npz, puis (supprimer) les efface de la base dans la même
+    transaction. Renvoie (nombre de séances, nombre de présences).
+    """
+    debut, fin = bornes_annee(annee)
+    if fin > timezone.now():
+        raise ErreurArchive(f"L'année {annee}-{annee + 1} n'est pas terminée.")
+    chemin = chemin_archive(annee, repertoire)
+    if os.path.exists(chemin):
+        raise ErreurArchive(f"L'année {annee}-{annee + 1} est déjà archivée ({chemin}).")
+
+    # Le fichier n'est gardé que si la transaction (suppression comprise) aboutit
+    ecrit = False
+    try:
+        with transaction.atomic():
+            seances = SessionCours.objects.filter(date_debut__gte=debut, date_debut__lt=fin)
+            if seances.filter(actif=True).exists():
+                raise ErreurArchive(f"Des séances de l'année {annee}-{annee + 1} sont encore actives.")
+            lignes = list(
+                seances.order_by('id').values_list('id', 'cours_id', 'enseignant_id', 'date_debut', 'date_fin')
+            )
+            if not lignes:
+                raise ErreurArchive(f"Aucune séance en {annee}-{annee + 1}.")
+            session_ids = [ligne[0] for ligne in lignes]
+            cours_ids = sorted({ligne[1] for ligne in lignes})
+
+            presences = _colonnes_presences(session_ids)
+
+            inscriptions = sorted(
+                Cours.etudiants.through.objects.filter(cours_id__in=cours_ids).values_list('etudiant_id', 'cours_id')
+            )
+            seances_cours, seances_nombre = np.unique(
+                np.array([ligne[1] for ligne in lignes], dtype=np.int64), return_counts=True
+            )
+
+            colonnes = {
+                'session_id': _entiers(session_ids),
+                'session_cours': _entiers([ligne[1] for ligne in lignes]),
+                'session_enseignant': _entiers([ligne[2] for ligne in lignes]),
+                'session_debut': np.array([_secondes(ligne[3]) for ligne in lignes], dtype=np.int64),
+                'session_fin': np.array([_secondes(ligne[4]) for ligne in lignes], dtype=np.int64),
+                **presences,
+                'inscription_etudiant': _entiers([i[0] for i in inscriptions]),
+                'inscription_cours': _entiers([i[1] for i in inscriptions]),
+                'seances_cours': _entiers(seances_cours),
+                'seances_nombre': _entiers(seances_nombre),
+            }
+            _ecrire(chemin, colonnes)
+            ecrit = True
+
+            if supprimer:
+                supprimees = _supprimer(session_ids)
+                exportees = len(presences['presence_etudiant'])
+                if supprimees != exportees:
+                    raise ErreurArchive(
+                        f"{supprimees} présences supprimées pour {exportees} exportées : "
+                        "écriture concurrente, export annulé."
+                    )
+                reconstruire_resumes(cours_ids)
+                enseignants = {ligne[2] for ligne in lignes}
+                transaction.on_commit(lambda: _invalider(cours_ids, enseignants))
+    except BaseException:
+        if ecrit:
+            os.remove(chemin)
+        raise
+
+    return len(session_ids), len(presences['presence_etudiant'])
+
+
+def _colonnes_presences(session_ids):
+    """
+    Colonnes presence_* des séances données, triées par (étudiant, séance).
+    Chaque lot de séances est converti en tableaux dès sa lecture : seuls
+    les tuples d'un lot existent à la fois.
+    """
+    lots = []
+    for debut_lot in range(0, len(session_ids), TAILLE_LOT):
+        lignes = list(
+            Presence.objects.filter(session_id__in=session_ids[debut_lot:debut_lot + TAILLE_LOT])
+            .values_list('etudiant_id', 'session_id', 'horodatage_scan', 'valide').iterator(chunk_size=5000)
+        )
+        lots.append((
+            np.fromiter((ligne[0] for ligne in lignes), dtype=np.int64, count=len(lignes)),
+            np.fromiter((ligne[1] for ligne in lignes), dtype=np.int64, count=len(lignes)),
+            np.fromiter((_secondes(ligne[2]) for ligne in lignes), dtype=np.int64, count=len(lignes)),
+            np.fromiter((ligne[3] for ligne in lignes), dtype=bool, count=len(lignes)),
+        ))
+    # session_ids n'est jamais vide (exporter_annee) : il y a au moins un lot
+    etudiants, sessions, horodatages, valides = (np.concatenate(colonne) for colonne in zip(*lots))
+    ordre = np.lexsort((sessions, etudiants))
+    return {
+        'presence_etudiant': _entiers(etudiants[ordre]),
+        'presence_session': _entiers(sessions[ordre]),
+        'presence_horodatage': horodatages[ordre],
+        'presence_valide': valides[ordre],
+    }
+
+
+def _ecrire(chemin, colonnes):
+    """ Écriture atomique : fichier temporaire du même dossier, puis renommage. """
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    descripteur, temporaire = tempfile.mkstemp(dir=os.path.dirname(chemin), suffix='.npz.tmp')
+    try:
+        with os.fdopen(descripteur, 'wb') as fichier:
+            np.savez_compressed(fichier, **colonnes)
+        os.replace(temporaire, chemin)
+    except BaseException:
+        os.remove(temporaire)
+        raise
+
+
+def _supprimer(session_ids):
+    """
+    Supprime présences, résumés et séances par lots, les présences en SQL
+    direct (un DELETE par lot). Renvoie le nombre de présences supprimées ;
+    les résumés des cours sont ensuite recalculés (reconstruire_resumes).
+    """
+    supprimees = 0
+    with connection.cursor() as curseur:
+        for debut_lot in range(0, len(session_ids), TAILLE_LOT):
+            lot = session_ids[debut_lot:debut_lot + TAILLE_LOT]
+            curseur.execute(
+                f'DELETE FROM {Presence._meta.db_table} WHERE session_id IN ({", ".join(["%s"] * len(lot))})', lot
+            )
+            supprimees += curseur.rowcount
+            ResumePresenceSession.objects.filter(session_id__in=lot).delete()
+            SessionCours.objects.filter(id__in=lot).delete()
+    return supprimees
+
+
+def _invalider(cours_ids, enseignant_ids):
+    for cours_id in cours_ids:
+        invalider_bilans_cours(cours_id)
+    invalider_tableaux_enseignants(enseignant_ids)
+
+
+# --- Lecture ---
+
+class ArchiveAnnee:
+    """ Colonnes d'une année archivée, projetées en mémoire à la demande. """
+
+    def __init__(self, annee, repertoire=None):
+        self.annee = annee
+        self.chemin = chemin_archive(annee, repertoire)
+        if not os.path.exists(self.chemin):
+            raise ErreurArchive(f"Aucune archive pour l'année {annee}-{annee + 1}.")
+        self.repertoire = self.chemin[:-len('.npz')]
+        self._colonnes = {}
+        self._verrou = threading.Lock()
+
+    def _decompresser(self):
+        """ Décompresse les colonnes en .npy (une fois, renommage atomique du dossier). """
+        if os.path.isdir(self.repertoire):
+            return
+        temporaire = tempfile.mkdtemp(dir=os.path.dirname(self.chemin), prefix='.decompression_')
+        try:
+            with np.load(self.chemin) as archive:
+                for nom in archive.files:
+                    np.save(os.path.join(temporaire, f'{nom}.npy'), archive[nom])
+            os.rename(temporaire, self.repertoire)
+        except OSError:
+            # Décompressée entre-temps par un autre processus
+            shutil.rmtree(temporaire, ignore_errors=True)
+            if not os.path.isdir(self.repertoire):
+                raise
+
+    def colonne(self, nom):
+        if nom not in self._colonnes:
+            with self._verrou:
+                if nom not in self._colonnes:
+                    self._decompresser()
+                    self._colonnes[nom] = np.load(os.path.join(self.repertoire, f'{nom}.npy'), mmap_mode='r')
+        return self._colonnes[nom]
+
+    @staticmethod
+    def _tranche(colonne, valeur):
+        """ Indices [début, fin) des lignes égales à valeur dans une colonne triée. """
+        return int(np.searchsorted(colonne, valeur, 'left')), int(np.searchsorted(colonne, valeur, 'right'))
+
+    def presences(self, etudiant_id):
+        """ (session_id, horodatage) des présences de l'étudiant, par séance. """
+        debut, fin = self._tranche(self.colonne('presence_etudiant'), etudiant_id)
+        sessions = self.colonne('presence_session')[debut:fin]
+        horodatages = self.colonne('presence_horodatage')[debut:fin]
+        return [
+            (int(session_id), datetime.datetime.fromtimestamp(int(horodatage), tz=datetime.timezone.utc))
+            for session_id, horodatage in zip(sessions, horodatages)
+        ]
+
+    def cours_suivis(self, etudiant_id):
+        debut, fin = self._tranche(self.colonne('inscription_etudiant'), etudiant_id)
+        return np.asarray(self.colonne('inscription_cours')[debut:fin])
+
+    def taux_presence(self, etudiant_id):
+        """
+        Séances attendues (celles des cours où l'étudiant était inscrit),
+        présences et taux de l'étudiant sur l'année. Seules comptent les
+        présences valides aux séances de ces cours : le taux ne dépasse pas 1.
+        """
+        seances_cours = self.colonne('seances_cours')
+        cours = np.intersect1d(self.cours_suivis(etudiant_id), seances_cours, assume_unique=True)
+        seances = int(np.asarray(self.colonne('seances_nombre'))[np.searchsorted(seances_cours, cours)].sum())
+
+        debut, fin = self._tranche(self.colonne('presence_etudiant'), etudiant_id)
+        # Cours de chaque séance de l'étudiant (session_id est trié)
+        sessions = np.searchsorted(self.colonne('session_id'), self.colonne('presence_session')[debut:fin])
+        cours_presences = np.asarray(self.colonne('session_cours'))[sessions]
+        comptees = np.isin(cours_presences, cours) & self.colonne('presence_valide')[debut:fin]
+        presences = int(comptees.sum())
+        return {
+            'annee': self.annee,
+            'seances': seances,
+            'presences': presences,
+            'taux': round(presences / seances, 4) if seances else 0.0,
+        }
+
+
+_archives = {}
+_verrou_archives = threading.Lock()
+
+
+def get_archive(annee):
+    """ Archive de l'année, ouverte une fois par processus. """
+    archive = _archives.get(annee)
+    if archive is None:
+        with _verrou_archives:
+            archive = _archives.get(annee)
+            if archive is None:
+                archive = _archives[annee] = ArchiveAnnee(annee)
+    return archive
+
+
+def taux_presence(etudiant_id, annee):
+    """ Taux de présence de l'étudiant sur une année archivée. """
+    return get_archive(annee).taux_presence(etudiant_id)
+
+
+def annees_archivees(repertoire=None):
+    repertoire = repertoire or reglages()['REPERTOIRE']
+    if not os.path.isdir(repertoire):
+        return []
+    return sorted(
+        int(nom[len('annee_'):-len('.npz')]) for nom in os.listdir(repertoire)
+        if nom.startswith('annee_') and nom.endswith('.npz')
+    )
@@ -0,0 +1,66 @@
+"""
+Authentification des vues asynchrones (mode ASGI, voir presence/views_async.py).
+
+Les décorateurs DRF (@api_view, @authentication_classes...) ne fonctionnent
+qu'avec des vues synchrones. On réutilise ici la validation des jetons de
+rest_framework_simplejwt, qui ne fait aucune requête, et on charge
+l'utilisateur avec l'ORM asynchrone.
+"""
+from functools import wraps
+
+from django.http import JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from comptes.models import Utilisateur
+
+_jwt = JWTAuthentication()
+
+
+async def authentifier_async(request, jwt_seulement=False):
+    """
+    Retourne l'Utilisateur authentifié (profils etudiant/enseignant préchargés)
+    ou None. Le jeton JWT de l'en-tête Authorization est prioritaire ; à défaut,
+    la session Django est utilisée sauf si jwt_seulement est vrai.
+    """
+    header = _jwt.get_header(request)
+    if header is not None:
+        try:
+            raw_token = _jwt.get_raw_token(header)
+            if raw_token is None:
+                return None
+            user_id = _jwt.get_validated_token(raw_token).get(api_settings.USER_ID_CLAIM)
+        except (InvalidToken, AuthenticationFailed):
+            return None
+    elif jwt_seulement:
+        return None
+    else:
+        user = await request.auser()
+        if not user.is_authenticated:
+            return None
+        user_id = user.pk
+
+    return await Utilisateur.objects.select_related('etudiant', 'enseignant').filter(
+        pk=user_id, is_active=True
+    ).afirst()
+
+
+def acces_async(*roles, jwt_seulement=False):
+    """
+    Équivalent asynchrone de @authentication_classes + @permission_classes :
+    exige un utilisateur authentifié dont le rôle figure dans roles.
+    """
+    def decorateur(vue):
+        @wraps(vue)
+        async def enveloppe(request, *args, **kwargs):
+            user = await authentifier_async(request, jwt_seulement=jwt_seulement)
+            if user is None:
+                return JsonResponse({'detail': "Informations d'authentification non fournies."}, status=401)
+            if roles and user.role not in roles:
+                return JsonResponse({'detail': "Vous n'avez pas la permission d'effectuer cette action."}, status=403)
+            request.user = user
+            return await vue(request, *args, **kwargs)
+        return enveloppe
+    return decorateur
@@ -0,0 +1,36 @@
+"""
+Contrôles de configuration (python manage.py check, lancés aussi au démarrage).
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Caches propres à chaque processus : le registre des sessions n'est pas partagé entre workers
+CACHES_LOCAUX = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+
+@register(Tags.caches)
+def cache_presence_partage(app_configs, **kwargs):
+    """
+    presence.W001 : hors DEBUG, le cache PRESENCE_CACHE_ALIAS devrait être
+    partagé. Avec plusieurs workers et un cache local, l'arrêt d'une session
+    n'est connu que du worker qui l'a traité : les autres acceptent encore
+    ses scans jusqu'à ce que leur entrée expire (registry.DUREE_MAX_ENTREE_SESSION).
+    """
+    if settings.DEBUG:
+        return []
+    alias = getattr(settings, 'PRESENCE_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend not in CACHES_LOCAUX:
+        return []
+    from .registry import DUREE_MAX_ENTREE_SESSION
+    return [
+        Warning(
+            f"Le cache '{alias}' (PRESENCE_CACHE_ALIAS) est propre à chaque processus.",
+            hint=(
+                "Avec plusieurs workers, une session arrêtée reste acceptée par les autres workers "
+                f"jusqu'à {DUREE_MAX_ENTREE_SESSION} secondes. Déclarer un cache partagé (Redis, Memcached) "
+                "dans CACHES, ou ne lancer qu'un worker."
+            ),
+            id='presence.W001',
+        )
+    ]
@@ -0,0 +1,94 @@
+"""
+Export CSV des présences, diffusé ligne par ligne (StreamingHttpResponse).
+
+Les lignes sont lues par QuerySet.iterator(chunk_size=...) : avec
+PostgreSQL, un curseur côté serveur est utilisé et la mémoire reste
+constante quelle que soit la période exportée. Les premiers octets partent
+dès le premier paquet lu. Le flux peut être compressé à la volée (gzip) ;
+le compresseur est vidé après chaque paquet, pour que le client le reçoive
+sans attendre que le tampon de zlib soit plein.
+
+Le séparateur est « ; » et le fichier commence par un BOM UTF-8, pour une
+ouverture directe dans Excel en français. Les heures sont en heure locale
+(TIME_ZONE).
+"""
+import csv
+import io
+import zlib
+
+from django.utils import timezone
+
+from .models import Presence
+
+# Nombre de lignes lues par aller-retour avec la base
+TAILLE_PAQUET_EXPORT = 2000
+
+# Morceaux de texte (paquets de lignes) compressés entre deux vidages du flux gzip
+MORCEAUX_PAR_VIDAGE = 1
+
+ENTETES_EXPORT = [
+    'date_seance', 'heure_scan', 'code_cours', 'cours', 'session_id',
+    'etudiant_id', 'nom', 'prenom', 'email', 'formation', 'departement',
+]
+
+CHAMPS_EXPORT = (
+    'session__date_debut', 'horodatage_scan', 'session__cours__code', 'session__cours__nom', 'session_id',
+    'etudiant_id', 'etudiant__id__nom', 'etudiant__id__prenom', 'etudiant__id__email',
+    'etudiant__formation__nom', 'etudiant__formation__departement_id',
+)
+
+
+def presences_a_exporter(cours_ids=None, formation_id=None, departement_code=None, depuis=None, jusqu_a=None):
+    """ Présences filtrées (sur la date de début de séance pour depuis/jusqu_a), dans l'ordre de l'export. """
+    presences = Presence.objects.all()
+    if cours_ids is not None:
+        presences = presences.filter(session__cours_id__in=cours_ids)
+    if formation_id is not None:
+        presences = presences.filter(etudiant__formation_id=formation_id)
+    if departement_code is not None:
+        presences = presences.filter(etudiant__formation__departement_id=departement_code)
+    if depuis is not None:
+        presences = presences.filter(session__date_debut__gte=depuis)
+    if jusqu_a is not None:
+        presences = presences.filter(session__date_debut__lt=jusqu_a)
+    return presences.order_by('session__date_debut', 'session_id', 'id').values_list(*CHAMPS_EXPORT)
+
+
+def lignes_csv(presences):
+    """ Générateur de morceaux de texte CSV, un par paquet de lignes lu en base. """
+    tampon = io.StringIO()
+    writer = csv.writer(tampon, delimiter=';')
+    tampon.write('\ufeff')
+    writer.writerow(ENTETES_EXPORT)
+    # L'en-tête part avant la première lecture : le téléchargement démarre aussitôt.
+    yield tampon.getvalue()
+    tampon.seek(0)
+    tampon.truncate()
+
+    for i, (date_debut, horodatage, *reste) in enumerate(presences.iterator(chunk_size=TAILLE_PAQUET_EXPORT), 1):
+        writer.writerow([
+            timezone.localtime(date_debut).strftime('%Y-%m-%d %H:%M'),
+            timezone.localtime(horodatage).strftime('%H:%M:%S'),
+            *reste,
+        ])
+        if i % TAILLE_PAQUET_EXPORT == 0:
+            yield tampon.getvalue()
+            tampon.seek(0)
+            tampon.truncate()
+    yield tampon.getvalue()
+
+
+def compresser_gzip(morceaux):
+    """
+    Compresse à la volée un flux de texte en gzip. Tous les
+    MORCEAUX_PAR_VIDAGE morceaux, Z_SYNC_FLUSH envoie tout ce qui a été
+    compressé : le client peut décompresser les lignes déjà reçues.
+    """
+    compresseur = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 : en-tête gzip
+    for i, morceau in enumerate(morceaux, 1):
+        donnees = compresseur.compress(morceau.encode('utf-8'))
+        if i % MORCEAUX_PAR_VIDAGE == 0:
+            donnees += compresseur.flush(zlib.Z_SYNC_FLUSH)
+        if donnees:
+            yield donnees
+    yield compresseur.flush()
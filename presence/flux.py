@@ -0,0 +1,226 @@
+"""
+Flux Server-Sent Events (SSE) des présences d'une session, pour le suivi en
+direct sur la page de l'enseignant (static/js/realtime_presence.js).
+
+Chaque présence est envoyée avec son identifiant comme id d'événement. À la
+reconnexion, le navigateur renvoie le dernier id reçu (en-tête
+Last-Event-ID) : le flux reprend juste après. Plusieurs processus
+d'ingestion valident leurs lots en parallèle : une présence peut devenir
+visible après une présence d'id plus grand. Chaque lecture reprend donc
+aussi les présences des CHEVAUCHEMENT_SECONDES dernières secondes ; celles
+déjà envoyées par le flux sont écartées, et la page ignore un id déjà affiché
+(reprise après reconnexion).
+
+Entre deux scans, le flux ne lit que la version des présences de la session
+dans le cache (voir registry.version_presences) ; la base n'est interrogée
+que lorsque cette version change, et au plus tard toutes les
+INTERVALLE_KEEPALIVE secondes (cache propre à un autre processus).
+
+Le flux se termine à la fin de la session (événement « fin ») ou après
+DUREE_MAX_FLUX secondes : le navigateur se reconnecte alors de lui-même.
+
+Servi en synchrone (WSGI), un flux occupe un thread du worker pendant toute
+sa durée : la page de session ne l'utilise qu'avec les vues asynchrones
+(PRESENCE_VUES_ASYNC) et interroge get_presences_api sinon. Le flux
+synchrone reste servi aux autres clients, dans la limite de
+FLUX_SYNCHRONES_MAX flux par processus (503 au-delà, voir ouvrir_flux_presences).
+
+Django ne rend une connexion au pool (presence_projet/connexions.py) qu'à la
+fin de la requête : le flux la rend lui-même après chaque lecture, sans quoi
+chaque page de suivi ouverte garderait une connexion pendant DUREE_MAX_FLUX.
+"""
+import asyncio
+import datetime
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Presence
+from .registry import version_presences, aversion_presences, get_session_active, aget_session_active
+
+# Délai entre deux lectures de la version des présences (secondes)
+INTERVALLE_VERIFICATION = 1
+
+# Délai maximal sans message : un commentaire garde la connexion ouverte
+# à travers les proxys (secondes)
+INTERVALLE_KEEPALIVE = 15
+
+# Durée de vie d'une connexion avant reconnexion du navigateur (secondes)
+DUREE_MAX_FLUX = 5 * 60
+
+# Délai de reconnexion indiqué au navigateur (millisecondes)
+DELAI_RECONNEXION_MS = 3000
+
+# Présences relues à chaque lecture, quel que soit leur id (secondes)
+CHEVAUCHEMENT_SECONDES = 30
+
+# Flux synchrones servis en même temps par un processus (un thread chacun)
+FLUX_SYNCHRONES_MAX = 4
+
+
+def curseur_depart(request):
+    """ Dernier id de présence reçu par le client (Last-Event-ID ou ?depuis=). """
+    valeur = request.headers.get('Last-Event-ID') or request.GET.get('depuis') or 0
+    try:
+        return max(int(valeur), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _requete_presences(session_id, curseur, depuis):
+    """ Présences d'id supérieur au curseur, plus celles enregistrées depuis l'instant donné. """
+    return Presence.objects.filter(
+        Q(id__gt=curseur) | Q(horodatage_scan__gte=depuis), session_id=session_id
+    ).order_by('id').values_list('id', 'etudiant__id__nom', 'etudiant__id__prenom', 'horodatage_scan')
+
+
+def _evenement_presence(presence_id, nom, prenom, horodatage):
+    donnees = json.dumps({'nom': nom, 'prenom': prenom, 'heure': horodatage.strftime('%H:%M:%S')})
+    return f'id: {presence_id}\nevent: presence\ndata: {donnees}\n\n'
+
+
+EVENEMENT_FIN = 'event: fin\ndata: {}\n\n'
+KEEPALIVE = ': keep-alive\n\n'
+
+
+def _rendre_connexion():
+    """ Rend la connexion du thread (au pool, ou la ferme) entre deux lectures. """
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+class _EtatFlux:
+    """ Décide, à chaque tour, s'il faut relire la base ou envoyer un keep-alive. """
+
+    def __init__(self, session_id, curseur):
+        self.session_id = session_id
+        self.curseur = curseur
+        # Présences récentes déjà envoyées : id -> horodatage
+        self.envoyees = {}
+        self.version = None
+        self.debut = self.derniere_lecture = self.dernier_envoi = time.monotonic()
+
+    def expire(self):
+        return time.monotonic() - self.debut >= DUREE_MAX_FLUX
+
+    def relecture_necessaire(self, version):
+        """ version : version courante des présences de la session (registry.version_presences). """
+        if version != self.version or time.monotonic() - self.derniere_lecture >= INTERVALLE_KEEPALIVE:
+            self.version = version
+            self.derniere_lecture = time.monotonic()
+            return True
+        return False
+
+    def requete(self):
+        depuis = timezone.now() - datetime.timedelta(seconds=CHEVAUCHEMENT_SECONDES)
+        self.envoyees = {presence_id: h for presence_id, h in self.envoyees.items() if h >= depuis}
+        return _requete_presences(self.session_id, self.curseur, depuis)
+
+    def evenements(self, presences):
+        morceaux = []
+        for presence in presences:
+            if presence[0] in self.envoyees:
+                continue
+            morceaux.append(_evenement_presence(*presence))
+            self.envoyees[presence[0]] = presence[3]
+            self.curseur = max(self.curseur, presence[0])
+        if morceaux:
+            self.dernier_envoi = time.monotonic()
+        return ''.join(morceaux)
+
+    def keepalive(self):
+        if time.monotonic() - self.dernier_envoi >= INTERVALLE_KEEPALIVE:
+            self.dernier_envoi = time.monotonic()
+            return KEEPALIVE
+        return ''
+
+
+def flux_presences(session_id, curseur):
+    """ Générateur SSE pour les vues synchrones (WSGI). """
+    etat = _EtatFlux(session_id, curseur)
+    yield f'retry: {DELAI_RECONNEXION_MS}\n\n'
+    while not etat.expire():
+        # Lire la version avant l'état de la session : aucun lot final n'est manqué.
+        if etat.relecture_necessaire(version_presences(session_id)):
+            active = get_session_active(session_id) is not None
+            evenements = etat.evenements(list(etat.requete()))
+            _rendre_connexion()
+            if evenements:
+                yield evenements
+            if not active:
+                yield EVENEMENT_FIN
+                return
+        message = etat.keepalive()
+        if message:
+            yield message
+        time.sleep(INTERVALLE_VERIFICATION)
+
+
+class _FluxSynchrone:
+    """ Flux synchrone qui libère sa place à sa fermeture (fin de la réponse HTTP). """
+    ouverts = 0
+    verrou = threading.Lock()
+
+    def __init__(self, flux):
+        self.flux = flux
+        self.ferme = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.flux)
+
+    def close(self):
+        with _FluxSynchrone.verrou:
+            if self.ferme:
+                return
+            self.ferme = True
+            _FluxSynchrone.ouverts -= 1
+        self.flux.close()
+
+
+def ouvrir_flux_presences(session_id, curseur):
+    """
+    Flux synchrone des présences, None si le processus en sert déjà
+    FLUX_SYNCHRONES_MAX (chacun occupe un thread jusqu'à sa fin).
+    """
+    with _FluxSynchrone.verrou:
+        if _FluxSynchrone.ouverts >= FLUX_SYNCHRONES_MAX:
+            return None
+        _FluxSynchrone.ouverts += 1
+    return _FluxSynchrone(flux_presences(session_id, curseur))
+
+
+async def aflux_presences(session_id, curseur):
+    """ Générateur SSE asynchrone (ASGI) : une connexion ouverte ne mobilise aucun thread. """
+    etat = _EtatFlux(session_id, curseur)
+    yield f'retry: {DELAI_RECONNEXION_MS}\n\n'
+    while not etat.expire():
+        if etat.relecture_necessaire(await aversion_presences(session_id)):
+            active = await aget_session_active(session_id) is not None
+            evenements = etat.evenements([p async for p in etat.requete()])
+            await sync_to_async(_rendre_connexion)()
+            if evenements:
+                yield evenements
+            if not active:
+                yield EVENEMENT_FIN
+                return
+        message = etat.keepalive()
+        if message:
+            yield message
+        await asyncio.sleep(INTERVALLE_VERIFICATION)
+
+
+def reponse_sse(flux):
+    """ Réponse HTTP text/event-stream, non mise en tampon par les proxys. """
+    reponse = StreamingHttpResponse(flux, content_type='text/event-stream')
+    reponse['Cache-Control'] = 'no-cache'
+    reponse['X-Accel-Buffering'] = 'no'
+    return reponse
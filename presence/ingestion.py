@@ -0,0 +1,275 @@
+"""
+Ingestion différée (write-behind) des présences validées par valider_scan.
+
+Les scans acceptés sont mis en file puis insérés par lots avec
+bulk_create(ignore_conflicts=True), toutes les INTERVALLE_MS millisecondes ou
+dès que TAILLE_LOT scans sont en attente. Les doublons sont détectés dans un
+ensemble en mémoire par session, initialisé depuis la base au premier scan
+de la session dans le processus.
+
+Réglage PRESENCE_INGESTION (settings) :
+    ASYNC          : False pour insérer chaque lot immédiatement dans la requête
+    INTERVALLE_MS  : délai maximal avant l'écriture d'un scan
+    TAILLE_LOT     : nombre de scans déclenchant une écriture anticipée
+
+Chaque lot met à jour, dans la même transaction, les résumés de présence
+lus par les statistiques (voir presence/resumes.py). Plusieurs processus
+peuvent écrire des présences d'une même session : chaque lot verrouille ses
+sessions (SELECT ... FOR UPDATE) avant d'écarter les présences déjà en base,
+pour ne compter que les lignes qu'il insère. SQLite ignore ce verrou : avec
+plusieurs processus, y ouvrir les transactions en écriture
+(OPTIONS 'transaction_mode': 'IMMEDIATE').
+
+L'horodatage d'une présence est celui de l'écriture du lot (auto_now_add),
+soit au plus INTERVALLE_MS après le scan.
+
+Un lot refusé par la base (étudiant supprimé entre-temps...) est réécrit
+ligne par ligne : les lignes fautives sont écartées et journalisées, les
+autres sont enregistrées. Si la base est injoignable, le lot reste en file
+pour le cycle suivant. Aucune erreur n'est renvoyée à la requête du scan.
+
+Les étudiants vus d'une session sans scan depuis DUREE_INACTIVITE_VUS sont
+oubliés (session jamais arrêtée) ; ils seraient relus en base au scan suivant.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction, InterfaceError, OperationalError
+
+from .models import Presence, SessionCours
+from .registry import signaler_presences
+from .resumes import compter_presences
+from .utils import empreinte_qr
+
+logger = logging.getLogger(__name__)
+
+REGLAGES_PAR_DEFAUT = {
+    'ASYNC': True,
+    'INTERVALLE_MS': 200,
+    'TAILLE_LOT': 200,
+}
+
+# Erreurs de connexion : le lot est gardé pour le cycle suivant
+ERREURS_CONNEXION = (OperationalError, InterfaceError)
+
+# Délai sans scan après lequel les étudiants vus d'une session sont oubliés (secondes)
+DUREE_INACTIVITE_VUS = 30 * 60
+
+
+class IngestionPresences:
+    """ File d'attente des scans acceptés, vidée par un thread d'arrière-plan. """
+
+    def __init__(self, asynchrone=True, intervalle_ms=200, taille_lot=200):
+        self.asynchrone = asynchrone
+        self.intervalle = intervalle_ms / 1000
+        self.taille_lot = taille_lot
+
+        self._verrou = threading.Lock()
+        self._verrou_ecriture = threading.Lock()
+        self._reveil = threading.Event()
+        self._file = []
+        self._vus = {}
+        self._activite = {}
+        self._purge = time.monotonic()
+        self._thread = None
+        self._pid = None
+
+    # --- API publique ---
+
+    def soumettre(self, session_id, etudiant_id, jeton):
+        """
+        Met en file la présence d'un étudiant.
+        Retourne False si sa présence à cette session est déjà connue.
+        """
+        return self._ajouter(self._etudiants_vus(session_id), session_id, etudiant_id, jeton)
+
+    async def asoumettre(self, session_id, etudiant_id, jeton):
+        """ Variante asynchrone de soumettre, pour les vues servies en ASGI. """
+        if not self.asynchrone:
+            # Écriture immédiate demandée : bulk_create reste synchrone.
+            return await sync_to_async(self.soumettre)(session_id, etudiant_id, jeton)
+
+        vus = self._vus.get(session_id)
+        if vus is None:
+            existants = {etudiant async for etudiant in self._requete_vus(session_id)}
+            with self._verrou:
+                vus = self._vus.setdefault(session_id, existants)
+        return self._ajouter(vus, session_id, etudiant_id, jeton)
+
+    def _ajouter(self, vus, session_id, etudiant_id, jeton):
+        with self._verrou:
+            self._activite[session_id] = time.monotonic()
+            if etudiant_id in vus:
+                return False
+            vus.add(etudiant_id)
+            self._file.append((session_id, etudiant_id, jeton))
+            lot_plein = len(self._file) >= self.taille_lot
+
+        if not self.asynchrone:
+            self.vider()
+        else:
+            self._demarrer()
+            if lot_plein:
+                self._reveil.set()
+        return True
+
+    def vider(self):
+        """ Écrit immédiatement tous les scans en attente ; retourne le nombre de présences traitées. """
+        with self._verrou_ecriture:
+            with self._verrou:
+                lot, self._file = self._file, []
+            self._purger_vus()
+            if not lot:
+                return 0
+            try:
+                self._ecrire(lot)
+            except ERREURS_CONNEXION:
+                self._remettre_en_file(lot)
+                return 0
+            except Exception:
+                logger.warning("Lot de %d présences refusé, écriture ligne par ligne.", len(lot), exc_info=True)
+                lot = self._ecrire_par_ligne(lot)
+            signaler_presences({session_id for session_id, _, _ in lot})
+            return len(lot)
+
+    def _ecrire(self, lot):
+        with transaction.atomic():
+            # Un autre processus qui écrit des présences de ces sessions attend la
+            # fin de la transaction : ses lignes sont ensuite vues par _sans_doublons.
+            list(
+                SessionCours.objects.select_for_update().filter(id__in={session_id for session_id, _, _ in lot})
+                .order_by('id').values_list('id', flat=True)
+            )
+            nouvelles = self._sans_doublons(lot)
+            Presence.objects.bulk_create(
+                [
+                    Presence(session_id=session_id, etudiant_id=etudiant_id, qr_empreinte=empreinte_qr(jeton))
+                    for session_id, etudiant_id, jeton in nouvelles
+                ],
+                ignore_conflicts=True,
+            )
+            compter_presences([(session_id, etudiant_id) for session_id, etudiant_id, _ in nouvelles])
+
+    def _ecrire_par_ligne(self, lot):
+        """ Écrit les lignes une à une et écarte celles que la base refuse ; retourne les lignes écrites. """
+        ecrites = []
+        for position, ligne in enumerate(lot):
+            try:
+                self._ecrire([ligne])
+            except ERREURS_CONNEXION:
+                self._remettre_en_file(lot[position:])
+                break
+            except Exception:
+                session_id, etudiant_id, _ = ligne
+                logger.exception("Présence de l'étudiant %s à la session %s écartée.", etudiant_id, session_id)
+                # Un nouveau scan pourra être tenté
+                with self._verrou:
+                    self._vus.get(session_id, set()).discard(etudiant_id)
+            else:
+                ecrites.append(ligne)
+        return ecrites
+
+    def _remettre_en_file(self, lot):
+        logger.exception("Base injoignable, %d présences gardées pour le prochain cycle.", len(lot))
+        with self._verrou:
+            self._file[:0] = lot
+
+    def _purger_vus(self):
+        """ Oublie les étudiants vus des sessions sans scan depuis DUREE_INACTIVITE_VUS. """
+        maintenant = time.monotonic()
+        if maintenant - self._purge < DUREE_INACTIVITE_VUS / 10:
+            return
+        self._purge = maintenant
+        with self._verrou:
+            en_file = {session_id for session_id, _, _ in self._file}
+            for session_id, activite in list(self._activite.items()):
+                if maintenant - activite > DUREE_INACTIVITE_VUS and session_id not in en_file:
+                    del self._activite[session_id]
+                    self._vus.pop(session_id, None)
+
+    def oublier_session(self, session_id):
+        """ Libère l'ensemble des étudiants vus d'une session terminée. """
+        self.vider()
+        with self._verrou:
+            self._vus.pop(session_id, None)
+            self._activite.pop(session_id, None)
+
+    # --- Interne ---
+
+    def _etudiants_vus(self, session_id):
+        vus = self._vus.get(session_id)
+        if vus is not None:
+            return vus
+        existants = set(self._requete_vus(session_id))
+        with self._verrou:
+            # Un autre thread a pu initialiser l'ensemble entre-temps.
+            return self._vus.setdefault(session_id, existants)
+
+    @staticmethod
+    def _sans_doublons(lot):
+        """
+        Écarte les présences déjà en base (écrites par un autre processus) :
+        seules les présences réellement insérées sont comptées dans les résumés.
+        Lu sous le verrou des sessions du lot (voir l'en-tête du module).
+        """
+        existantes = set(
+            Presence.objects.filter(
+                session_id__in={session_id for session_id, _, _ in lot},
+                etudiant_id__in={etudiant_id for _, etudiant_id, _ in lot},
+            ).values_list('session_id', 'etudiant_id')
+        )
+        if not existantes:
+            return lot
+        return [ligne for ligne in lot if (ligne[0], ligne[1]) not in existantes]
+
+    @staticmethod
+    def _requete_vus(session_id):
+        return Presence.objects.filter(session_id=session_id).values_list('etudiant_id', flat=True)
+
+    def _demarrer(self):
+        # Après un fork (workers gunicorn), le thread du parent n'existe plus.
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._verrou:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._boucle, name='ingestion-presences', daemon=True)
+            self._thread.start()
+
+    def _boucle(self):
+        while True:
+            self._reveil.wait(self.intervalle)
+            self._reveil.clear()
+            try:
+                self.vider()
+            except Exception:
+                logger.exception("Échec du cycle d'ingestion des présences.")
+            # Le thread ne finit jamais de requête : la connexion est rendue au pool
+            # à chaque cycle (et une connexion cassée est remplacée au suivant)
+            connection.close()
+
+
+_ingestion = None
+_verrou_instance = threading.Lock()
+
+
+def get_ingestion():
+    """ Retourne l'instance d'ingestion du processus, configurée par PRESENCE_INGESTION. """
+    global _ingestion
+    if _ingestion is None:
+        with _verrou_instance:
+            if _ingestion is None:
+                reglages = {**REGLAGES_PAR_DEFAUT, **getattr(settings, 'PRESENCE_INGESTION', {})}
+                _ingestion = IngestionPresences(
+                    asynchrone=reglages['ASYNC'],
+                    intervalle_ms=reglages['INTERVALLE_MS'],
+                    taille_lot=reglages['TAILLE_LOT'],
+                )
+                atexit.register(_ingestion.vider)
+    return _ingestion
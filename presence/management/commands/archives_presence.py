@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from presence.archives import ErreurArchive, exporter_annee, chemin_archive, annees_archivees, get_archive
+
+
+class Command(BaseCommand):
+    help = ("Archives froides des années universitaires closes : export colonnaire compressé des séances "
+            "et présences d'une année puis suppression en base, et lecture du taux de présence d'un "
+            "étudiant dans une année archivée (voir presence/archives.py).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['exporter', 'taux', 'lister'])
+        parser.add_argument('annee', type=int, nargs='?',
+                            help="Année universitaire, par son année de début (2024 pour 2024-2025)")
+        parser.add_argument('--etudiant', type=int, nargs='+', help="taux : étudiants (ID)")
+        parser.add_argument('--garder', action='store_true',
+                            help="exporter : garde les séances et présences en base après l'export")
+
+    def handle(self, *args, **options):
+        if options['action'] == 'lister':
+            for annee in annees_archivees():
+                self.stdout.write(f"  {annee}-{annee + 1}  {chemin_archive(annee)}")
+            return
+        annee = options['annee']
+        if annee is None:
+            raise CommandError("Indiquer l'année universitaire.")
+
+        try:
+            if options['action'] == 'exporter':
+                debut = time.perf_counter()
+                nb_seances, nb_presences = exporter_annee(annee, supprimer=not options['garder'])
+                self.stdout.write(self.style.SUCCESS(
+                    f"{nb_seances} séances et {nb_presences} présences exportées dans {chemin_archive(annee)} "
+                    f"en {time.perf_counter() - debut:.1f} s"
+                    + (" (conservées en base)." if options['garder'] else " puis supprimées de la base.")
+                ))
+            else:
+                if not options['etudiant']:
+                    raise CommandError("Indiquer --etudiant.")
+                archive = get_archive(annee)
+                for etudiant_id in options['etudiant']:
+                    taux = archive.taux_presence(etudiant_id)
+                    self.stdout.write(
+                        f"  étudiant {etudiant_id} : {taux['presences']}/{taux['seances']} séances "
+                        f"({taux['taux']:.1%}) en {annee}-{annee + 1}"
+                    )
+        except ErreurArchive as erreur:
+            raise CommandError(str(erreur))
@@ -0,0 +1,85 @@
+import datetime
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from presence.rendu_pdf import MOTEURS, rendre_pdf, CONTEXTE_VIDE
+
+
+class Command(BaseCommand):
+    help = ("Compare les moteurs de rendu des feuilles de présence (xhtml2pdf, reportlab) "
+            "sur des listes d'étudiants fictives de différentes tailles. Aucune donnée n'est écrite en base.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tailles', type=int, nargs='+', default=[50, 300, 1000],
+                            help="Nombres d'inscrits à tester (défaut : 50 300 1000)")
+        parser.add_argument('--repetitions', type=int, default=3, help="Rendus par taille et par moteur (défaut : 3)")
+        parser.add_argument('--moteurs', nargs='+', choices=sorted(MOTEURS), default=sorted(MOTEURS))
+        parser.add_argument('--sortie', help="Écrit les résultats au format JSON dans ce fichier")
+
+    def handle(self, *args, **options):
+        # Premier rendu à vide : chargement des polices hors mesure
+        for moteur in options['moteurs']:
+            rendre_pdf(CONTEXTE_VIDE, moteur)
+
+        resultats = []
+        for taille in options['tailles']:
+            contexte = contexte_fictif(taille)
+            for moteur in options['moteurs']:
+                durees = []
+                for _ in range(options['repetitions']):
+                    debut = time.perf_counter()
+                    contenu = rendre_pdf(contexte, moteur)
+                    durees.append((time.perf_counter() - debut) * 1000)
+                resultats.append({
+                    'inscrits': taille,
+                    'moteur': moteur,
+                    'mediane_ms': round(statistics.median(durees), 1),
+                    'min_ms': round(min(durees), 1),
+                    'taille_ko': round(len(contenu) / 1024, 1),
+                })
+                self.stdout.write(
+                    f"  {taille:>6} inscrits  {moteur:<10} {resultats[-1]['mediane_ms']:>10} ms "
+                    f"(min {resultats[-1]['min_ms']} ms)  {resultats[-1]['taille_ko']} Ko"
+                )
+
+        self._afficher_gains(resultats)
+        if options['sortie']:
+            with open(options['sortie'], 'w', encoding='utf-8') as fichier:
+                json.dump(resultats, fichier, indent=2)
+
+    def _afficher_gains(self, resultats):
+        medianes = {(r['inscrits'], r['moteur']): r['mediane_ms'] for r in resultats}
+        for taille in sorted({r['inscrits'] for r in resultats}):
+            html, direct = medianes.get((taille, 'xhtml2pdf')), medianes.get((taille, 'reportlab'))
+            if html and direct:
+                self.stdout.write(self.style.SUCCESS(f"{taille} inscrits : reportlab {html / direct:.1f}x plus rapide."))
+
+
+def contexte_fictif(nb_inscrits):
+    """ Contexte de feuille de présence pour une liste fictive (un étudiant sur cinq absent). """
+    maintenant = timezone.now()
+    liste_etudiants = [
+        {
+            'nom': f"Nom{i:04d}",
+            'prenom': f"prénom {i}",
+            'statut': 'ABSENT' if i % 5 == 0 else 'PRÉSENT',
+            'color': '#dc3545' if i % 5 == 0 else '#198754',
+        }
+        for i in range(nb_inscrits)
+    ]
+    return {
+        'session': {
+            'id': 0,
+            'cours': {'nom': 'Cours de démonstration', 'code': 'BENCH'},
+            'date_debut': maintenant - datetime.timedelta(hours=2),
+            'date_fin': maintenant,
+        },
+        'liste_etudiants': liste_etudiants,
+        'total_inscrits': nb_inscrits,
+        'total_presents': sum(1 for etudiant in liste_etudiants if etudiant['statut'] == 'PRÉSENT'),
+        'enseignant': {'id': {'nom': 'Dupont', 'prenom': 'Claire'}},
+    }
@@ -0,0 +1,193 @@
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from rest_framework_simplejwt.tokens import AccessToken
+
+from comptes.models import Utilisateur, Departement, Administrateur, Enseignant, Etudiant
+from presence.ingestion import get_ingestion
+from presence.models import Cours, Presence
+from presence_projet.connexions import statistiques_pool
+from presence.utils import jeton_courant, jeton_session, statistiques_cache_jetons
+from presence.views import demarrer_session
+
+
+class Command(BaseCommand):
+    help = ("Simule l'afflux de scans d'un début de cours : N étudiants inscrits "
+            "envoient simultanément leur scan à /api/valider-scan/.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--etudiants', type=int, default=300, help="Nombre d'étudiants inscrits (défaut : 300)")
+        parser.add_argument('--concurrence', type=int, default=50, help="Requêtes simultanées (défaut : 50)")
+        parser.add_argument('--url', help="URL d'un serveur lancé (ex: http://localhost:8000). "
+                                          "Par défaut, les requêtes sont traitées dans ce processus.")
+        parser.add_argument('--sortie', help="Écrit les résultats au format JSON dans ce fichier")
+        parser.add_argument('--garder', action='store_true', help="Ne supprime pas les données générées")
+
+    def handle(self, *args, **options):
+        prefixe = f"bench-{int(time.time())}"
+        nb_etudiants = options['etudiants']
+
+        self.stdout.write(f"Création de {nb_etudiants} étudiants ({prefixe})...")
+        cours, etudiants = self._peupler(prefixe, nb_etudiants)
+        try:
+            session, jeton_qr = self._lancer_session(cours)
+            jetons_acces = [str(AccessToken.for_user(etudiant.id)) for etudiant in etudiants]
+
+            self.stdout.write(f"Envoi de {nb_etudiants} scans ({options['concurrence']} en parallèle)...")
+            resultats, duree = self._tempete(jeton_qr, jetons_acces, options['concurrence'], options['url'])
+            get_ingestion().vider()
+            enregistrees = Presence.objects.filter(session=session).count()
+
+            rapport = self._rapport(resultats, duree, enregistrees, options['url'] is None)
+            self._afficher(rapport)
+            if options['sortie']:
+                with open(options['sortie'], 'w', encoding='utf-8') as fichier:
+                    json.dump(rapport, fichier, indent=2)
+        finally:
+            if not options['garder']:
+                self._nettoyer(prefixe, cours)
+
+    # --- Préparation ---
+
+    def _peupler(self, prefixe, nb_etudiants):
+        departement, _ = Departement.objects.get_or_create(code='BENCH', defaults={'nom': 'Benchmark'})
+        # Un seul hachage pour tous les comptes : le coût de PBKDF2 n'est pas mesuré ici.
+        mot_de_passe = make_password(prefixe)
+
+        def utilisateur(nom, role):
+            email = f"{nom}@{prefixe}.local"
+            return Utilisateur(username=email, email=email, password=mot_de_passe,
+                               nom=nom, prenom=prefixe, role=role)
+
+        compte_admin = utilisateur('admin', 'admin')
+        compte_admin.save()
+        compte_enseignant = utilisateur('enseignant', 'enseignant')
+        compte_enseignant.save()
+        admin = Administrateur.objects.create(id=compte_admin)
+        enseignant = Enseignant.objects.create(id=compte_enseignant, departement=departement)
+        cours = Cours.objects.create(nom=f"Cours {prefixe}", code=prefixe[-20:], semestre_cible='S1',
+                                     enseignant=enseignant, cree_par=admin)
+
+        utilisateurs = Utilisateur.objects.bulk_create(
+            [utilisateur(f"etudiant{i}", 'etudiant') for i in range(nb_etudiants)]
+        )
+        if utilisateurs and utilisateurs[0].pk is None:
+            # Backends sans RETURNING : on relit les identifiants.
+            utilisateurs = list(Utilisateur.objects.filter(email__endswith=f"@{prefixe}.local", role='etudiant'))
+        etudiants = Etudiant.objects.bulk_create([Etudiant(id=u) for u in utilisateurs])
+        Cours.etudiants.through.objects.bulk_create(
+            [Cours.etudiants.through(cours_id=cours.id, etudiant_id=u.pk) for u in utilisateurs]
+        )
+        return cours, etudiants
+
+    def _lancer_session(self, cours):
+        # Mêmes étapes que la vue lancer_session
+        session = demarrer_session(cours, cours.enseignant)
+        return session, jeton_courant(session.id, jeton_session(session))
+
+    # --- Tempête de scans ---
+
+    def _tempete(self, jeton_qr, jetons_acces, concurrence, url):
+        local = threading.local()
+
+        def client():
+            if not hasattr(local, 'client'):
+                if url:
+                    import requests
+                    local.client = requests.Session()
+                else:
+                    local.client = Client(SERVER_NAME='localhost')
+            return local.client
+
+        def scanner(jeton_acces):
+            requetes = []
+
+            def compter(execute, sql, params, many, context):
+                requetes.append(sql)
+                return execute(sql, params, many, context)
+
+            debut = time.perf_counter()
+            try:
+                if url:
+                    reponse = client().post(f"{url.rstrip('/')}/api/valider-scan/", json={'jeton': jeton_qr},
+                                            headers={'Authorization': f"Bearer {jeton_acces}"}, timeout=60)
+                    statut, succes = reponse.status_code, reponse.ok and reponse.json().get('success')
+                else:
+                    try:
+                        with connection.execute_wrapper(compter):
+                            reponse = client().post('/api/valider-scan/', {'jeton': jeton_qr},
+                                                    content_type='application/json',
+                                                    HTTP_AUTHORIZATION=f"Bearer {jeton_acces}")
+                    finally:
+                        # Comme une requête servie avec CONN_MAX_AGE = 0
+                        connection.close()
+                    statut, succes = reponse.status_code, reponse.status_code == 200 and reponse.json().get('success')
+            except Exception as erreur:
+                statut, succes = repr(erreur), False
+            return {
+                'latence_ms': (time.perf_counter() - debut) * 1000,
+                'statut': statut,
+                'succes': bool(succes),
+                'requetes_sql': len(requetes),
+            }
+
+        debut = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrence) as executeur:
+            resultats = list(executeur.map(scanner, jetons_acces))
+        duree = time.perf_counter() - debut
+        return resultats, duree
+
+    # --- Rapport ---
+
+    def _rapport(self, resultats, duree, enregistrees, requetes_mesurees):
+        latences = sorted(r['latence_ms'] for r in resultats)
+        erreurs = [r for r in resultats if not r['succes']]
+        rapport = {
+            'scans': len(resultats),
+            'scans_acceptes': len(resultats) - len(erreurs),
+            'duree_s': round(duree, 3),
+            'debit_scans_s': round(len(resultats) / duree, 1) if duree else None,
+            'latence_p50_ms': round(centile(latences, 50), 2),
+            'latence_p95_ms': round(centile(latences, 95), 2),
+            'latence_p99_ms': round(centile(latences, 99), 2),
+            'latence_max_ms': round(latences[-1], 2),
+            'taux_erreur': round(len(erreurs) / len(resultats), 4),
+            'presences_enregistrees': enregistrees,
+            'requetes_sql_par_scan': (
+                round(statistics.mean(r['requetes_sql'] for r in resultats), 2) if requetes_mesurees else None
+            ),
+        }
+        statuts = {}
+        for r in erreurs:
+            statuts[str(r['statut'])] = statuts.get(str(r['statut']), 0) + 1
+        rapport['erreurs_par_statut'] = statuts
+        if requetes_mesurees:
+            rapport['cache_jetons'] = statistiques_cache_jetons()
+            rapport['pool_connexions'] = statistiques_pool()
+        return rapport
+
+    def _afficher(self, rapport):
+        self.stdout.write("")
+        for cle, valeur in rapport.items():
+            self.stdout.write(f"  {cle:<24} {valeur if valeur is not None else 'n/d'}")
+        style = self.style.SUCCESS if rapport['taux_erreur'] == 0 else self.style.WARNING
+        self.stdout.write(style(f"{rapport['scans_acceptes']}/{rapport['scans']} scans acceptés."))
+
+    def _nettoyer(self, prefixe, cours):
+        # Cours en premier : ses sessions et présences partent en cascade (RESTRICT sur les comptes).
+        cours.delete()
+        Utilisateur.objects.filter(email__endswith=f"@{prefixe}.local").delete()
+        self.stdout.write("Données de benchmark supprimées.")
+
+
+def centile(valeurs_triees, rang):
+    """ Centile par la méthode du rang le plus proche. """
+    index = round(rang / 100 * (len(valeurs_triees) - 1))
+    return valeurs_triees[min(index, len(valeurs_triees) - 1)]
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from presence.partitions import (
+    PERIODES, ErreurPartitions, reglages, debut_periode, est_partitionnee, partitionnement_possible,
+    partitions, convertir, basculer, archiver,
+)
+from .rapports_pdf import date_locale
+
+
+class Command(BaseCommand):
+    help = ("Partitionnement de la table presence sous PostgreSQL : liste des partitions, conversion "
+            "d'une table ordinaire, ouverture de la partition de la période courante et archivage "
+            "des partitions anciennes (voir presence/partitions.py).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', nargs='?', default='lister',
+                            choices=['lister', 'convertir', 'basculer', 'archiver'])
+        parser.add_argument('--periode', choices=PERIODES, help="Découpage : semestre ou mois (défaut : réglage PERIODE)")
+        parser.add_argument('--avant', type=date_locale,
+                            help="archiver : partitions dont toutes les sessions ont commencé avant cette date "
+                                 "(AAAA-MM-JJ ; défaut : début du semestre courant)")
+        parser.add_argument('--supprimer', action='store_true',
+                            help="archiver : supprime les partitions, et leurs sessions, au lieu de les déplacer "
+                                 "dans le schéma archive")
+
+    def handle(self, *args, **options):
+        if not partitionnement_possible():
+            raise CommandError("Le partitionnement de presence demande PostgreSQL 12 ou plus.")
+        periode = options['periode'] or reglages()['PERIODE']
+
+        try:
+            if options['action'] == 'convertir':
+                creees = convertir(periode)
+                self.stdout.write(self.style.SUCCESS(f"presence partitionnée : {', '.join(creees)}."))
+            elif options['action'] == 'basculer':
+                nouvelle = basculer(periode)
+                self.stdout.write(self.style.SUCCESS(f"Partition {nouvelle} ouverte.") if nouvelle
+                                  else "La partition de la période courante est déjà ouverte.")
+            elif options['action'] == 'archiver':
+                avant = options['avant'] or debut_periode(timezone.now(), 'semestre')
+                archivees = archiver(avant, supprimer=options['supprimer'])
+                destination = 'supprimées' if options['supprimer'] else 'déplacées dans le schéma archive'
+                self.stdout.write(self.style.SUCCESS(f"{len(archivees)} partition(s) {destination}"
+                                                     + (f" : {', '.join(archivees)}." if archivees else ".")))
+        except ErreurPartitions as erreur:
+            raise CommandError(str(erreur))
+
+        if not est_partitionnee():
+            self.stdout.write("La table presence n'est pas partitionnée.")
+            return
+        for nom, bas, haut, lignes in partitions():
+            bornes = f"[{'MINVALUE' if bas is None else bas}, {'MAXVALUE' if haut is None else haut})"
+            self.stdout.write(f"  {nom:<24} sessions {bornes:<24} ~{lignes} présences")
@@ -0,0 +1,62 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from presence.rapports import sessions_a_exporter, rapports_en_lot, archive_zip
+from presence.rendu_pdf import MOTEURS
+
+
+def date_locale(valeur):
+    jour = parse_date(valeur)
+    if jour is None:
+        raise ValueError(valeur)
+    return timezone.make_aware(datetime.datetime.combine(jour, datetime.time.min))
+
+
+class Command(BaseCommand):
+    help = ("Rend les feuilles de présence PDF de toutes les sessions d'un ou plusieurs cours, "
+            "ou des cours d'une formation, dans un pool de processus, et les écrit dans une archive ZIP.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cours', type=int, nargs='+', help="Cours à exporter (ID)")
+        parser.add_argument('--formation', type=int, help="Exporte les cours suivis par cette formation (ID)")
+        parser.add_argument('--depuis', type=date_locale, help="Sessions commencées à partir de cette date (AAAA-MM-JJ)")
+        parser.add_argument('--jusqu-a', type=date_locale, help="Sessions commencées avant cette date (AAAA-MM-JJ)")
+        parser.add_argument('--processus', type=int, help="Taille du pool de rendu (défaut : nombre de cœurs)")
+        parser.add_argument('--moteur', choices=sorted(MOTEURS), help="Moteur de rendu (défaut : réglage MOTEUR)")
+        parser.add_argument('--sortie', required=True, help="Fichier ZIP à écrire")
+
+    def handle(self, *args, **options):
+        if not options['cours'] and options['formation'] is None:
+            raise CommandError("Indiquer --cours ou --formation.")
+
+        sessions = list(sessions_a_exporter(
+            cours_ids=options['cours'],
+            formation_id=options['formation'],
+            depuis=options['depuis'],
+            jusqu_a=options['jusqu_a'],
+        ))
+        self.stdout.write(f"{len(sessions)} feuilles de présence à exporter...")
+
+        debut = time.perf_counter()
+        nb_feuilles = 0
+
+        def compter(fichiers):
+            nonlocal nb_feuilles
+            for fichier in fichiers:
+                nb_feuilles += 1
+                yield fichier
+
+        feuilles = rapports_en_lot(sessions, processus=options['processus'], moteur=options['moteur'])
+        with open(options['sortie'], 'wb') as sortie:
+            for morceau in archive_zip(compter(feuilles)):
+                sortie.write(morceau)
+
+        style = self.style.SUCCESS if nb_feuilles == len(sessions) else self.style.WARNING
+        self.stdout.write(style(
+            f"{nb_feuilles}/{len(sessions)} feuilles écrites dans {options['sortie']} "
+            f"en {time.perf_counter() - debut:.1f} s."
+        ))
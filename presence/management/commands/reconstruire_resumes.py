@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from presence.resumes import reconstruire_resumes
+
+
+class Command(BaseCommand):
+    help = ("Recalcule les résumés de présence (par étudiant et par session) utilisés par "
+            "les statistiques, depuis les tables session_cours et presence.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cours', type=int, nargs='+', help="Limite la reconstruction à ces cours (ID)")
+
+    def handle(self, *args, **options):
+        nb_etudiants, nb_sessions = reconstruire_resumes(options['cours'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Résumés reconstruits : {nb_etudiants} (cours, étudiant), {nb_sessions} sessions."
+        ))
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remplir_resumes(apps, schema_editor):
+    """ Calcule les résumés des présences déjà enregistrées. """
+    SessionCours = apps.get_model('presence', 'SessionCours')
+    Presence = apps.get_model('presence', 'Presence')
+    ResumePresenceEtudiant = apps.get_model('presence', 'ResumePresenceEtudiant')
+    ResumePresenceSession = apps.get_model('presence', 'ResumePresenceSession')
+
+    ResumePresenceEtudiant.objects.bulk_create(
+        [
+            ResumePresenceEtudiant(cours_id=ligne['session__cours_id'], etudiant_id=ligne['etudiant_id'],
+                                   nb_presences=ligne['nombre'])
+            for ligne in Presence.objects.values('session__cours_id', 'etudiant_id').annotate(nombre=Count('id')).order_by()
+        ],
+        batch_size=1000,
+    )
+    ResumePresenceSession.objects.bulk_create(
+        [
+            ResumePresenceSession(session_id=ligne['id'], cours_id=ligne['cours_id'], nb_presences=ligne['nombre'])
+            for ligne in SessionCours.objects.values('id', 'cours_id').annotate(nombre=Count('presence')).order_by()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptes', '0003_formation_niveau_formation_type_formation'),
+        ('presence', '0002_alter_sessioncours_qr_expiration_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumePresenceSession',
+            fields=[
+                ('session', models.OneToOneField(db_column='session_id', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resume', serialize=False, to='presence.sessioncours')),
+                ('nb_presences', models.PositiveIntegerField(default=0)),
+                ('cours', models.ForeignKey(db_column='cours_id', on_delete=django.db.models.deletion.CASCADE, to='presence.cours')),
+            ],
+            options={
+                'db_table': 'resume_presence_session',
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumePresenceEtudiant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nb_presences', models.PositiveIntegerField(default=0)),
+                ('cours', models.ForeignKey(db_column='cours_id', on_delete=django.db.models.deletion.CASCADE, to='presence.cours')),
+                ('etudiant', models.ForeignKey(db_column='etudiant_id', on_delete=django.db.models.deletion.CASCADE, to='comptes.etudiant')),
+            ],
+            options={
+                'db_table': 'resume_presence_etudiant',
+                'unique_together': {('cours', 'etudiant')},
+            },
+        ),
+        migrations.RunPython(remplir_resumes, migrations.RunPython.noop),
+    ]
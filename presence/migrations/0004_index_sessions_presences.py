@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptes', '0004_index_formation'),
+        ('presence', '0003_resumes_presence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cours',
+            index=models.Index(fields=['semestre_cible'], name='cours_semestre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='presence',
+            index=models.Index(fields=['session', 'horodatage_scan'], name='presence_session_scan_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='presence',
+            index=models.Index(fields=['etudiant', '-horodatage_scan'], name='presence_etudiant_scan_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sessioncours',
+            index=models.Index(fields=['cours', 'date_debut'], name='session_cours_debut_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sessioncours',
+            index=models.Index(condition=models.Q(('actif', True)), fields=['cours'], name='session_cours_actives_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sessioncours',
+            index=models.Index(condition=models.Q(('actif', True)), fields=['enseignant'], name='session_ens_actives_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def partitionner_presences(apps, schema_editor):
+    """
+    Partitionne la table presence si PRESENCE_PARTITIONS['ACTIF'] (PostgreSQL
+    uniquement) ; le schéma vu par Django ne change pas. Une base existante
+    peut aussi être convertie plus tard : partitions_presence convertir.
+    """
+    from presence import partitions
+
+    alias = schema_editor.connection.alias
+    if partitions.reglages()['ACTIF'] and partitions.partitionnement_possible(alias) \
+            and not partitions.est_partitionnee(alias):
+        partitions.convertir(using=alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('presence', '0004_index_sessions_presences'),
+    ]
+
+    operations = [
+        migrations.RunPython(partitionner_presences, migrations.RunPython.noop),
+    ]
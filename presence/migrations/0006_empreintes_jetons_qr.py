@@ -0,0 +1,82 @@
+"""
+Jetons QR : leur empreinte (SHA-256 tronqué à 16 octets, presence.utils.empreinte_qr)
+remplace les jetons stockés en entier.
+
+Les colonnes qr_token et qr_token_utilise sont supprimées sans version de
+transition, aucun code ne les lisant plus :
+- qr_token (session) : un jeton JWT expire QR_CODE_EXPIRATION_MINUTES après
+  son émission, seul celui des sessions actives sert encore. Son empreinte
+  suffit à valider un scan (registry.SessionActive.jeton_correspond) ; le
+  jeton affiché est réencodé depuis qr_expiration (utils.jeton_session) et,
+  si ce n'est plus possible (SECRET_KEY ou contenu du JWT changés),
+  session_detail et rafraichir_qr en émettent un nouveau.
+- qr_token_utilise (présence) : trace d'audit ; l'empreinte permet toujours
+  de vérifier si un jeton donné a été scanné.
+Le retour arrière recrée les colonnes, vides : les jetons ne sont pas
+recalculables depuis leur empreinte.
+"""
+import hashlib
+
+from django.db import migrations, models
+
+TAILLE_EMPREINTE_QR = 16
+
+
+def empreinte(jeton):
+    # Même calcul que presence.utils.empreinte_qr
+    return hashlib.sha256(jeton.encode('utf-8')).digest()[:TAILLE_EMPREINTE_QR]
+
+
+def calculer_empreintes(apps, schema_editor):
+    """ Remplace les jetons stockés par leur empreinte (sessions, présences). """
+    SessionCours = apps.get_model('presence', 'SessionCours')
+    Presence = apps.get_model('presence', 'Presence')
+
+    for session_id, jeton in SessionCours.objects.exclude(qr_token=None).values_list('id', 'qr_token').iterator():
+        SessionCours.objects.filter(id=session_id).update(qr_empreinte=empreinte(jeton))
+
+    if schema_editor.connection.vendor == 'postgresql':
+        # Calculé par PostgreSQL (sha256, version 11 ou plus), sans relire les jetons
+        schema_editor.execute(
+            "UPDATE presence SET qr_empreinte = substring(sha256(convert_to(qr_token_utilise, 'UTF8')) FROM 1 FOR %s)",
+            [TAILLE_EMPREINTE_QR],
+        )
+        return
+    # Tous les étudiants d'une séance scannent les mêmes jetons : un UPDATE par jeton distinct
+    jetons = Presence.objects.values_list('qr_token_utilise', flat=True).distinct().order_by()
+    for jeton in jetons.iterator():
+        Presence.objects.filter(qr_token_utilise=jeton).update(qr_empreinte=empreinte(jeton))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('presence', '0005_partitions_presence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessioncours',
+            name='qr_empreinte',
+            field=models.BinaryField(blank=True, max_length=16, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='presence',
+            name='qr_empreinte',
+            field=models.BinaryField(max_length=16, null=True),
+        ),
+        migrations.RunPython(calculer_empreintes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='presence',
+            name='qr_empreinte',
+            field=models.BinaryField(max_length=16),
+        ),
+        migrations.RemoveField(
+            model_name='sessioncours',
+            name='qr_token',
+        ),
+        migrations.RemoveField(
+            model_name='presence',
+            name='qr_token_utilise',
+        ),
+    ]
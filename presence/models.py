@@ -31,6 +31,9 @@ class Cours(models.Model):
 
     class Meta:
         db_table = 'cours'  # Correspond à votre SQL
+        indexes = [
+            models.Index(fields=['semestre_cible'], name='cours_semestre_idx'),
+        ]
 
     def __str__(self):
         return self.nom
@@ -44,7 +47,8 @@ class SessionCours(models.Model):
     date_fin = models.DateTimeField(blank=True, null=True)
 
     # --- MODIFIEZ CES DEUX LIGNES ---
-    qr_token = models.CharField(max_length=512, unique=True, null=True, blank=True)
+    # Empreinte du jeton QR courant (presence.utils.empreinte_qr) ; le jeton est recalculé à l'affichage
+    qr_empreinte = models.BinaryField(max_length=16, unique=True, null=True, blank=True)
     qr_expiration = models.DateTimeField(null=True, blank=True)
     # --- FIN DE LA MODIFICATION ---
 
@@ -52,6 +56,13 @@ class SessionCours(models.Model):
 
     class Meta:
         db_table = 'session_cours'
+        indexes = [
+            # Séances d'un cours par date (statistiques, historique, analyses)
+            models.Index(fields=['cours', 'date_debut'], name='session_cours_debut_idx'),
+            # Sessions en cours : index partiels, limités aux quelques lignes actives
+            models.Index(fields=['cours'], condition=models.Q(actif=True), name='session_cours_actives_idx'),
+            models.Index(fields=['enseignant'], condition=models.Q(actif=True), name='session_ens_actives_idx'),
+        ]
 
     def __str__(self):
         return f"Session {self.cours.nom} du {self.date_debut.strftime('%d/%m')}"
@@ -62,9 +73,36 @@ class Presence(models.Model):
     etudiant = models.ForeignKey(Etudiant, on_delete=models.CASCADE, db_column='etudiant_id')
     session = models.ForeignKey(SessionCours, on_delete=models.CASCADE, db_column='session_id')
     horodatage_scan = models.DateTimeField(auto_now_add=True)
-    qr_token_utilise = models.CharField(max_length=512)
+    # Empreinte du jeton scanné (presence.utils.empreinte_qr), pour l'audit des scans
+    qr_empreinte = models.BinaryField(max_length=16)
     valide = models.BooleanField(default=True)
 
     class Meta:
         db_table = 'presence'
-        unique_together = ('etudiant', 'session')  # 'unique_etudiant_session'
\ No newline at end of file
+        unique_together = ('etudiant', 'session')  # 'unique_etudiant_session'
+        # L'index unique (etudiant, session) sert aussi les présences d'un étudiant par cours.
+        indexes = [
+            models.Index(fields=['session', 'horodatage_scan'], name='presence_session_scan_idx'),
+            models.Index(fields=['etudiant', '-horodatage_scan'], name='presence_etudiant_scan_idx'),
+        ]
+
+
+# 9. Résumés de présence (tenus à jour par presence.resumes)
+class ResumePresenceEtudiant(models.Model):
+    cours = models.ForeignKey(Cours, on_delete=models.CASCADE, db_column='cours_id')
+    etudiant = models.ForeignKey(Etudiant, on_delete=models.CASCADE, db_column='etudiant_id')
+    nb_presences = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'resume_presence_etudiant'
+        unique_together = ('cours', 'etudiant')
+
+
+class ResumePresenceSession(models.Model):
+    session = models.OneToOneField(SessionCours, on_delete=models.CASCADE, primary_key=True,
+                                   db_column='session_id', related_name='resume')
+    cours = models.ForeignKey(Cours, on_delete=models.CASCADE, db_column='cours_id')
+    nb_presences = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'resume_presence_session'
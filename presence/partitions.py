@@ -0,0 +1,376 @@
+"""
+Partitionnement de la table presence sous PostgreSQL (12 ou plus).
+
+La table presence devient une table partitionnée par intervalle
+(PARTITION BY RANGE) sur session_id, avec une partition par période
+universitaire : un semestre (septembre → janvier, février → août) ou un mois.
+Les identifiants de session croissent avec leur date de début : la borne
+d'une période est l'identifiant de la première session commencée dans
+cette période, et la dernière partition est ouverte (jusqu'à MAXVALUE).
+
+La clé de partition est session_id plutôt que horodatage_scan : la
+contrainte unique (etudiant, session) et la clé primaire doivent contenir
+la clé de partition. Avec session_id, l'unicité (etudiant, session) reste
+garantie par la base (index unique local à chaque partition, donc petit)
+et l'ON CONFLICT DO NOTHING de l'ingestion fonctionne sans changement.
+La clé primaire devient (id, session_id) ; le modèle Presence garde id
+comme clé primaire et toutes les requêtes de l'ORM passent par la table
+parente : PostgreSQL ne lit que les partitions concernées dès que la
+requête filtre sur la session (présences d'une séance, scans, rapports).
+
+Les migrations restent applicables : les index, contraintes et colonnes
+ajoutés à presence sont propagés aux partitions par PostgreSQL.
+
+Étapes (commande partitions_presence) :
+    convertir : transforme une table presence ordinaire en table
+                partitionnée (copie des lignes sous verrou exclusif, durée
+                proportionnelle à la taille de la table) ; aussi appliquée
+                par la migration 0005 si le partitionnement est activé.
+    basculer  : ouvre la partition de la période courante (à lancer au
+                début de chaque période, par exemple chaque nuit par cron).
+    archiver  : détache les partitions dont toutes les sessions ont commencé
+                avant une date et les déplace dans le schéma archive (ou les
+                supprime). Les présences archivées restent comptées par les
+                résumés de présence (presence.resumes) : reconstruire_resumes
+                les relit dans le schéma archive (presences_archivees). Avec
+                supprimer, les sessions des partitions supprimées le sont
+                aussi, comme après un export (presence.archives), et les
+                résumés de leurs cours sont recalculés.
+
+Réglage PRESENCE_PARTITIONS (settings) :
+    ACTIF   : partitionne presence à la migration (PostgreSQL uniquement)
+    PERIODE : 'semestre' (défaut) ou 'mois'
+"""
+import datetime
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.utils import timezone
+
+REGLAGES_PAR_DEFAUT = {
+    'ACTIF': False,
+    'PERIODE': 'semestre',
+}
+
+PERIODES = ('semestre', 'mois')
+
+# Mois de début des semestres : septembre (S1) et février (S2)
+MOIS_DEBUT_SEMESTRES = (9, 2)
+
+SCHEMA_ARCHIVE = 'archive'
+
+VERSION_MINIMALE = 120000
+
+
+class ErreurPartitions(Exception):
+    """ Opération de partitionnement impossible dans l'état actuel de la base. """
+
+
+def reglages():
+    return {**REGLAGES_PAR_DEFAUT, **getattr(settings, 'PRESENCE_PARTITIONS', {})}
+
+
+# --- Périodes ---
+
+def debut_periode(instant, periode):
+    """ Début (heure locale) de la période contenant instant. """
+    local = timezone.localtime(instant)
+    annee, mois = local.year, local.month
+    if periode == 'semestre':
+        s1, s2 = MOIS_DEBUT_SEMESTRES
+        if mois >= s1:
+            mois = s1
+        elif mois >= s2:
+            mois = s2
+        else:
+            annee, mois = annee - 1, s1
+    return timezone.make_aware(datetime.datetime(annee, mois, 1))
+
+
+def periode_suivante(debut, periode):
+    local = timezone.localtime(debut)
+    if periode == 'semestre':
+        s1, s2 = MOIS_DEBUT_SEMESTRES
+        annee, mois = (local.year + 1, s2) if local.month == s1 else (local.year, s1)
+    else:
+        annee, mois = (local.year + 1, 1) if local.month == 12 else (local.year, local.month + 1)
+    return timezone.make_aware(datetime.datetime(annee, mois, 1))
+
+
+def nom_partition(debut, periode):
+    """ presence_2025_s1 (semestre, année universitaire 2025-2026) ou presence_2025_09 (mois). """
+    local = timezone.localtime(debut)
+    if periode == 'semestre':
+        s1, _ = MOIS_DEBUT_SEMESTRES
+        if local.month == s1:
+            return f'presence_{local.year}_s1'
+        return f'presence_{local.year - 1}_s2'
+    return f'presence_{local:%Y_%m}'
+
+
+# --- État de la base ---
+
+def partitionnement_possible(using=DEFAULT_DB_ALIAS):
+    connexion = connections[using]
+    return connexion.vendor == 'postgresql' and connexion.pg_version >= VERSION_MINIMALE
+
+
+def est_partitionnee(using=DEFAULT_DB_ALIAS):
+    if not partitionnement_possible(using):
+        return False
+    with connections[using].cursor() as curseur:
+        curseur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('presence')")
+        ligne = curseur.fetchone()
+    return ligne is not None and ligne[0] == 'p'
+
+
+def _borne(valeur):
+    # "MINVALUE" / "MAXVALUE" → None, "'123'" → 123
+    return None if valeur.endswith('VALUE') else int(valeur.strip("'"))
+
+
+def _partitions(curseur):
+    curseur.execute(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'presence'::regclass"
+    )
+    partitions = []
+    for nom, expression in curseur.fetchall():
+        bas, haut = re.fullmatch(r'FOR VALUES FROM \((.+)\) TO \((.+)\)', expression).groups()
+        partitions.append((nom, _borne(bas), _borne(haut)))
+    return sorted(partitions, key=lambda partition: (partition[1] is not None, partition[1] or 0))
+
+
+def partitions(using=DEFAULT_DB_ALIAS):
+    """
+    Partitions de presence, dans l'ordre : (nom, borne basse, borne haute,
+    lignes estimées) ; borne None pour MINVALUE / MAXVALUE.
+    """
+    with connections[using].cursor() as curseur:
+        liste = _partitions(curseur)
+        curseur.execute(
+            "SELECT c.relname, c.reltuples FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'presence'::regclass"
+        )
+        lignes = dict(curseur.fetchall())
+    return [(nom, bas, haut, max(int(lignes[nom]), 0)) for nom, bas, haut in liste]
+
+
+def tables_archivees(using=DEFAULT_DB_ALIAS):
+    """ Noms des partitions déplacées dans le schéma archive par archiver. """
+    if not partitionnement_possible(using):
+        return []
+    with connections[using].cursor() as curseur:
+        curseur.execute(
+            r"SELECT tablename FROM pg_tables WHERE schemaname = %s AND tablename LIKE 'presence\_%%' "
+            "ORDER BY tablename",
+            [SCHEMA_ARCHIVE],
+        )
+        return [nom for nom, in curseur.fetchall()]
+
+
+def presences_archivees(cours_ids=None, using=DEFAULT_DB_ALIAS):
+    """
+    Présences des partitions archivées, comptées par (cours, étudiant) et par
+    session : deux Counter, vides sans archive. Les présences d'une session ou
+    d'un étudiant supprimés depuis l'archivage sont ignorées.
+    """
+    par_etudiant, par_session = Counter(), Counter()
+    tables = tables_archivees(using)
+    if not tables:
+        return par_etudiant, par_session
+
+    archive = ' UNION ALL '.join(f'SELECT session_id, etudiant_id FROM {SCHEMA_ARCHIVE}.{nom}' for nom in tables)
+    filtre, parametres = ('', []) if cours_ids is None else ('WHERE s.cours_id = ANY(%s)', [list(cours_ids)])
+    with connections[using].cursor() as curseur:
+        curseur.execute(
+            f'SELECT s.cours_id, a.etudiant_id, a.session_id, count(*) FROM ({archive}) a '
+            f'JOIN session_cours s ON s.id = a.session_id JOIN etudiant e ON e.id_id = a.etudiant_id {filtre} '
+            f'GROUP BY GROUPING SETS ((s.cours_id, a.etudiant_id), (a.session_id))',
+            parametres,
+        )
+        for cours_id, etudiant_id, session_id, nombre in curseur.fetchall():
+            if session_id is None:
+                par_etudiant[cours_id, etudiant_id] = nombre
+            else:
+                par_session[session_id] = nombre
+    return par_etudiant, par_session
+
+
+def _premiere_session(curseur, depuis):
+    """
+    Identifiant de la première session commencée depuis cette date ; à
+    défaut, un identifiant supérieur à toutes les sessions existantes.
+    """
+    curseur.execute('SELECT min(id) FROM session_cours WHERE date_debut >= %s', [depuis])
+    borne = curseur.fetchone()[0]
+    if borne is None:
+        curseur.execute('SELECT COALESCE(max(id), 0) + 1 FROM session_cours')
+        borne = curseur.fetchone()[0]
+    return borne
+
+
+def _creer_partition(curseur, nom, bas, haut):
+    curseur.execute(
+        f"CREATE TABLE {nom} PARTITION OF presence FOR VALUES "
+        f"FROM ({'MINVALUE' if bas is None else int(bas)}) TO ({'MAXVALUE' if haut is None else int(haut)})"
+    )
+
+
+# --- Conversion ---
+
+def convertir(periode=None, maintenant=None, using=DEFAULT_DB_ALIAS):
+    """
+    Transforme la table presence en table partitionnée, une partition par
+    période depuis la première session. Index et contraintes sont recréés
+    sous les mêmes noms (ceux des migrations). Renvoie les noms des
+    partitions créées.
+    """
+    periode = periode or reglages()['PERIODE']
+    maintenant = maintenant or timezone.now()
+    if not partitionnement_possible(using):
+        raise ErreurPartitions("Le partitionnement de presence demande PostgreSQL 12 ou plus.")
+    if est_partitionnee(using):
+        raise ErreurPartitions("La table presence est déjà partitionnée.")
+
+    with transaction.atomic(using=using), connections[using].cursor() as curseur:
+        curseur.execute('LOCK TABLE presence IN ACCESS EXCLUSIVE MODE')
+
+        # Périodes depuis la première session ; les périodes sans session n'ont pas de partition
+        curseur.execute('SELECT min(date_debut) FROM session_cours')
+        debuts = [debut_periode(curseur.fetchone()[0] or maintenant, periode)]
+        while (suivant := periode_suivante(debuts[-1], periode)) <= maintenant:
+            debuts.append(suivant)
+        bornes = [None] + [_premiere_session(curseur, debut) for debut in debuts[1:]] + [None]
+        tranches = [
+            (nom_partition(debut, periode), bas, haut)
+            for debut, bas, haut in zip(debuts, bornes, bornes[1:])
+            if bas is None or haut is None or bas < haut
+        ]
+
+        # Définitions à recréer sur la table partitionnée
+        curseur.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = 'presence'::regclass AND contype IN ('p', 'u', 'f', 'c') ORDER BY contype DESC"
+        )
+        contraintes = curseur.fetchall()
+        curseur.execute(
+            "SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = 'presence'::regclass "
+            "AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = indexrelid)"
+        )
+        index = [definition for definition, in curseur.fetchall()]
+
+        curseur.execute('ALTER TABLE presence RENAME TO presence_avant_partitions')
+        curseur.execute(
+            'CREATE TABLE presence (LIKE presence_avant_partitions INCLUDING DEFAULTS) PARTITION BY RANGE (session_id)'
+        )
+        # La colonne id perd son IDENTITY (ou son DEFAULT serial) : séquence recréée plus bas
+        curseur.execute('ALTER TABLE presence ALTER COLUMN id DROP DEFAULT')
+        for nom, bas, haut in tranches:
+            _creer_partition(curseur, nom, bas, haut)
+        curseur.execute('INSERT INTO presence SELECT * FROM presence_avant_partitions')
+        curseur.execute('DROP TABLE presence_avant_partitions')
+
+        curseur.execute('CREATE SEQUENCE presence_id_seq AS bigint OWNED BY presence.id')
+        curseur.execute("ALTER TABLE presence ALTER COLUMN id SET DEFAULT nextval('presence_id_seq')")
+        curseur.execute("SELECT setval('presence_id_seq', max(id)) FROM presence")
+
+        for nom, type_contrainte, definition in contraintes:
+            if type_contrainte == 'p':
+                definition = 'PRIMARY KEY (id, session_id)'
+            curseur.execute(f'ALTER TABLE presence ADD CONSTRAINT {nom} {definition}')
+        for definition in index:
+            curseur.execute(definition)
+        curseur.execute('ANALYZE presence')
+
+    return [nom for nom, _, _ in tranches]
+
+
+# --- Exploitation ---
+
+def basculer(periode=None, maintenant=None, using=DEFAULT_DB_ALIAS):
+    """
+    Ferme la partition ouverte et ouvre celle de la période courante.
+    Les présences déjà enregistrées pour des sessions de la nouvelle
+    période y sont déplacées. Renvoie le nom de la nouvelle partition, None
+    si elle est déjà ouverte.
+    """
+    periode = periode or reglages()['PERIODE']
+    debut = debut_periode(maintenant or timezone.now(), periode)
+    nouvelle = nom_partition(debut, periode)
+    if not est_partitionnee(using):
+        raise ErreurPartitions("La table presence n'est pas partitionnée.")
+
+    with transaction.atomic(using=using), connections[using].cursor() as curseur:
+        curseur.execute('LOCK TABLE presence IN ACCESS EXCLUSIVE MODE')
+        ouverte, bas, _ = _partitions(curseur)[-1]
+        if ouverte == nouvelle:
+            return None
+        borne = _premiere_session(curseur, debut)
+        if bas is not None and borne <= bas:
+            # Aucune session depuis l'ouverture de la partition : simple renommage
+            curseur.execute(f'ALTER TABLE {ouverte} RENAME TO {nouvelle}')
+            return nouvelle
+
+        curseur.execute(f'ALTER TABLE presence DETACH PARTITION {ouverte}')
+        _creer_partition(curseur, nouvelle, borne, None)
+        curseur.execute(f'INSERT INTO presence SELECT * FROM {ouverte} WHERE session_id >= %s', [borne])
+        curseur.execute(f'DELETE FROM {ouverte} WHERE session_id >= %s', [borne])
+        curseur.execute(
+            f"ALTER TABLE presence ATTACH PARTITION {ouverte} "
+            f"FOR VALUES FROM ({'MINVALUE' if bas is None else int(bas)}) TO ({int(borne)})"
+        )
+        curseur.execute('ANALYZE presence')
+    return nouvelle
+
+
+def archiver(avant, supprimer=False, using=DEFAULT_DB_ALIAS):
+    """
+    Détache les partitions fermées dont toutes les sessions ont commencé
+    avant cette date, puis les déplace dans le schéma archive (sans leurs
+    clés étrangères, pour que les sessions et étudiants restent supprimables)
+    ou les supprime avec leurs sessions. La partition ouverte n'est jamais
+    archivée. Renvoie les noms des partitions archivées.
+    """
+    # presence.resumes importe ce module
+    from .models import SessionCours
+    from .resumes import reconstruire_resumes
+
+    if not est_partitionnee(using):
+        raise ErreurPartitions("La table presence n'est pas partitionnée.")
+
+    archivees, supprimees = [], Q(pk__in=[])
+    with transaction.atomic(using=using), connections[using].cursor() as curseur:
+        for nom, bas, haut in _partitions(curseur)[:-1]:
+            curseur.execute(
+                'SELECT max(date_debut) FROM session_cours WHERE id >= %s AND id < %s',
+                [0 if bas is None else bas, haut],
+            )
+            derniere = curseur.fetchone()[0]
+            if derniere is not None and derniere >= avant:
+                break
+
+            curseur.execute(f'ALTER TABLE presence DETACH PARTITION {nom}')
+            if supprimer:
+                curseur.execute(f'DROP TABLE {nom}')
+                supprimees |= Q(pk__lt=haut) if bas is None else Q(pk__gte=bas, pk__lt=haut)
+            else:
+                curseur.execute(
+                    "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'", [nom]
+                )
+                for contrainte, in curseur.fetchall():
+                    curseur.execute(f'ALTER TABLE {nom} DROP CONSTRAINT {contrainte}')
+                curseur.execute(f'CREATE SCHEMA IF NOT EXISTS {SCHEMA_ARCHIVE}')
+                curseur.execute(f'ALTER TABLE {nom} SET SCHEMA {SCHEMA_ARCHIVE}')
+            archivees.append(nom)
+
+        if supprimer and archivees:
+            # Sans leurs présences, ces sessions compteraient comme des absences
+            sessions = SessionCours.objects.using(using).filter(supprimees)
+            cours_ids = list(sessions.values_list('cours_id', flat=True).distinct().order_by())
+            sessions.delete()
+            reconstruire_resumes(cours_ids)
+    return archivees
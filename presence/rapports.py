@@ -0,0 +1,453 @@
+"""
+Feuilles de présence PDF des sessions, rendues en arrière-plan et gardées
+sur disque.
+
+Le rendu HTML → PDF (xhtml2pdf) prend plusieurs secondes pour une grande
+promotion : il est confié à un pool de threads, et la vue répond 202 avec
+l'URL à interroger tant que le fichier n'est pas prêt.
+
+Chaque rapport est enregistré sous le nom session_<id>_<empreinte>.pdf.
+L'empreinte résume ce qui figure sur la feuille (présences, inscrits,
+horaires, cours) : tant qu'elle ne change pas, le même fichier est servi ;
+dès qu'une présence est ajoutée ou supprimée, un nouveau rendu est lancé et
+l'ancien fichier est supprimé une fois le nouveau écrit.
+
+Les feuilles de toutes les sessions d'un cours ou d'une formation sont
+rendues en lot et regroupées dans une archive ZIP diffusée au fil des
+rendus (rapports_en_lot, archive_zip). Les rendus en lot passent par un
+pool de processus unique par processus serveur, créé au premier export et
+gardé ensuite : les exports simultanés se partagent ses PROCESSUS
+processus au lieu d'en lancer chacun autant que de cœurs.
+
+Réglage PRESENCE_RAPPORTS (settings) :
+    ASYNC      : False pour rendre le PDF dans la requête (développement, tests)
+    REPERTOIRE : dossier des PDF rendus
+    WORKERS    : nombre de rendus simultanés par processus
+    PROCESSUS  : taille du pool des rendus en lot, pour tout le processus
+                 serveur (défaut : nombre de cœurs)
+    MOTEUR     : moteur de rendu par défaut, 'xhtml2pdf' ou 'reportlab'
+                 (voir presence/rendu_pdf.py) ; un fichier est gardé par moteur
+"""
+import glob
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .models import Cours, SessionCours, Presence
+from .rendu_pdf import ErreurRendu, MOTEURS, rendre_pdf, initialiser_processus, rendre_en_processus
+
+logger = logging.getLogger(__name__)
+
+REGLAGES_PAR_DEFAUT = {
+    'ASYNC': True,
+    'REPERTOIRE': os.path.join(settings.BASE_DIR, 'rapports'),
+    'WORKERS': 2,
+    'PROCESSUS': None,
+    'MOTEUR': 'xhtml2pdf',
+}
+
+
+# --- Contenu de la feuille ---
+
+def _inscrits(cours_ids):
+    """ (cours_id, etudiant_id, nom, prénom) des inscrits, par nom. """
+    return Cours.etudiants.through.objects.filter(cours_id__in=cours_ids).order_by('etudiant__id__nom').values_list(
+        'cours_id', 'etudiant_id', 'etudiant__id__nom', 'etudiant__id__prenom'
+    )
+
+
+def _contexte(session, inscrits, ids_presents):
+    """
+    Contexte du gabarit session_report.html, en données simples : le rendu
+    (thread ou processus) n'accède pas à la base.
+    """
+    liste_etudiants = []
+    for etudiant_id, nom, prenom in inscrits:
+        est_present = etudiant_id in ids_presents
+        liste_etudiants.append({
+            'nom': nom,
+            'prenom': prenom,
+            'statut': 'PRÉSENT' if est_present else 'ABSENT',
+            'color': '#198754' if est_present else '#dc3545'
+        })
+
+    compte = session.enseignant.id
+    return {
+        'session': {
+            'id': session.pk,
+            'cours': {'nom': session.cours.nom, 'code': session.cours.code},
+            'date_debut': session.date_debut,
+            'date_fin': session.date_fin,
+        },
+        'liste_etudiants': liste_etudiants,
+        'total_inscrits': len(liste_etudiants),
+        'total_presents': sum(1 for etudiant in liste_etudiants if etudiant['statut'] == 'PRÉSENT'),
+        'enseignant': {'id': {'nom': compte.nom, 'prenom': compte.prenom}},
+    }
+
+
+def contexte_rapport(session):
+    """ Contexte de la feuille d'une session (cours et enseignant__id chargés par select_related). """
+    inscrits = [ligne[1:] for ligne in _inscrits([session.cours_id])]
+    ids_presents = set(Presence.objects.filter(session=session).values_list('etudiant_id', flat=True))
+    return _contexte(session, inscrits, ids_presents)
+
+
+def contextes_en_lot(sessions):
+    """ Contextes de plusieurs sessions, par id de session : deux requêtes quel que soit leur nombre. """
+    inscrits = {}
+    for cours_id, *etudiant in _inscrits({session.cours_id for session in sessions}):
+        inscrits.setdefault(cours_id, []).append(etudiant)
+    presents = {}
+    for session_id, etudiant_id in Presence.objects.filter(
+        session_id__in=[session.pk for session in sessions]
+    ).values_list('session_id', 'etudiant_id'):
+        presents.setdefault(session_id, set()).add(etudiant_id)
+    return {
+        session.pk: _contexte(session, inscrits.get(session.cours_id, []), presents.get(session.pk, set()))
+        for session in sessions
+    }
+
+
+def _hacher(session, presences, inscrits):
+    valeurs = (
+        presences['nombre'], presences['dernier'], presences['somme'],
+        inscrits['nombre'], inscrits['somme'],
+        session.date_debut, session.date_fin, session.cours.nom, session.cours.code,
+    )
+    return hashlib.blake2b(repr(valeurs).encode(), digest_size=8).hexdigest()
+
+
+AGREGATS_PRESENCES = {'nombre': Count('id'), 'dernier': Max('id'), 'somme': Sum('id')}
+AGREGATS_INSCRITS = {'nombre': Count('id'), 'somme': Sum('etudiant_id')}
+
+
+def empreinte_rapport(session):
+    """
+    Empreinte du contenu de la feuille : deux agrégats indexés (présences de
+    la session, inscrits du cours) et les champs affichés de la session.
+    """
+    presences = Presence.objects.filter(session_id=session.pk).aggregate(**AGREGATS_PRESENCES)
+    inscrits = Cours.etudiants.through.objects.filter(cours_id=session.cours_id).aggregate(**AGREGATS_INSCRITS)
+    return _hacher(session, presences, inscrits)
+
+
+def empreintes_en_lot(sessions):
+    """ Empreintes de plusieurs sessions, par id de session (deux requêtes groupées). """
+    vide_presences = {'nombre': 0, 'dernier': None, 'somme': None}
+    vide_inscrits = {'nombre': 0, 'somme': None}
+    presences = {
+        ligne['session_id']: ligne
+        for ligne in Presence.objects.filter(session_id__in=[session.pk for session in sessions])
+        .values('session_id').annotate(**AGREGATS_PRESENCES).order_by()
+    }
+    inscrits = {
+        ligne['cours_id']: ligne
+        for ligne in Cours.etudiants.through.objects.filter(cours_id__in={session.cours_id for session in sessions})
+        .values('cours_id').annotate(**AGREGATS_INSCRITS).order_by()
+    }
+    return {
+        session.pk: _hacher(
+            session, presences.get(session.pk, vide_presences), inscrits.get(session.cours_id, vide_inscrits)
+        )
+        for session in sessions
+    }
+
+
+def nom_fichier_rapport(session):
+    """ Nom proposé au téléchargement. """
+    return f"Presence_{session.cours.nom}_{session.date_debut.strftime('%d-%m-%Y')}.pdf"
+
+
+def nom_dans_archive(session):
+    """ Chemin de la feuille dans l'archive ZIP : un dossier par cours, une feuille par séance. """
+    return f"{session.cours.code}/{timezone.localtime(session.date_debut):%Y-%m-%d_%Hh%M}_session_{session.pk}.pdf"
+
+
+# --- Magasin de rapports ---
+
+class MagasinRapports:
+    """ Rapports rendus sur disque, et rendus en cours dans ce processus. """
+
+    def __init__(self, repertoire, asynchrone=True, workers=2, processus=None, moteur='xhtml2pdf'):
+        if moteur not in MOTEURS:
+            raise ValueError(f"Moteur de rendu inconnu : {moteur}")
+        self.repertoire = repertoire
+        self.asynchrone = asynchrone
+        self.workers = workers
+        self.processus = processus
+        self.moteur = moteur
+
+        self._verrou = threading.Lock()
+        self._taches = {}
+        self._executeur = None
+        self._pid = None
+        self._pool_processus = None
+        self._pid_pool = None
+
+    def chemin(self, session_id, empreinte, moteur=None):
+        return os.path.join(self.repertoire, f"session_{session_id}_{empreinte}_{moteur or self.moteur}.pdf")
+
+    def demander(self, session, moteur=None):
+        """
+        Chemin du PDF à jour de la session, ou None si son rendu est en cours
+        (il est lancé au besoin). Lève ErreurRendu si ce rendu a échoué : la
+        demande suivante le relance.
+        """
+        moteur = moteur or self.moteur
+        empreinte = empreinte_rapport(session)
+        chemin = self.chemin(session.pk, empreinte, moteur)
+        cle = (session.pk, empreinte, moteur)
+        if os.path.exists(chemin):
+            with self._verrou:
+                self._taches.pop(cle, None)
+            return chemin
+
+        if not self.asynchrone:
+            self._ecrire(session.pk, empreinte, moteur, contexte_rapport(session))
+            return chemin
+
+        with self._verrou:
+            tache = self._taches.get(cle)
+        if tache is None:
+            # Le contexte est lu ici : le thread de rendu n'ouvre pas de connexion à la base.
+            contexte = contexte_rapport(session)
+            with self._verrou:
+                tache = self._taches.get(cle)
+                if tache is None:
+                    tache = self._taches[cle] = self._executeur_actif().submit(
+                        self._ecrire, session.pk, empreinte, moteur, contexte
+                    )
+        if not tache.done():
+            return None
+
+        with self._verrou:
+            self._taches.pop(cle, None)
+        erreur = tache.exception()
+        if erreur is not None:
+            raise ErreurRendu(str(erreur)) from erreur
+        return chemin
+
+    def enregistrer(self, session_id, empreinte, moteur, contenu):
+        """ Écrit un rapport rendu et supprime les versions précédentes de la session (même moteur). """
+        os.makedirs(self.repertoire, exist_ok=True)
+        chemin = self.chemin(session_id, empreinte, moteur)
+        descripteur, temporaire = tempfile.mkstemp(dir=self.repertoire, suffix='.tmp')
+        with os.fdopen(descripteur, 'wb') as fichier:
+            fichier.write(contenu)
+        # Remplacement atomique : un téléchargement ne lit jamais un fichier partiel.
+        os.replace(temporaire, chemin)
+
+        for ancien in glob.glob(self.chemin(session_id, '*', moteur)):
+            if ancien != chemin:
+                try:
+                    os.remove(ancien)
+                except FileNotFoundError:
+                    pass
+        return chemin
+
+    # --- Rendu ---
+
+    def _executeur_actif(self):
+        # Après un fork (gunicorn --preload), le pool du parent n'a plus de threads.
+        if self._executeur is None or self._pid != os.getpid():
+            self._executeur = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='rapports-pdf')
+            self._taches = {}
+            self._pid = os.getpid()
+        return self._executeur
+
+    def pool_processus(self):
+        """ Pool de processus des rendus en lot, partagé par tous les exports de ce processus. """
+        with self._verrou:
+            pool = self._pool_processus
+            if pool is None or self._pid_pool != os.getpid():
+                # spawn : pas de fork d'un processus serveur qui a des threads (ingestion, rendus).
+                pool = self._pool_processus = nouveau_pool_processus(self.processus, self.moteur)
+                self._pid_pool = os.getpid()
+            return pool
+
+    def abandonner_pool_processus(self):
+        """ Pool inutilisable (processus de rendu tué) : un nouveau est créé au prochain export. """
+        with self._verrou:
+            pool, self._pool_processus = self._pool_processus, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _ecrire(self, session_id, empreinte, moteur, contexte):
+        try:
+            contenu = rendre_pdf(contexte, moteur)
+        except Exception:
+            logger.exception("Échec du rendu de la feuille de présence de la session %s", session_id)
+            raise
+        self.enregistrer(session_id, empreinte, moteur, contenu)
+
+
+_magasin = None
+_verrou_instance = threading.Lock()
+
+
+def get_rapports():
+    """ Retourne le magasin de rapports du processus, configuré par PRESENCE_RAPPORTS. """
+    global _magasin
+    if _magasin is None:
+        with _verrou_instance:
+            if _magasin is None:
+                reglages = {**REGLAGES_PAR_DEFAUT, **getattr(settings, 'PRESENCE_RAPPORTS', {})}
+                _magasin = MagasinRapports(
+                    reglages['REPERTOIRE'],
+                    asynchrone=reglages['ASYNC'],
+                    workers=reglages['WORKERS'],
+                    processus=reglages['PROCESSUS'],
+                    moteur=reglages['MOTEUR'],
+                )
+    return _magasin
+
+
+# --- Rapports en lot ---
+
+def sessions_a_exporter(cours_ids=None, formation_id=None, depuis=None, jusqu_a=None):
+    """
+    Sessions de cours (par cours puis chronologiquement) : cours donnés, ou
+    cours suivis par les étudiants d'une formation ; depuis/jusqu_a portent
+    sur la date de début.
+    """
+    sessions = SessionCours.objects.select_related('cours', 'enseignant__id')
+    if cours_ids is not None:
+        sessions = sessions.filter(cours_id__in=cours_ids)
+    if formation_id is not None:
+        sessions = sessions.filter(
+            cours_id__in=Cours.etudiants.through.objects.filter(etudiant__formation_id=formation_id).values('cours_id')
+        )
+    if depuis is not None:
+        sessions = sessions.filter(date_debut__gte=depuis)
+    if jusqu_a is not None:
+        sessions = sessions.filter(date_debut__lt=jusqu_a)
+    return sessions.order_by('cours__code', 'date_debut', 'id')
+
+
+def nouveau_pool_processus(taille=None, moteur=None):
+    """ Pool de processus de rendu (spawn), chacun initialisé par initialiser_processus. """
+    return ProcessPoolExecutor(
+        max_workers=taille or os.cpu_count() or 1, mp_context=multiprocessing.get_context('spawn'),
+        initializer=initialiser_processus, initargs=(moteur,),
+    )
+
+
+def rapports_en_lot(sessions, processus=None, moteur=None):
+    """
+    Génère (nom dans l'archive, PDF) pour chaque session, dans l'ordre.
+
+    Les feuilles déjà présentes dans le magasin sont relues ; les autres sont
+    rendues en parallèle par le pool de processus du magasin (ou, avec
+    processus, par un pool de cette taille propre à l'appel : commande
+    rapports_pdf), chaque processus gardant son gabarit compilé et ses
+    polices chargées d'un rendu à l'autre, puis enregistrées dans le
+    magasin. Une feuille qui ne peut être ni rendue ni relue est omise (et
+    journalisée) : l'archive diffusée n'est jamais coupée en cours de fichier.
+    """
+    sessions = list(sessions)
+    magasin = get_rapports()
+    moteur = moteur or magasin.moteur
+    empreintes = empreintes_en_lot(sessions)
+    a_rendre = [
+        session for session in sessions
+        if not os.path.exists(magasin.chemin(session.pk, empreintes[session.pk], moteur))
+    ]
+
+    rendus = {}
+    pool_dedie = None
+    if a_rendre:
+        contextes = contextes_en_lot(a_rendre)
+        if processus:
+            pool_dedie = nouveau_pool_processus(min(processus, len(a_rendre)), moteur)
+            rendus = _soumettre(pool_dedie, a_rendre, contextes, moteur)
+        else:
+            try:
+                rendus = _soumettre(magasin.pool_processus(), a_rendre, contextes, moteur)
+            except BrokenProcessPool:
+                magasin.abandonner_pool_processus()
+                rendus = _soumettre(magasin.pool_processus(), a_rendre, contextes, moteur)
+    try:
+        for session in sessions:
+            try:
+                contenu = _contenu_feuille(magasin, session, empreintes[session.pk], moteur, rendus.get(session.pk))
+            except BrokenProcessPool:
+                logger.exception("Échec du rendu de la feuille de présence de la session %s", session.pk)
+                if pool_dedie is None:
+                    magasin.abandonner_pool_processus()
+                continue
+            except Exception:
+                logger.exception("Échec du rendu de la feuille de présence de la session %s", session.pk)
+                continue
+            if contenu is None:
+                logger.error("Échec du rendu de la feuille de présence de la session %s", session.pk)
+                continue
+            yield nom_dans_archive(session), contenu
+    finally:
+        # Export interrompu (client déconnecté) : les rendus pas encore commencés sont abandonnés.
+        for rendu in rendus.values():
+            rendu.cancel()
+        if pool_dedie is not None:
+            pool_dedie.shutdown(cancel_futures=True)
+
+
+def _soumettre(pool, sessions, contextes, moteur):
+    """ Rendus des sessions, par id ; chaque résultat est disponible dès son rendu. """
+    return {session.pk: pool.submit(rendre_en_processus, contextes[session.pk], moteur) for session in sessions}
+
+
+def _contenu_feuille(magasin, session, empreinte, moteur, rendu):
+    """ PDF d'une feuille du lot : résultat de son rendu (enregistré), ou fichier du magasin. """
+    if rendu is not None:
+        contenu = rendu.result()
+        if contenu is not None:
+            magasin.enregistrer(session.pk, empreinte, moteur, contenu)
+        return contenu
+    try:
+        with open(magasin.chemin(session.pk, empreinte, moteur), 'rb') as fichier:
+            return fichier.read()
+    except FileNotFoundError:
+        # Remplacé entre-temps par une version plus récente : rendu ici.
+        return rendre_pdf(contexte_rapport(session), moteur)
+
+
+class _FluxEcriture:
+    """ Fichier en écriture seule dont le contenu est repris au fur et à mesure. """
+
+    def __init__(self):
+        self._morceaux = []
+
+    def write(self, donnees):
+        self._morceaux.append(bytes(donnees))
+        return len(donnees)
+
+    def flush(self):
+        pass
+
+    def reprendre(self):
+        donnees = b''.join(self._morceaux)
+        self._morceaux = []
+        return donnees
+
+
+def archive_zip(fichiers):
+    """
+    Générateur d'une archive ZIP à partir de (nom, contenu) : chaque fichier
+    est envoyé dès qu'il est ajouté, sans archive complète en mémoire.
+    """
+    flux = _FluxEcriture()
+    with zipfile.ZipFile(flux, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for nom, contenu in fichiers:
+            archive.writestr(nom, contenu)
+            yield flux.reprendre()
+    yield flux.reprendre()
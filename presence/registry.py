@@ -0,0 +1,278 @@
+"""
+Registre des sessions actives et index des inscrits par cours, utilisés par le
+chemin critique de valider_scan.
+
+Les entrées sont stockées dans le cache Django désigné par le réglage
+PRESENCE_CACHE_ALIAS ('default' par défaut). Sans configuration CACHES, il
+s'agit du LocMemCache : le registre est alors propre à chaque processus.
+Avec un cache partagé (Redis, Memcached...), tous les workers le partagent.
+
+lancer_session, rafraichir_qr et arreter_session tiennent le registre à jour ;
+en cas d'absence d'entrée (redémarrage, autre processus), la session est
+rechargée depuis la base une seule fois puis remise en cache. Une entrée de
+session active vit au plus DUREE_MAX_ENTREE_SESSION secondes : avec un cache
+propre à chaque processus, un worker qui n'a pas traité l'arrêt d'une
+session relit son état en base dans ce délai et cesse d'accepter ses scans
+(voir aussi le contrôle presence.W001, presence/checks.py).
+
+La version des présences d'une session change à chaque écriture de
+présences (lot d'ingestion ou signal) : le flux de suivi en direct la lit
+dans le cache pour ne retourner en base que lorsque de nouveaux scans sont
+enregistrés.
+
+L'index des inscrits est un tableau trié des identifiants d'Etudiant d'un
+cours : la vérification d'inscription se fait par recherche dichotomique,
+sans requête SQL. Il est construit au lancement d'une session et invalidé
+par presence.signals lorsque les inscriptions du cours changent.
+
+Les variantes préfixées par « a » (aget_session_active, aest_inscrit,
+aenregistrer_session...) sont destinées aux vues asynchrones : le cache
+passe par son API asynchrone (aget, aset...) et le rechargement depuis la
+base par l'ORM asynchrone ; aucun appel bloquant dans la boucle d'événements.
+"""
+import datetime
+import hmac
+import time
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .models import Cours, SessionCours
+from .utils import jeton_session, empreinte_qr, duree_fenetre_compacte
+
+# Marqueur stocké à l'arrêt d'une session : évite de retourner en base
+# pour chaque scan d'un QR code encore signé mais dont la séance est finie.
+SESSION_TERMINEE = 'terminee'
+
+# Durée de conservation du marqueur de fin de session (secondes)
+DUREE_MARQUEUR_FIN = 15 * 60
+
+# Durée de vie de l'index des inscrits (secondes). L'invalidation par signal
+# suffit avec un cache partagé ; ce plafond borne l'obsolescence d'un index
+# resté dans le cache local d'un autre processus.
+DUREE_INDEX_INSCRITS = 10 * 60
+
+# Durée de vie maximale d'une entrée de session active (secondes) : au-delà,
+# l'état de la session (actif) est relu en base.
+DUREE_MAX_ENTREE_SESSION = 60
+
+# Jetons compacts (sans expiration stockée) : l'entrée vit ce nombre de fenêtres
+FENETRES_ENTREE_COMPACTE = 4
+
+
+@dataclass(frozen=True)
+class SessionActive:
+    """ Vue minimale d'une SessionCours active, suffisante pour valider un scan. """
+    session_id: int
+    cours_id: int
+    cours_nom: str
+    enseignant_id: int
+    qr_token: str
+    qr_empreinte: bytes
+    qr_expiration: datetime.datetime
+
+    def jeton_correspond(self, jeton):
+        """
+        Vrai si jeton est le jeton QR courant de la session. Comparaison des
+        empreintes : ne dépend pas du réencodage du jeton (jeton_session).
+        """
+        return self.qr_empreinte is not None and hmac.compare_digest(empreinte_qr(jeton), self.qr_empreinte)
+
+
+def cache_presence():
+    """ Cache PRESENCE_CACHE_ALIAS, partagé par le registre, les résumés (bilans, tableaux de bord)... """
+    return caches[getattr(settings, 'PRESENCE_CACHE_ALIAS', 'default')]
+
+
+def _cle_session(session_id):
+    # v2 : SessionActive porte l'empreinte du jeton (entrées des versions précédentes ignorées)
+    return f'presence:session:v2:{session_id}'
+
+
+def _duree_validite(expiration):
+    """ Durée (en secondes) de l'entrée d'une session active, bornée par DUREE_MAX_ENTREE_SESSION. """
+    if expiration is None:
+        # Jeton compact : recalculé à chaque fenêtre, sans expiration stockée
+        duree = FENETRES_ENTREE_COMPACTE * duree_fenetre_compacte()
+    else:
+        duree = max(int((expiration - timezone.now()).total_seconds()), 1)
+    return min(duree, DUREE_MAX_ENTREE_SESSION)
+
+
+def enregistrer_session(session):
+    """
+    Ajoute (ou met à jour) une session active dans le registre.
+    À appeler après chaque modification du jeton ou de l'état de la session.
+    """
+    if not session.actif:
+        retirer_session(session.id)
+        return None
+    entree = _entree_session(session)
+    cache_presence().set(_cle_session(session.id), entree, _duree_validite(session.qr_expiration))
+    return entree
+
+
+async def aenregistrer_session(session):
+    """ Variante asynchrone de enregistrer_session (session.cours doit être chargé). """
+    if not session.actif:
+        await aretirer_session(session.id)
+        return None
+    entree = _entree_session(session)
+    await cache_presence().aset(_cle_session(session.id), entree, _duree_validite(session.qr_expiration))
+    return entree
+
+
+def _entree_session(session):
+    return SessionActive(
+        session_id=session.id,
+        cours_id=session.cours_id,
+        cours_nom=session.cours.nom,
+        enseignant_id=session.enseignant_id,
+        qr_token=jeton_session(session),
+        qr_empreinte=None if session.qr_empreinte is None else bytes(session.qr_empreinte),
+        qr_expiration=session.qr_expiration,
+    )
+
+
+def retirer_session(session_id):
+    """ Marque une session comme terminée dans le registre (et en prévient le flux en direct). """
+    cache_presence().set(_cle_session(session_id), SESSION_TERMINEE, DUREE_MARQUEUR_FIN)
+    signaler_presences([session_id])
+
+
+async def aretirer_session(session_id):
+    """ Variante asynchrone de retirer_session. """
+    await cache_presence().aset(_cle_session(session_id), SESSION_TERMINEE, DUREE_MARQUEUR_FIN)
+    await asignaler_presences([session_id])
+
+
+def get_session_active(session_id, rafraichir=False):
+    """
+    Retourne la SessionActive correspondant à session_id, ou None si la session
+    n'existe pas ou est terminée.
+    Seul un défaut de cache (ou rafraichir=True) provoque une requête SQL.
+    """
+    if not rafraichir:
+        entree = cache_presence().get(_cle_session(session_id))
+        if entree is not None:
+            return None if entree == SESSION_TERMINEE else entree
+
+    session = _requete_session_active(session_id).first()
+    if session is None:
+        retirer_session(session_id)
+        return None
+    return enregistrer_session(session)
+
+
+async def aget_session_active(session_id, rafraichir=False):
+    """ Variante asynchrone de get_session_active. """
+    if not rafraichir:
+        entree = await cache_presence().aget(_cle_session(session_id))
+        if entree is not None:
+            return None if entree == SESSION_TERMINEE else entree
+
+    session = await _requete_session_active(session_id).afirst()
+    if session is None:
+        await aretirer_session(session_id)
+        return None
+    return await aenregistrer_session(session)
+
+
+def _requete_session_active(session_id):
+    return SessionCours.objects.select_related('cours').filter(id=session_id, actif=True)
+
+
+# --- Version des présences par session ---
+
+# Durée de conservation d'une version (secondes) ; au-delà, la version est
+# reconstituée à la première lecture, ce qui force une relecture en base.
+DUREE_VERSION_PRESENCES = 24 * 60 * 60
+
+
+def _cle_version(session_id):
+    return f'presence:version:{session_id}'
+
+
+def signaler_presences(session_ids):
+    """ Change la version des présences des sessions données (nouvelles présences écrites). """
+    cache_presence().set_many(_nouvelles_versions(session_ids), DUREE_VERSION_PRESENCES)
+
+
+async def asignaler_presences(session_ids):
+    """ Variante asynchrone de signaler_presences. """
+    await cache_presence().aset_many(_nouvelles_versions(session_ids), DUREE_VERSION_PRESENCES)
+
+
+def _nouvelles_versions(session_ids):
+    version = time.time_ns()
+    return {_cle_version(session_id): version for session_id in session_ids}
+
+
+def version_presences(session_id):
+    """ Version courante des présences d'une session (lecture du cache, sans SQL). """
+    cle = _cle_version(session_id)
+    version = cache_presence().get(cle)
+    if version is None:
+        version = time.time_ns()
+        if not cache_presence().add(cle, version, DUREE_VERSION_PRESENCES):
+            version = cache_presence().get(cle, version)
+    return version
+
+
+async def aversion_presences(session_id):
+    """ Variante asynchrone de version_presences. """
+    cle = _cle_version(session_id)
+    version = await cache_presence().aget(cle)
+    if version is None:
+        version = time.time_ns()
+        if not await cache_presence().aadd(cle, version, DUREE_VERSION_PRESENCES):
+            version = await cache_presence().aget(cle, version)
+    return version
+
+
+# --- Index des inscrits par cours ---
+
+def _cle_inscrits(cours_id):
+    return f'presence:inscrits:{cours_id}'
+
+
+def _requete_inscrits(cours_id):
+    return Cours.etudiants.through.objects.filter(cours_id=cours_id).values_list('etudiant_id', flat=True)
+
+
+def construire_index_inscrits(cours_id):
+    """ Construit (et met en cache) le tableau trié des étudiants inscrits au cours. """
+    index = array('q', sorted(_requete_inscrits(cours_id)))
+    cache_presence().set(_cle_inscrits(cours_id), index, DUREE_INDEX_INSCRITS)
+    return index
+
+
+def invalider_index_inscrits(cours_ids):
+    """ Supprime l'index des inscrits des cours donnés ; il sera reconstruit au prochain scan. """
+    cache_presence().delete_many([_cle_inscrits(cours_id) for cours_id in cours_ids])
+
+
+def est_inscrit(cours_id, etudiant_id):
+    """ Indique si l'étudiant est inscrit au cours (O(log n), sans SQL si l'index est en cache). """
+    index = cache_presence().get(_cle_inscrits(cours_id))
+    if index is None:
+        index = construire_index_inscrits(cours_id)
+    return _dans_index(index, etudiant_id)
+
+
+async def aest_inscrit(cours_id, etudiant_id):
+    """ Variante asynchrone de est_inscrit. """
+    index = await cache_presence().aget(_cle_inscrits(cours_id))
+    if index is None:
+        index = array('q', sorted([etudiant async for etudiant in _requete_inscrits(cours_id)]))
+        await cache_presence().aset(_cle_inscrits(cours_id), index, DUREE_INDEX_INSCRITS)
+    return _dans_index(index, etudiant_id)
+
+
+def _dans_index(index, etudiant_id):
+    position = bisect_left(index, etudiant_id)
+    return position < len(index) and index[position] == etudiant_id
@@ -0,0 +1,215 @@
+"""
+Rendu PDF des feuilles de présence.
+
+Deux moteurs produisent la même feuille (en-tête, informations de séance,
+tableau des inscrits avec leur statut, pied de page) :
+    xhtml2pdf : gabarit HTML presence/pdf/session_report.html, analysé
+                (HTML et CSS) à chaque rendu
+    reportlab : tableau dessiné directement sur un canevas reportlab, sans
+                étape HTML ; plusieurs fois plus rapide sur une grande liste
+
+Ce module n'importe aucun modèle : il peut être chargé par un processus de
+travail avant django.setup() (pool de processus de presence/rapports.py).
+Les contextes rendus ne contiennent que des données simples (dictionnaires,
+chaînes, dates), sans accès possible à la base.
+"""
+import io
+import logging
+
+from django.template.defaultfilters import date as filtre_date, title
+from django.template.loader import get_template
+from django.utils import timezone
+from reportlab.lib.colors import HexColor
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen.canvas import Canvas
+from xhtml2pdf import pisa
+
+logger = logging.getLogger(__name__)
+
+GABARIT_RAPPORT = 'presence/pdf/session_report.html'
+
+MOTEUR_PAR_DEFAUT = 'xhtml2pdf'
+
+# Contexte minimal, pour un premier rendu qui charge polices et gabarit
+CONTEXTE_VIDE = {
+    'session': {'id': 0, 'cours': {'nom': '', 'code': ''}, 'date_debut': None, 'date_fin': None},
+    'liste_etudiants': [],
+    'total_inscrits': 0,
+    'total_presents': 0,
+    'enseignant': {'id': {'nom': '', 'prenom': ''}},
+}
+
+
+class ErreurRendu(Exception):
+    """ Le rendu du PDF a échoué. """
+
+
+def rendre_pdf_xhtml2pdf(contexte, gabarit=None):
+    """ Feuille de présence rendue depuis le gabarit HTML (octets PDF). """
+    html = (gabarit or get_template(GABARIT_RAPPORT)).render(contexte)
+    sortie = io.BytesIO()
+    if pisa.CreatePDF(html, dest=sortie).err:
+        raise ErreurRendu(f"Rendu PDF impossible pour la session {contexte['session']['id']}")
+    return sortie.getvalue()
+
+
+# --- Moteur reportlab ---
+
+MARGE = 40
+HAUTEUR_LIGNE = 20
+# (titre, largeur en points) ; la signature prend le reste de la page
+COLONNES = [('#', 30), ('Nom', 150), ('Prénom', 140), ('Statut', 80), ('Signature', None)]
+
+GRIS_TEXTE = HexColor('#333333')
+GRIS_BORDURE = HexColor('#dddddd')
+GRIS_ENTETE = HexColor('#f2f2f2')
+GRIS_PIED = HexColor('#aaaaaa')
+BLEU_TITRE = HexColor('#2c3e50')
+GRIS_SOUS_TITRE = HexColor('#7f8c8d')
+
+
+def _tronquer(texte, police, taille, largeur):
+    """ Coupe le texte pour qu'il tienne dans la cellule. """
+    if stringWidth(texte, police, taille) <= largeur:
+        return texte
+    while texte and stringWidth(texte + '…', police, taille) > largeur:
+        texte = texte[:-1]
+    return texte + '…'
+
+
+def _date(valeur, format_date):
+    # Le filtre date du gabarit reçoit l'heure locale (expects_localtime) ; ici, conversion explicite.
+    return filtre_date(timezone.localtime(valeur), format_date) if valeur else ''
+
+
+def rendre_pdf_reportlab(contexte):
+    """ Feuille de présence dessinée directement sur un canevas reportlab (octets PDF). """
+    sortie = io.BytesIO()
+    largeur_page, hauteur_page = A4
+    canevas = Canvas(sortie, pagesize=A4)
+    session = contexte['session']
+    enseignant = contexte['enseignant']['id']
+
+    largeur_table = largeur_page - 2 * MARGE
+    largeurs = [largeur or largeur_table - sum(l for _, l in COLONNES if l) for _, largeur in COLONNES]
+    abscisses = [MARGE + sum(largeurs[:i]) for i in range(len(largeurs) + 1)]
+    pied = f"Généré automatiquement par le Système de Gestion de Présence le {timezone.localtime():%d/%m/%Y %H:%M}"
+
+    def pied_de_page():
+        canevas.setFont('Helvetica', 8)
+        canevas.setFillColor(GRIS_PIED)
+        canevas.drawCentredString(largeur_page / 2, MARGE / 2, pied)
+
+    def entete_table(y):
+        canevas.setFillColor(GRIS_ENTETE)
+        canevas.rect(MARGE, y - HAUTEUR_LIGNE, largeur_table, HAUTEUR_LIGNE, stroke=0, fill=1)
+        canevas.setFillColor(GRIS_TEXTE)
+        canevas.setFont('Helvetica-Bold', 10)
+        for (titre, _), x in zip(COLONNES, abscisses):
+            canevas.drawString(x + 6, y - 14, titre)
+        return y - HAUTEUR_LIGNE
+
+    def bordures(haut, bas):
+        canevas.setStrokeColor(GRIS_BORDURE)
+        canevas.setLineWidth(0.75)
+        for x in abscisses:
+            canevas.line(x, haut, x, bas)
+        y = haut
+        while y >= bas - 0.01:
+            canevas.line(MARGE, y, MARGE + largeur_table, y)
+            y -= HAUTEUR_LIGNE
+
+    # En-tête de la feuille
+    y = hauteur_page - MARGE
+    canevas.setFillColor(BLEU_TITRE)
+    canevas.setFont('Helvetica-Bold', 18)
+    canevas.drawCentredString(largeur_page / 2, y - 18, 'Feuille de Présence')
+    canevas.setFillColor(GRIS_SOUS_TITRE)
+    canevas.setFont('Helvetica-Bold', 13)
+    canevas.drawCentredString(largeur_page / 2, y - 38, f"{session['cours']['nom']} ({session['cours']['code']})")
+    canevas.setStrokeColor(HexColor('#000000'))
+    canevas.setLineWidth(1.5)
+    canevas.line(MARGE, y - 50, largeur_page - MARGE, y - 50)
+
+    fin = _date(session['date_fin'], 'H:i') if session['date_fin'] else 'En cours'
+    informations = [
+        ('Enseignant :', f"{enseignant['nom'].upper()} {enseignant['prenom']}"),
+        ('Date :', _date(session['date_debut'], 'd F Y')),
+        ('Heure :', f"{_date(session['date_debut'], 'H:i')} - {fin}"),
+        ('Taux de présence :', f"{contexte['total_presents']} / {contexte['total_inscrits']} étudiants"),
+    ]
+    y -= 75
+    canevas.setFillColor(GRIS_TEXTE)
+    for libelle, valeur in informations:
+        canevas.setFont('Helvetica-Bold', 10)
+        canevas.drawString(MARGE, y, libelle)
+        canevas.setFont('Helvetica', 10)
+        canevas.drawString(MARGE + stringWidth(libelle, 'Helvetica-Bold', 10) + 4, y, valeur)
+        y -= 15
+
+    # Tableau des inscrits, en-tête répété sur chaque page
+    haut = y - 10
+    y = entete_table(haut)
+    for numero, etudiant in enumerate(contexte['liste_etudiants'], 1):
+        if y - HAUTEUR_LIGNE < MARGE:
+            bordures(haut, y)
+            pied_de_page()
+            canevas.showPage()
+            haut = hauteur_page - MARGE
+            y = entete_table(haut)
+        base = y - 14
+        canevas.setFont('Helvetica', 10)
+        canevas.setFillColor(GRIS_TEXTE)
+        canevas.drawString(abscisses[0] + 6, base, str(numero))
+        canevas.drawString(abscisses[1] + 6, base, _tronquer(etudiant['nom'].upper(), 'Helvetica', 10, largeurs[1] - 12))
+        canevas.drawString(abscisses[2] + 6, base, _tronquer(title(etudiant['prenom']), 'Helvetica', 10, largeurs[2] - 12))
+        canevas.setFillColor(HexColor(etudiant['color']))
+        canevas.drawString(abscisses[3] + 6, base, etudiant['statut'])
+        y -= HAUTEUR_LIGNE
+    bordures(haut, y)
+    pied_de_page()
+
+    canevas.save()
+    return sortie.getvalue()
+
+
+MOTEURS = {
+    'xhtml2pdf': rendre_pdf_xhtml2pdf,
+    'reportlab': rendre_pdf_reportlab,
+}
+
+
+def rendre_pdf(contexte, moteur=None):
+    """ Rend la feuille de présence en PDF (octets) avec le moteur demandé. """
+    return MOTEURS[moteur or MOTEUR_PAR_DEFAUT](contexte)
+
+
+# --- Processus de travail ---
+
+_gabarit = None
+
+
+def initialiser_processus(moteur=None):
+    """
+    Initialisation d'un processus du pool : Django, gabarit compilé une fois,
+    et un premier rendu à vide qui charge les polices et les feuilles de
+    style par défaut de xhtml2pdf / reportlab pour tous les rendus suivants.
+    """
+    import django
+    django.setup()
+
+    global _gabarit
+    _gabarit = get_template(GABARIT_RAPPORT)
+    rendre_en_processus(CONTEXTE_VIDE, moteur)
+
+
+def rendre_en_processus(contexte, moteur=None):
+    """ Rendu dans un processus du pool ; None (et journalisé) si le rendu a échoué. """
+    try:
+        if (moteur or MOTEUR_PAR_DEFAUT) == 'xhtml2pdf':
+            return rendre_pdf_xhtml2pdf(contexte, _gabarit)
+        return rendre_pdf(contexte, moteur)
+    except Exception:
+        logger.exception("Échec du rendu de la feuille de présence de la session %s", contexte['session']['id'])
+        return None
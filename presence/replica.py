@@ -0,0 +1,226 @@
+"""
+Lectures sur une réplique PostgreSQL.
+
+Les pages de statistiques, les feuilles de présence, la page de scan de
+l'étudiant, les listes de gestion et les listes de l'API lisent beaucoup et
+n'écrivent pas : elles peuvent lire sur une réplique (alias 'replica' de
+DATABASES, voir settings) et laisser le primaire aux insertions des scans.
+
+- Les vues concernées sont décorées par `lecture_replica` (ViewSets DRF :
+  `LectureReplicaMixin`, pour list()). Pendant la vue, le routeur
+  `RouteurReplica` envoie les lectures sur la réplique ; les écritures
+  restent sur le primaire.
+- Lire ses propres écritures : après une requête qui écrit (POST, PUT,
+  PATCH, DELETE réussie), l'utilisateur lit sur le primaire pendant
+  COLLANT_SECONDES (`ReplicaMiddleware`, marque dans le cache
+  PRESENCE_CACHE_ALIAS, partagée entre workers avec un cache partagé).
+- Retard de réplication : mesuré sur la réplique au plus une fois par
+  VERIFICATION_SECONDES et par processus ; au-delà de RETARD_MAX_SECONDES,
+  ou si la réplique ne répond pas, les lectures restent sur le primaire.
+  COLLANT_SECONDES doit rester supérieur à RETARD_MAX_SECONDES.
+
+Sans alias de réplique dans DATABASES, rien ne change : tout est lu sur le
+primaire.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, DatabaseError, DEFAULT_DB_ALIAS
+
+logger = logging.getLogger(__name__)
+
+REGLAGES_PAR_DEFAUT = {
+    'ALIAS': 'replica',
+    'COLLANT_SECONDES': 5,
+    'RETARD_MAX_SECONDES': 2,
+    'VERIFICATION_SECONDES': 1,
+}
+
+METHODES_LECTURE = ('GET', 'HEAD', 'OPTIONS')
+
+# Retard de la réplique en secondes : 0 si elle a rejoué tout le WAL reçu,
+# NULL si inconnu (rien rejoué depuis son démarrage)
+REQUETE_RETARD = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+# Base des lectures de la vue en cours (None : primaire)
+_base_lecture = ContextVar('base_lecture', default=None)
+
+# Dernière mesure du retard par alias : (instant, retard)
+_retards = {}
+
+
+def reglages():
+    return {**REGLAGES_PAR_DEFAUT, **getattr(settings, 'PRESENCE_REPLICA', {})}
+
+
+def alias_replica():
+    """ Alias de la réplique, None si elle n'est pas configurée. """
+    alias = reglages()['ALIAS']
+    return alias if alias in settings.DATABASES else None
+
+
+def _cache():
+    return caches[getattr(settings, 'PRESENCE_CACHE_ALIAS', 'default')]
+
+
+def _cle_collante(utilisateur_id):
+    return f'replica:collant:{utilisateur_id}'
+
+
+# --- Retard de réplication ---
+
+def _mesurer_retard(alias):
+    connexion = connections[alias]
+    if connexion.vendor != 'postgresql':
+        return 0.0
+    try:
+        with connexion.cursor() as curseur:
+            curseur.execute(REQUETE_RETARD)
+            retard = curseur.fetchone()[0]
+    except DatabaseError:
+        logger.warning("Réplique %s injoignable, lectures sur le primaire.", alias, exc_info=True)
+        return None
+    return None if retard is None else float(retard)
+
+
+def retard_replica(alias=None):
+    """
+    Retard de la réplique en secondes, None si inconnu ou si elle ne répond
+    pas. Mesuré au plus une fois par VERIFICATION_SECONDES dans ce processus.
+    """
+    alias = alias or alias_replica()
+    maintenant = time.monotonic()
+    mesure = _retards.get(alias)
+    if mesure is not None and maintenant - mesure[0] < reglages()['VERIFICATION_SECONDES']:
+        return mesure[1]
+    retard = _mesurer_retard(alias)
+    _retards[alias] = (maintenant, retard)
+    return retard
+
+
+# --- Choix de la base ---
+
+def _utilisateur_id(request):
+    utilisateur = getattr(request, 'user', None)
+    if utilisateur is None or not utilisateur.is_authenticated:
+        return None
+    return utilisateur.pk
+
+
+def marquer_ecriture(request):
+    """ L'utilisateur de la requête lit sur le primaire pendant COLLANT_SECONDES. """
+    utilisateur_id = _utilisateur_id(request)
+    if utilisateur_id is not None:
+        _cache().set(_cle_collante(utilisateur_id), True, reglages()['COLLANT_SECONDES'])
+
+
+def base_lecture(request):
+    """ Alias sur lequel lire pour cette requête, None pour le primaire. """
+    alias = alias_replica()
+    if alias is None or request.method not in METHODES_LECTURE:
+        return None
+    utilisateur_id = _utilisateur_id(request)
+    if utilisateur_id is not None and _cache().get(_cle_collante(utilisateur_id)):
+        return None
+    retard = retard_replica(alias)
+    if retard is None or retard > reglages()['RETARD_MAX_SECONDES']:
+        return None
+    return alias
+
+
+@contextmanager
+def lecture_sur_replica(request):
+    """ Les lectures du bloc passent par la réplique si elle convient (voir base_lecture). """
+    jeton = _base_lecture.set(base_lecture(request))
+    try:
+        yield _base_lecture.get()
+    finally:
+        _base_lecture.reset(jeton)
+
+
+def lecture_replica(vue):
+    """ Décorateur des vues en lecture seule : leurs lectures passent par la réplique. """
+    @wraps(vue)
+    def envelopper(request, *args, **kwargs):
+        with lecture_sur_replica(request):
+            return vue(request, *args, **kwargs)
+    return envelopper
+
+
+class LectureReplicaMixin:
+    """ ViewSet DRF dont les listes (list) sont lues sur la réplique. """
+
+    def list(self, request, *args, **kwargs):
+        with lecture_sur_replica(request):
+            return super().list(request, *args, **kwargs)
+
+
+# --- Routeur et middleware ---
+
+class RouteurReplica:
+    """ Routeur de DATABASE_ROUTERS : lectures sur la réplique dans les vues décorées. """
+
+    def db_for_read(self, model, **hints):
+        return _base_lecture.get()
+
+    def db_for_write(self, model, **hints):
+        # Explicite : un objet lu sur la réplique s'enregistre quand même sur le primaire
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bases = {DEFAULT_DB_ALIAS, reglages()['ALIAS']}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # La réplique reçoit le schéma du primaire par la réplication
+        if db == reglages()['ALIAS']:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Marque l'utilisateur après une requête qui écrit, pour qu'il lise ses
+    propres écritures sur le primaire (à placer après AuthenticationMiddleware).
+    Compatible ASGI : la chaîne des vues asynchrones n'est pas repassée en synchrone.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asynchrone = iscoroutinefunction(get_response)
+        if self.asynchrone:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _ecriture(request, response):
+        return request.method not in METHODES_LECTURE and response.status_code < 400 and alias_replica() is not None
+
+    def __call__(self, request):
+        if self.asynchrone:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self._ecriture(request, response):
+            marquer_ecriture(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self._ecriture(request, response):
+            await sync_to_async(marquer_ecriture)(request)
+        return response
@@ -0,0 +1,314 @@
+"""
+Résumés de présence par (cours, étudiant) et par session, lus par
+cours_statistiques à la place d'un COUNT par étudiant et par session.
+
+Ils sont tenus à jour de façon incrémentale :
+    - à l'écriture d'un lot de présences (ingestion.IngestionPresences.vider) ;
+    - à la création d'une présence isolée et d'une session (presence.signals) ;
+    - à la suppression de présences (supprimer_presences, pour l'API et
+      l'admin), d'une session ou d'un étudiant (presence.signals, pre_delete).
+
+Aucun signal n'est branché sur la suppression d'une présence : Django
+supprime alors les présences d'une session, d'un cours ou d'un étudiant en
+un seul DELETE, sans les charger une par une.
+
+En cas de doute (écriture hors de l'ORM, restauration de sauvegarde...),
+la commande reconstruire_resumes les recalcule depuis la table presence et
+ses partitions archivées (presence.partitions).
+
+Le bilan d'un étudiant (page scanner_etudiant) est calculé en deux requêtes
+puis mis en cache (PRESENCE_CACHE_ALIAS) ; il est invalidé quand l'étudiant
+scanne, quand une session de l'un de ses cours commence et quand ses
+inscriptions changent.
+
+Le tableau de bord d'un enseignant (session active et présences du jour par
+cours) est calculé en une requête puis mis en cache ; il est invalidé au
+lancement et à l'arrêt d'une session, à chaque lot de présences de ses
+sessions et à la modification de ses cours.
+"""
+import datetime
+
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, FilteredRelation
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Cours, SessionCours, Presence, ResumePresenceEtudiant, ResumePresenceSession
+from .partitions import presences_archivees
+from .registry import cache_presence, signaler_presences
+
+# Durée de vie d'un bilan étudiant en cache (secondes) ; borne l'obsolescence
+# après une modification non signalée (écriture hors de l'ORM...).
+DUREE_BILAN_ETUDIANT = 60 * 60
+
+# Nombre de présences récentes affichées sur la page de l'étudiant
+NB_PRESENCES_RECENTES = 5
+
+# Durée de vie maximale du tableau de bord d'un enseignant en cache (secondes)
+DUREE_TABLEAU_ENSEIGNANT = 10 * 60
+
+
+def creer_resume_session(session):
+    """ Crée le résumé (vide) d'une nouvelle session. """
+    ResumePresenceSession.objects.get_or_create(session_id=session.id, defaults={'cours_id': session.cours_id})
+
+
+def compter_presences(lignes, delta=1):
+    """
+    Ajoute delta aux résumés pour chaque (session_id, etudiant_id) de lignes.
+    À appeler dans la transaction qui écrit (ou supprime) les présences.
+    """
+    if not lignes:
+        return
+    sessions = SessionCours.objects.filter(id__in={session_id for session_id, _ in lignes}).values_list(
+        'id', 'cours_id', 'enseignant_id'
+    )
+    cours_par_session, enseignants = {}, set()
+    for session_id, cours_id, enseignant_id in sessions:
+        cours_par_session[session_id] = cours_id
+        enseignants.add(enseignant_id)
+
+    par_session = Counter(session_id for session_id, _ in lignes if session_id in cours_par_session)
+    for session_id, nombre in par_session.items():
+        mis_a_jour = ResumePresenceSession.objects.filter(session_id=session_id).update(
+            nb_presences=F('nb_presences') + nombre * delta
+        )
+        if not mis_a_jour and delta > 0:
+            # Session antérieure aux résumés : son résumé est créé au premier scan.
+            ResumePresenceSession.objects.get_or_create(
+                session_id=session_id, defaults={'cours_id': cours_par_session[session_id], 'nb_presences': nombre}
+            )
+
+    etudiants = {etudiant_id for _, etudiant_id in lignes}
+    transaction.on_commit(lambda: invalider_bilans_etudiants(etudiants))
+    transaction.on_commit(lambda: invalider_tableaux_enseignants(enseignants))
+
+    par_cours = {}
+    for session_id, etudiant_id in lignes:
+        if session_id in cours_par_session:
+            par_cours.setdefault(cours_par_session[session_id], Counter())[etudiant_id] += 1
+    for cours_id, compteur in par_cours.items():
+        _compter_etudiants(cours_id, compteur, delta)
+
+
+def _compter_etudiants(cours_id, compteur, delta):
+    resumes = ResumePresenceEtudiant.objects.filter(cours_id=cours_id)
+    existants = set(resumes.filter(etudiant_id__in=compteur).values_list('etudiant_id', flat=True))
+
+    # Un même étudiant apparaît au plus une fois par session : on regroupe par valeur d'incrément.
+    par_increment = {}
+    for etudiant_id in existants:
+        par_increment.setdefault(compteur[etudiant_id], []).append(etudiant_id)
+    for nombre, etudiant_ids in par_increment.items():
+        resumes.filter(etudiant_id__in=etudiant_ids).update(nb_presences=F('nb_presences') + nombre * delta)
+
+    if delta > 0:
+        ResumePresenceEtudiant.objects.bulk_create(
+            [
+                ResumePresenceEtudiant(cours_id=cours_id, etudiant_id=etudiant_id, nb_presences=nombre)
+                for etudiant_id, nombre in compteur.items() if etudiant_id not in existants
+            ],
+            ignore_conflicts=True,
+        )
+
+
+@transaction.atomic
+def supprimer_presences(presences):
+    """
+    Supprime les présences du queryset en un DELETE et retire leur compte
+    des résumés. Retourne le nombre de présences supprimées.
+    """
+    lignes = list(presences.values_list('session_id', 'etudiant_id'))
+    if not lignes:
+        return 0
+    nombre, _ = presences.delete()
+    compter_presences(lignes, delta=-1)
+    sessions = {session_id for session_id, _ in lignes}
+    transaction.on_commit(lambda: signaler_presences(sessions))
+    return nombre
+
+
+def retirer_session_des_resumes(session):
+    """
+    Avant la suppression d'une session : ses présences sortent du résumé de
+    chaque étudiant du cours (un étudiant a au plus une présence par session).
+    Le résumé de la session disparaît avec elle.
+    """
+    ResumePresenceEtudiant.objects.filter(
+        cours_id=session.cours_id,
+        etudiant_id__in=Presence.objects.filter(session_id=session.id).values('etudiant_id'),
+    ).update(nb_presences=F('nb_presences') - 1)
+    cours_id, enseignant_id = session.cours_id, session.enseignant_id
+    transaction.on_commit(lambda: invalider_bilans_cours(cours_id))
+    transaction.on_commit(lambda: invalider_tableaux_enseignants([enseignant_id]))
+
+
+def retirer_etudiant_des_resumes(etudiant_id):
+    """
+    Avant la suppression d'un étudiant : ses présences sortent du résumé de
+    chaque session où il a scanné. Ses résumés par cours disparaissent avec lui.
+    """
+    sessions = Presence.objects.filter(etudiant_id=etudiant_id).values('session_id')
+    enseignants = set(SessionCours.objects.filter(id__in=sessions).values_list('enseignant_id', flat=True))
+    if not enseignants:
+        return
+    ResumePresenceSession.objects.filter(session_id__in=sessions).update(nb_presences=F('nb_presences') - 1)
+    transaction.on_commit(lambda: invalider_tableaux_enseignants(enseignants))
+
+
+@transaction.atomic
+def reconstruire_resumes(cours_ids=None):
+    """
+    Recalcule entièrement les résumés (de tous les cours, ou des cours donnés)
+    depuis les tables session_cours et presence, plus les partitions archivées
+    de presence (partitions.presences_archivees). Retourne le nombre de
+    résumés (étudiants, sessions) écrits.
+    """
+    resumes_etudiants = ResumePresenceEtudiant.objects.all()
+    resumes_sessions = ResumePresenceSession.objects.all()
+    sessions = SessionCours.objects.all()
+    presences = Presence.objects.all()
+    if cours_ids is not None:
+        resumes_etudiants = resumes_etudiants.filter(cours_id__in=cours_ids)
+        resumes_sessions = resumes_sessions.filter(cours_id__in=cours_ids)
+        sessions = sessions.filter(cours_id__in=cours_ids)
+        presences = presences.filter(session__cours_id__in=cours_ids)
+
+    resumes_etudiants.delete()
+    resumes_sessions.delete()
+
+    par_etudiant, par_session = presences_archivees(cours_ids)
+    par_etudiant.update({
+        (ligne['session__cours_id'], ligne['etudiant_id']): ligne['nombre']
+        for ligne in presences.values('session__cours_id', 'etudiant_id').annotate(nombre=Count('id')).order_by()
+    })
+    etudiants = ResumePresenceEtudiant.objects.bulk_create(
+        [
+            ResumePresenceEtudiant(cours_id=cours_id, etudiant_id=etudiant_id, nb_presences=nombre)
+            for (cours_id, etudiant_id), nombre in par_etudiant.items()
+        ],
+        batch_size=1000,
+    )
+    sessions = ResumePresenceSession.objects.bulk_create(
+        [
+            ResumePresenceSession(session_id=ligne['id'], cours_id=ligne['cours_id'],
+                                  nb_presences=ligne['nombre'] + par_session[ligne['id']])
+            for ligne in sessions.values('id', 'cours_id').annotate(nombre=Count('presence')).order_by()
+        ],
+        batch_size=1000,
+    )
+    return len(etudiants), len(sessions)
+
+
+# --- Bilan par étudiant ---
+
+def _cle_bilan(etudiant_id):
+    return f'presence:bilan:{etudiant_id}'
+
+
+def invalider_bilans_etudiants(etudiant_ids):
+    """ Supprime le bilan en cache des étudiants donnés ; il sera recalculé à la prochaine visite. """
+    cache_presence().delete_many([_cle_bilan(etudiant_id) for etudiant_id in etudiant_ids])
+
+
+def invalider_bilans_cours(cours_id):
+    """ Invalide le bilan de tous les inscrits d'un cours (nouvelle session). """
+    inscrits = Cours.etudiants.through.objects.filter(cours_id=cours_id).values_list('etudiant_id', flat=True)
+    invalider_bilans_etudiants(list(inscrits))
+
+
+def bilan_etudiant(etudiant_id):
+    """
+    Bilan de l'étudiant : pour chaque cours suivi, séances, présences et
+    absences ; plus ses présences les plus récentes. L'historique détaillé
+    d'un cours est servi page par page par views.historique_cours_api.
+    Lu depuis le cache, ou calculé (calculer_bilan_etudiant) puis mis en cache.
+    """
+    bilan = cache_presence().get(_cle_bilan(etudiant_id))
+    if bilan is None:
+        bilan = calculer_bilan_etudiant(etudiant_id)
+        cache_presence().set(_cle_bilan(etudiant_id), bilan, DUREE_BILAN_ETUDIANT)
+    return bilan
+
+
+def calculer_bilan_etudiant(etudiant_id):
+    """ Calcule le bilan de l'étudiant en requêtes ensemblistes (une par type de donnée). """
+    nb_sessions = SessionCours.objects.filter(cours=OuterRef('pk')).order_by().values('cours').annotate(
+        nombre=Count('id')
+    ).values('nombre')
+    cours_suivis = Cours.objects.filter(etudiants=etudiant_id).select_related('enseignant__id').annotate(
+        total=Coalesce(Subquery(nb_sessions), 0),
+        resume_etudiant=FilteredRelation(
+            'resumepresenceetudiant', condition=Q(resumepresenceetudiant__etudiant_id=etudiant_id)
+        ),
+        present=Coalesce(F('resume_etudiant__nb_presences'), 0),
+    ).order_by('id')
+
+    cours = []
+    for c in cours_suivis:
+        cours.append({
+            'id': c.id,
+            'nom': c.nom,
+            'code': c.code,
+            'enseignant_nom': c.enseignant.id.nom,
+            'total': c.total,
+            'present': c.present,
+            'absent': max(c.total - c.present, 0),
+        })
+
+    recentes = Presence.objects.filter(etudiant_id=etudiant_id).order_by('-horodatage_scan').values_list(
+        'session__cours__nom', 'horodatage_scan'
+    )[:NB_PRESENCES_RECENTES]
+
+    return {
+        'cours': cours,
+        'recentes': [{'cours_nom': nom, 'horodatage_scan': horodatage} for nom, horodatage in recentes],
+    }
+
+
+# --- Tableau de bord enseignant ---
+
+def _cle_tableau(enseignant_id):
+    return f'presence:tableau:{enseignant_id}'
+
+
+def invalider_tableaux_enseignants(enseignant_ids):
+    """ Supprime le tableau de bord en cache des enseignants donnés. """
+    cache_presence().delete_many([_cle_tableau(enseignant_id) for enseignant_id in enseignant_ids])
+
+
+def tableau_enseignant(enseignant_id):
+    """
+    Cours de l'enseignant avec, pour chacun, l'ID de la session active (ou
+    None) et le nombre de présences du jour. Lu depuis le cache, ou calculé
+    puis mis en cache jusqu'à minuit au plus tard.
+    """
+    tableau = cache_presence().get(_cle_tableau(enseignant_id))
+    if tableau is None:
+        maintenant = timezone.localtime()
+        minuit = timezone.make_aware(
+            datetime.datetime.combine(maintenant.date() + datetime.timedelta(days=1), datetime.time.min)
+        )
+        tableau = calculer_tableau_enseignant(enseignant_id, maintenant)
+        duree = min(DUREE_TABLEAU_ENSEIGNANT, max(int((minuit - maintenant).total_seconds()), 1))
+        cache_presence().set(_cle_tableau(enseignant_id), tableau, duree)
+    return tableau
+
+
+def calculer_tableau_enseignant(enseignant_id, maintenant=None):
+    """ Calcule le tableau de bord en une requête (sous-requêtes corrélées par cours). """
+    maintenant = maintenant or timezone.localtime()
+    debut_journee = maintenant.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    session_active = SessionCours.objects.filter(cours=OuterRef('pk'), actif=True).order_by('-date_debut')
+    presences_du_jour = ResumePresenceSession.objects.filter(
+        cours=OuterRef('pk'), session__date_debut__gte=debut_journee
+    ).order_by().values('cours').annotate(total=Sum('nb_presences')).values('total')
+
+    cours = Cours.objects.filter(enseignant_id=enseignant_id).annotate(
+        session_en_cours_id=Subquery(session_active.values('id')[:1]),
+        presences_aujourdhui=Coalesce(Subquery(presences_du_jour), 0),
+    ).order_by('id').values('id', 'nom', 'code', 'session_en_cours_id', 'presences_aujourdhui')
+    return list(cours)
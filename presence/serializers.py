@@ -52,10 +52,11 @@ class CoursSerializer(serializers.ModelSerializer):
 class SessionCoursSerializer(serializers.ModelSerializer):
     class Meta:
         model = SessionCours
-        fields = '__all__'
+        # Empreinte binaire du jeton QR (presence.utils.empreinte_qr) : ni lisible ni fournie par le client
+        exclude = ['qr_empreinte']
 
 
 class PresenceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Presence
-        fields = '__all__'
\ No newline at end of file
+        exclude = ['qr_empreinte']
\ No newline at end of file
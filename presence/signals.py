@@ -0,0 +1,89 @@
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.db import transaction
+from django.dispatch import receiver
+
+from comptes.models import Etudiant
+
+from .models import Cours, SessionCours, Presence
+from .registry import invalider_index_inscrits, signaler_presences
+from .resumes import (
+    creer_resume_session, compter_presences, retirer_session_des_resumes, retirer_etudiant_des_resumes,
+    invalider_bilans_etudiants, invalider_bilans_cours, invalider_tableaux_enseignants
+)
+
+
+@receiver(m2m_changed, sender=Cours.etudiants.through)
+def inscriptions_modifiees(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Invalide l'index des inscrits des cours touchés par une modification
+    d'inscriptions (CoursForm côté cours, formulaires étudiant côté étudiant),
+    ainsi que le bilan des étudiants concernés.
+    """
+    if not reverse:
+        # instance est un Cours, pk_set contient des identifiants d'Etudiant
+        if action == 'pre_clear':
+            instance._etudiants_avant_clear = list(instance.etudiants.values_list('pk', flat=True))
+        elif action == 'post_clear':
+            invalider_index_inscrits([instance.pk])
+            invalider_bilans_etudiants(getattr(instance, '_etudiants_avant_clear', []))
+        elif action in ('post_add', 'post_remove'):
+            invalider_index_inscrits([instance.pk])
+            invalider_bilans_etudiants(pk_set)
+        return
+
+    # instance est un Etudiant, pk_set contient des identifiants de Cours
+    if action == 'pre_clear':
+        # Après un clear, pk_set est vide : on mémorise les cours concernés.
+        instance._cours_avant_clear = list(instance.cours_inscrits.values_list('id', flat=True))
+    elif action == 'post_clear':
+        invalider_index_inscrits(getattr(instance, '_cours_avant_clear', []))
+        invalider_bilans_etudiants([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        invalider_index_inscrits(pk_set)
+        invalider_bilans_etudiants([instance.pk])
+
+
+@receiver(post_save, sender=Presence)
+def presence_enregistree(sender, instance, created, **kwargs):
+    """
+    Tient à jour les résumés et prévient le flux de suivi en direct pour les
+    présences écrites hors de l'ingestion par lots (API REST, admin).
+    """
+    if created:
+        compter_presences([(instance.session_id, instance.etudiant_id)])
+    signaler_presences([instance.session_id])
+
+
+@receiver(pre_delete, sender=SessionCours)
+def session_supprimee(sender, instance, origin=None, **kwargs):
+    """
+    Retire les présences de la session des résumés, avant leur suppression
+    en cascade. Pas de signal sur Presence : il empêcherait Django de les
+    supprimer en un seul DELETE.
+    """
+    if isinstance(origin, Cours) or getattr(origin, 'model', None) is Cours:
+        # Les résumés du cours sont supprimés avec lui
+        return
+    retirer_session_des_resumes(instance)
+
+
+@receiver(pre_delete, sender=Etudiant)
+def etudiant_supprime(sender, instance, **kwargs):
+    """ Retire les présences de l'étudiant des résumés de session, avant leur suppression en cascade. """
+    retirer_etudiant_des_resumes(instance.pk)
+
+
+@receiver(post_save, sender=SessionCours)
+def session_creee(sender, instance, created, **kwargs):
+    if created:
+        creer_resume_session(instance)
+        # Une séance de plus pour chaque inscrit : leur bilan change.
+        cours_id = instance.cours_id
+        transaction.on_commit(lambda: invalider_bilans_cours(cours_id))
+
+
+@receiver(post_save, sender=Cours)
+@receiver(post_delete, sender=Cours)
+def cours_modifie(sender, instance, **kwargs):
+    """ Le tableau de bord de l'enseignant liste ses cours : il est recalculé. """
+    invalider_tableaux_enseignants([instance.enseignant_id])
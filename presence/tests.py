@@ -1,3 +1,1484 @@
-from django.test import TestCase
+"""
+Tests de l'application presence.
 
-# Create your tests here.
+Scénarios fonctionnels (ScenarioTests et ses sous-classes) : un cours, deux
+étudiants inscrits et un non inscrit ; les scans passent par l'API.
+
+Non-régression des plans d'exécution (PlansRequetesTests) :
+
+Les vues principales sont appelées sur un jeu de données volumineux
+(40 cours, 1500 étudiants, 800 séances, ~100 000 présences). Chaque requête
+SELECT qui lit la table presence est passée à EXPLAIN : le test échoue si le
+plan la parcourt séquentiellement (Seq Scan sous PostgreSQL, SCAN sous
+SQLite), signe qu'un index manque ou n'est plus utilisable.
+
+Le peuplement prend quelques secondes ; pour lancer les autres tests sans
+eux : python manage.py test --exclude-tag plans
+
+Les tests du routage vers la réplique (presence/replica.py) demandent deux
+alias de base : DB_REPLICA=True python manage.py test --tag replica
+"""
+import asyncio
+import csv
+import datetime
+import functools
+import io
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import Counter
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+from pypdf import PdfReader
+from rest_framework_simplejwt.tokens import AccessToken
+
+from comptes.models import Utilisateur, Departement, Administrateur, Enseignant, Etudiant, Formation
+from presence_projet import connexions
+from . import archives, flux, ingestion, partitions, rapports, rendu_pdf, views_async
+from .checks import cache_presence_partage
+from .exports import ENTETES_EXPORT, compresser_gzip
+from .ingestion import IngestionPresences, DUREE_INACTIVITE_VUS
+from .models import Cours, SessionCours, Presence, ResumePresenceEtudiant, ResumePresenceSession
+from .registry import get_session_active, DUREE_MAX_ENTREE_SESSION, _duree_validite
+from .rendu_pdf import ErreurRendu
+from .resumes import bilan_etudiant, reconstruire_resumes, tableau_enseignant
+from .utils import (
+    jeton_courant, jeton_session, empreinte_qr, valider_jeton_qr, cache_jetons, statistiques_cache_jetons, rendre_qr
+)
+from .views import DELAI_RAPPORT_EN_COURS, demarrer_session
+
+TABLE_SURVEILLEE = 'presence'
+
+NB_COURS = 40
+NB_ETUDIANTS = 1500
+INSCRITS_PAR_COURS = 150
+SEANCES_PAR_COURS = 20
+TAUX_PRESENCE = 0.8
+
+
+def _noeuds(plan):
+    yield plan
+    for enfant in plan.get('Plans', []):
+        yield from _noeuds(enfant)
+
+
+def balayages_sequentiels(sql):
+    """ Tables parcourues séquentiellement dans le plan de la requête. """
+    with connection.cursor() as curseur:
+        if connection.vendor == 'postgresql':
+            curseur.execute('EXPLAIN (FORMAT JSON) ' + sql)
+            plan = curseur.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            tables = {
+                noeud.get('Relation Name') for noeud in _noeuds(plan[0]['Plan']) if noeud['Node Type'] == 'Seq Scan'
+            }
+            # Table partitionnée (presence.partitions) : une partition compte pour sa table parente
+            curseur.execute(
+                'SELECT relname, COALESCE(pg_partition_root(oid), oid)::regclass::text FROM pg_class WHERE relname = ANY(%s)',
+                [list(tables)],
+            )
+            return {racine for _, racine in curseur.fetchall()}
+        # SQLite : « SCAN presence » (ou « SCAN U0 », alias de la table) sans index
+        curseur.execute('EXPLAIN QUERY PLAN ' + sql)
+        alias = {alias: table for table, alias in re.findall(r'"(\w+)" (\w+)', sql)}
+        return {
+            alias.get(balayage.group(1), balayage.group(1))
+            for *_, detail in curseur.fetchall() if (balayage := re.fullmatch(r'SCAN (\w+)', detail))
+        }
+
+
+@tag('plans')
+# Lectures sur le primaire : les requêtes capturées sont celles de `connection`
+@override_settings(PRESENCE_INGESTION={'ASYNC': False}, PRESENCE_REPLICA={'ALIAS': None})
+class PlansRequetesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        aleatoire = random.Random(2024)
+        departement = Departement.objects.create(code='INFO', nom='Informatique')
+        formation = Formation.objects.create(nom='Génie Logiciel', departement=departement)
+        mot_de_passe = make_password('plans')
+
+        def utilisateur(nom, role):
+            return Utilisateur(username=f'{nom}@plans.local', email=f'{nom}@plans.local', password=mot_de_passe,
+                               nom=nom, prenom='Test', role=role)
+
+        compte_admin = utilisateur('admin', 'admin')
+        compte_admin.save()
+        admin = Administrateur.objects.create(id=compte_admin)
+        enseignants = []
+        for i in range(4):
+            compte = utilisateur(f'enseignant{i}', 'enseignant')
+            compte.save()
+            enseignants.append(Enseignant.objects.create(id=compte, departement=departement))
+
+        comptes = Utilisateur.objects.bulk_create(
+            [utilisateur(f'etudiant{i}', 'etudiant') for i in range(NB_ETUDIANTS)]
+        )
+        if comptes[0].pk is None:
+            comptes = list(Utilisateur.objects.filter(role='etudiant').order_by('id'))
+        Etudiant.objects.bulk_create([Etudiant(id=compte, formation=formation) for compte in comptes])
+        etudiant_ids = [compte.pk for compte in comptes]
+
+        cours = Cours.objects.bulk_create([
+            Cours(nom=f'Cours {i}', code=f'C{i:03d}', semestre_cible=f'S{i % 6 + 1}',
+                  enseignant=enseignants[i % len(enseignants)], cree_par=admin)
+            for i in range(NB_COURS)
+        ])
+        if cours[0].pk is None:
+            cours = list(Cours.objects.order_by('id'))
+
+        inscriptions = {c.pk: aleatoire.sample(etudiant_ids, INSCRITS_PAR_COURS) for c in cours}
+        Cours.etudiants.through.objects.bulk_create([
+            Cours.etudiants.through(cours_id=cours_id, etudiant_id=etudiant_id)
+            for cours_id, inscrits in inscriptions.items() for etudiant_id in inscrits
+        ])
+
+        SessionCours.objects.bulk_create([
+            SessionCours(cours=c, enseignant_id=c.enseignant_id, actif=False)
+            for c in cours for _ in range(SEANCES_PAR_COURS)
+        ])
+        presences = [
+            Presence(session_id=session_id, etudiant_id=etudiant_id, qr_empreinte=empreinte_qr('plans'))
+            for session_id, cours_id in SessionCours.objects.order_by('id').values_list('id', 'cours_id')
+            for etudiant_id in inscriptions[cours_id] if aleatoire.random() < TAUX_PRESENCE
+        ]
+        Presence.objects.bulk_create(presences, batch_size=5000)
+        reconstruire_resumes()
+
+        cls.cours = cours[0]
+        cls.enseignant = cls.cours.enseignant
+        cls.etudiant = Utilisateur.objects.get(pk=inscriptions[cls.cours.pk][0])
+        cls.session = SessionCours.objects.filter(cours=cls.cours).order_by('id').last()
+
+        with connection.cursor() as curseur:
+            curseur.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+
+    def verifier_plans(self, requete, lecture_attendue=True):
+        """
+        Exécute la requête HTTP et vérifie le plan de chaque SELECT lisant la
+        table surveillée (lecture_attendue : la vue doit en faire au moins un).
+        """
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = requete()
+        self.assertLess(reponse.status_code, 400, getattr(reponse, 'content', b'')[:500])
+
+        lectures = [
+            q['sql'] for q in requetes.captured_queries
+            if q['sql'].lstrip().upper().startswith('SELECT') and f'"{TABLE_SURVEILLEE}"' in q['sql']
+        ]
+        if lecture_attendue:
+            self.assertTrue(lectures, f"Aucune lecture de {TABLE_SURVEILLEE} : le test ne vérifie rien.")
+        for sql in lectures:
+            with self.subTest(sql=sql[:200]):
+                self.assertNotIn(TABLE_SURVEILLEE, balayages_sequentiels(sql), f"Balayage séquentiel :\n{sql}")
+        return reponse
+
+    def connecter(self, compte):
+        self.client.force_login(compte)
+
+    # --- Étudiant ---
+
+    def test_scanner_etudiant(self):
+        self.connecter(self.etudiant)
+        self.verifier_plans(lambda: self.client.get(reverse('scanner')))
+
+    def test_historique_cours(self):
+        self.connecter(self.etudiant)
+        self.verifier_plans(lambda: self.client.get(reverse('historique_cours_api', args=[self.cours.pk])))
+
+    def test_valider_scan(self):
+        session = demarrer_session(self.cours, self.enseignant)
+        jeton = jeton_courant(session.id, jeton_session(session))
+        acces = str(AccessToken.for_user(self.etudiant))
+        reponse = self.verifier_plans(lambda: self.client.post(
+            reverse('valider_scan'), {'jeton': jeton}, content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {acces}',
+        ))
+        self.assertTrue(reponse.json()['success'])
+
+    # --- Enseignant ---
+
+    def test_cours_statistiques(self):
+        # Les statistiques lisent les résumés de présence, pas la table presence.
+        self.connecter(self.enseignant.id)
+        self.verifier_plans(lambda: self.client.get(reverse('cours_stats', args=[self.cours.pk])), lecture_attendue=False)
+
+    def test_tableau_de_bord(self):
+        self.connecter(self.enseignant.id)
+        self.verifier_plans(lambda: self.client.get(reverse('dashboard_enseignant')), lecture_attendue=False)
+
+    def test_presences_session(self):
+        self.connecter(self.enseignant.id)
+        url = reverse('get_presences_api', args=[self.session.pk])
+        self.verifier_plans(lambda: self.client.get(url))
+        self.verifier_plans(lambda: self.client.get(url, {'since': '2000-01-01T00:00:00'}))
+
+    def test_analyse_cours(self):
+        self.connecter(self.enseignant.id)
+        self.verifier_plans(lambda: self.client.get(reverse('analytics_api', args=['cours', self.cours.pk])))
+
+    def test_feuille_presence(self):
+        repertoire = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, repertoire, ignore_errors=True)
+        self.enterContext(self.settings(
+            PRESENCE_RAPPORTS={'ASYNC': False, 'REPERTOIRE': repertoire, 'MOTEUR': 'reportlab'}
+        ))
+        # Magasin recréé avec les réglages du test
+        rapports._magasin = None
+        self.addCleanup(setattr, rapports, '_magasin', None)
+        self.connecter(self.enseignant.id)
+        self.verifier_plans(lambda: self.client.get(reverse('session_pdf', args=[self.session.pk])))
+
+
+# --- Scénarios fonctionnels ---
+
+def jeu_scenario(cible):
+    """ Un cours de l'enseignant, deux étudiants inscrits (etudiants[0:2]) et un non inscrit. """
+    departement = Departement.objects.create(code='INFO', nom='Informatique')
+    formation = Formation.objects.create(nom='Génie Logiciel', departement=departement)
+    mot_de_passe = make_password('scenario')
+
+    def compte(nom, role):
+        return Utilisateur.objects.create(username=f'{nom}@scenario.local', email=f'{nom}@scenario.local',
+                                          password=mot_de_passe, nom=nom, prenom='Test', role=role)
+
+    cible.admin = Administrateur.objects.create(id=compte('admin', 'admin'))
+    cible.enseignant = Enseignant.objects.create(id=compte('enseignant', 'enseignant'), departement=departement)
+    cible.etudiants = [
+        Etudiant.objects.create(id=compte(f'etudiant{i}', 'etudiant'), formation=formation) for i in range(3)
+    ]
+    cible.cours = Cours.objects.create(nom='Algorithmique', code='ALG', semestre_cible='S1',
+                                       enseignant=cible.enseignant, cree_par=cible.admin)
+    cible.cours.etudiants.add(*cible.etudiants[:2])
+
+
+@override_settings(PRESENCE_INGESTION={'ASYNC': False}, PRESENCE_REPLICA={'ALIAS': None})
+class ScenarioTests(TestCase):
+    """ Petit jeu de données commun ; les scans passent par valider_scan avec un jeton d'accès JWT. """
+
+    @classmethod
+    def setUpTestData(cls):
+        jeu_scenario(cls)
+
+    def setUp(self):
+        cache.clear()
+        cache_jetons.vider()
+        # Instance d'ingestion recréée avec les réglages du test
+        ingestion._ingestion = None
+        self.addCleanup(setattr, ingestion, '_ingestion', None)
+        self.client.force_login(self.enseignant.id)
+
+    def lancer_session(self):
+        return demarrer_session(self.cours, self.enseignant)
+
+    def poster_scan(self, etudiant, corps):
+        return self.client.post(reverse('valider_scan'), json.dumps(corps), content_type='application/json',
+                                HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(etudiant.id)}')
+
+    def scanner(self, etudiant, jeton):
+        reponse = self.poster_scan(etudiant, {'jeton': jeton})
+        self.assertEqual(reponse.status_code, 200)
+        return reponse.json()
+
+
+class ScansTests(ScenarioTests):
+    """ Scans refusés ou déjà enregistrés, vus par valider_scan. """
+
+    def test_scan_apres_arret_refuse(self):
+        session = self.lancer_session()
+        jeton = jeton_session(session)
+        self.assertTrue(self.scanner(self.etudiants[0], jeton)['success'])
+        self.client.get(reverse('arreter_session', args=[session.pk]))
+        reponse = self.scanner(self.etudiants[1], jeton)
+        self.assertFalse(reponse['success'])
+        self.assertIn('terminée', reponse['message'])
+        self.assertEqual(list(Presence.objects.values_list('etudiant_id', flat=True)), [self.etudiants[0].pk])
+
+    def test_etudiant_non_inscrit_refuse(self):
+        session = self.lancer_session()
+        reponse = self.scanner(self.etudiants[2], jeton_session(session))
+        self.assertFalse(reponse['success'])
+        self.assertIn('pas inscrit', reponse['message'])
+        self.assertFalse(Presence.objects.exists())
+        # L'index des inscrits suit les inscriptions faites pendant la session
+        self.cours.etudiants.add(self.etudiants[2])
+        self.assertTrue(self.scanner(self.etudiants[2], jeton_session(session))['success'])
+
+    def test_double_scan_compte_une_fois(self):
+        session = self.lancer_session()
+        jeton = jeton_session(session)
+        self.assertTrue(self.scanner(self.etudiants[0], jeton)['success'])
+        reponse = self.scanner(self.etudiants[0], jeton)
+        self.assertFalse(reponse['success'])
+        self.assertIn('déjà enregistrée', reponse['message'])
+        self.assertEqual(Presence.objects.filter(session=session).count(), 1)
+        self.assertEqual(ResumePresenceSession.objects.get(session=session).nb_presences, 1)
+        self.assertEqual(ResumePresenceEtudiant.objects.get(etudiant=self.etudiants[0]).nb_presences, 1)
+
+
+class HistoriqueTests(ScenarioTests):
+
+    def test_pages_couvrent_chaque_seance_une_fois(self):
+        debut = timezone.now() - datetime.timedelta(days=30)
+        attendu = Counter()
+        for i in range(25):
+            session = SessionCours.objects.create(cours=self.cours, enseignant=self.enseignant, actif=False)
+            # Trois séances par date : la pagination départage par id
+            date_debut = debut + datetime.timedelta(days=i // 3)
+            SessionCours.objects.filter(pk=session.pk).update(date_debut=date_debut)
+            if i % 2:
+                Presence.objects.create(session=session, etudiant=self.etudiants[0], qr_empreinte=b'x')
+            statut = 'Présent' if i % 2 else 'Absent'
+            attendu[date_debut.strftime('%d/%m/%Y'), date_debut.strftime('%H:%M'), statut] += 1
+
+        url = reverse('historique_cours_api', args=[self.cours.pk])
+        entetes = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.etudiants[0].id)}'}
+        lignes, pages, parametres = Counter(), 0, {'limite': 7}
+        while True:
+            donnees = self.client.get(url, parametres, **entetes).json()
+            pages += 1
+            lignes.update((ligne['date'], ligne['heure'], ligne['statut']) for ligne in donnees['historique'])
+            if donnees['suivant'] is None:
+                break
+            parametres['curseur'] = donnees['suivant']
+        self.assertEqual(pages, 4)
+        self.assertEqual(lignes, attendu)
+
+
+class JetonsQrTests(ScenarioTests):
+
+    def test_jeton_valide(self):
+        session = self.lancer_session()
+        self.assertEqual(valider_jeton_qr(jeton_session(session))['session_id'], session.pk)
+        self.assertTrue(self.scanner(self.etudiants[0], jeton_session(session))['success'])
+
+    def test_jeton_qui_n_est_pas_une_chaine(self):
+        self.lancer_session()
+        for jeton in (123, ['P:1:2:3'], {'jeton': 'x'}, True):
+            with self.subTest(jeton=jeton):
+                self.assertIsNone(valider_jeton_qr(jeton))
+                self.assertFalse(self.scanner(self.etudiants[0], jeton)['success'])
+
+    def test_corps_qui_n_est_pas_un_objet(self):
+        self.lancer_session()
+        reponse = self.poster_scan(self.etudiants[0], ['jeton'])
+        self.assertEqual(reponse.status_code, 200)
+        self.assertFalse(reponse.json()['success'])
+
+    def test_jetons_refuses_n_evincent_pas_les_valides(self):
+        jeton = jeton_session(self.lancer_session())
+        valider_jeton_qr(jeton)
+        for i in range(2000):
+            self.assertIsNone(valider_jeton_qr(f'invalide-{i}'))
+        hits = statistiques_cache_jetons()['hits']
+        valider_jeton_qr(jeton)
+        self.assertEqual(statistiques_cache_jetons()['hits'], hits + 1)
+
+    def test_jeton_qui_ne_se_reencode_plus(self):
+        session = self.lancer_session()
+        jeton = jeton_session(session)
+        # Contenu du JWT changé par une nouvelle version : le jeton stocké ne se réencode plus
+        with mock.patch('presence.utils._encoder_jeton', return_value='jeton-nouveau-format'):
+            cache.clear()
+            self.assertIsNone(jeton_session(session))
+            # Le scan est validé sur l'empreinte du jeton affiché
+            self.assertTrue(self.scanner(self.etudiants[0], jeton)['success'])
+            # La page de la session émet un nouveau jeton
+            reponse = self.client.get(reverse('session_detail', args=[session.pk]))
+            self.assertTrue(reponse.context['qr_image_url'])
+        session.refresh_from_db()
+        self.assertEqual(bytes(session.qr_empreinte), empreinte_qr('jeton-nouveau-format'))
+
+    def test_rafraichir_sans_rendu_base64(self):
+        session = self.lancer_session()
+        rendre_qr.cache_clear()
+        donnees = self.client.get(reverse('rafraichir_qr', args=[session.pk])).json()
+        self.assertEqual(list(donnees), ['qr_image_url'])
+        self.assertEqual(rendre_qr.cache_info().misses, 0)
+
+        donnees = self.client.get(reverse('rafraichir_qr', args=[session.pk]), {'base64': '1'}).json()
+        self.assertIn('qr_image_base64', donnees)
+        # L'image servie par l'URL est le même rendu, déjà en cache
+        self.assertEqual(self.client.get(donnees['qr_image_url']).status_code, 200)
+        self.assertEqual(rendre_qr.cache_info().misses, 1)
+
+
+class RegistreTests(ScenarioTests):
+
+    def test_arret_vu_par_un_autre_worker(self):
+        session = self.lancer_session()
+        # Arrêt traité par un autre processus : le registre de celui-ci n'est pas prévenu
+        SessionCours.objects.filter(pk=session.pk).update(actif=False)
+        self.assertIsNotNone(get_session_active(session.pk))
+        plus_tard = time.time() + DUREE_MAX_ENTREE_SESSION + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=plus_tard):
+            self.assertIsNone(get_session_active(session.pk))
+
+    @override_settings(QR_TOKEN_MODE='compact', QR_COMPACT_FENETRE_SECONDES=5)
+    def test_entree_compacte_bornee(self):
+        self.assertEqual(_duree_validite(None), 20)
+
+    @override_settings(DEBUG=False, CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_avertissement_cache_local(self):
+        self.assertEqual([alerte.id for alerte in cache_presence_partage(None)], ['presence.W001'])
+        with self.settings(DEBUG=True):
+            self.assertEqual(cache_presence_partage(None), [])
+
+
+@override_settings(QR_TOKEN_MODE='compact')
+class JetonsCompactsTests(ScenarioTests):
+
+    def rafraichir(self, session):
+        return self.client.get(reverse('rafraichir_qr', args=[session.pk]))
+
+    def test_rafraichir_sans_ecriture(self):
+        session = self.lancer_session()
+        cache.clear()  # registre vide : autre processus, redémarrage
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.rafraichir(session)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual([q['sql'] for q in requetes if not q['sql'].startswith('SELECT')], [])
+        session.refresh_from_db()
+        self.assertIsNone(session.qr_empreinte)
+
+    def test_rafraichir_session_terminee(self):
+        session = self.lancer_session()
+        SessionCours.objects.filter(pk=session.pk).update(actif=False)
+        cache.clear()
+        self.assertEqual(self.rafraichir(session).status_code, 400)
+        session.refresh_from_db()
+        self.assertIsNone(session.qr_empreinte)
+
+    def test_rafraichir_session_d_un_autre_enseignant(self):
+        session = self.lancer_session()
+        self.client.force_login(self.admin.id)
+        self.assertIn(self.rafraichir(session).status_code, (403, 404))
+
+
+class ApiGestionTests(ScenarioTests):
+    """ API de gestion (administrateurs) : l'empreinte des jetons QR n'est ni exposée ni demandée. """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin.id)
+
+    def envoyer(self, methode, url, donnees):
+        return getattr(self.client, methode)(url, json.dumps(donnees), content_type='application/json')
+
+    def test_creer_et_modifier_une_session(self):
+        reponse = self.envoyer('post', reverse('api-session-list'), {
+            'cours': self.cours.pk, 'enseignant': self.enseignant.pk, 'actif': False,
+        })
+        self.assertEqual(reponse.status_code, 201, reponse.content)
+        self.assertNotIn('qr_empreinte', reponse.json())
+        url = reverse('api-session-detail', args=[reponse.json()['id']])
+        reponse = self.envoyer('put', url, {'cours': self.cours.pk, 'enseignant': self.enseignant.pk, 'actif': True})
+        self.assertEqual(reponse.status_code, 200, reponse.content)
+        self.assertTrue(SessionCours.objects.get(pk=reponse.json()['id']).actif)
+
+    def test_creer_et_modifier_une_presence(self):
+        session = self.lancer_session()
+        self.scanner(self.etudiants[1], jeton_session(session))
+        reponse = self.envoyer('post', reverse('api-presence-list'), {
+            'session': session.pk, 'etudiant': self.etudiants[0].pk,
+        })
+        self.assertEqual(reponse.status_code, 201, reponse.content)
+        url = reverse('api-presence-detail', args=[reponse.json()['id']])
+        reponse = self.envoyer('put', url, {'session': session.pk, 'etudiant': self.etudiants[0].pk, 'valide': False})
+        self.assertEqual(reponse.status_code, 200, reponse.content)
+        self.assertFalse(Presence.objects.get(pk=reponse.json()['id']).valide)
+        # Liste avec une présence scannée : l'empreinte binaire n'est pas sérialisée
+        reponse = self.client.get(reverse('api-presence-list'))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertTrue(all('qr_empreinte' not in presence for presence in reponse.json()))
+
+
+class PresencesApiTests(ScenarioTests):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.lancer_session()
+        self.url = reverse('get_presences_api', args=[self.session.pk])
+
+    def test_304_si_rien_de_nouveau(self):
+        Presence.objects.create(session=self.session, etudiant=self.etudiants[0], qr_empreinte=b'x')
+        reponse = self.client.get(self.url)
+        self.assertEqual(len(reponse.json()['presences']), 1)
+        # Le curseur avance, l'ETag reste valable tant qu'aucun scan n'arrive
+        suivante = self.client.get(self.url, {'since': reponse.json()['curseur']}, HTTP_IF_NONE_MATCH=reponse['ETag'])
+        self.assertEqual(suivante.status_code, 304)
+
+        Presence.objects.create(session=self.session, etudiant=self.etudiants[1], qr_empreinte=b'x')
+        suivante = self.client.get(self.url, {'since': reponse.json()['curseur']}, HTTP_IF_NONE_MATCH=reponse['ETag'])
+        self.assertEqual(suivante.status_code, 200)
+        self.assertEqual([p['id'] for p in suivante.json()['presences']], [suivante.json()['curseur']])
+
+    def test_since_invalide(self):
+        for since in ('2025-02-30T10:00:00', '2025-13-01T00:00:00', 'hier'):
+            with self.subTest(since=since):
+                self.assertEqual(self.client.get(self.url, {'since': since}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'since': '2025-02-28T10:00:00'}).status_code, 200)
+
+
+class FluxTests(ScenarioTests):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.lancer_session()
+
+    def test_presence_validee_apres_une_plus_recente(self):
+        premiere, seconde = (
+            Presence.objects.create(session=self.session, etudiant=etudiant, qr_empreinte=b'x')
+            for etudiant in self.etudiants[:2]
+        )
+        # Le flux a déjà envoyé la seconde ; la première, d'id inférieur, n'était pas encore visible
+        etat = flux._EtatFlux(self.session.pk, seconde.pk)
+        etat.envoyees[seconde.pk] = seconde.horodatage_scan
+        evenements = etat.evenements(list(etat.requete()))
+        self.assertIn(f'id: {premiere.pk}\n', evenements)
+        self.assertNotIn(f'id: {seconde.pk}\n', evenements)
+        self.assertEqual(etat.curseur, seconde.pk)
+        self.assertEqual(etat.evenements(list(etat.requete())), '')
+
+    def test_flux_synchrones_limites(self):
+        url = reverse('presences_flux', args=[self.session.pk])
+        with mock.patch.object(flux, 'FLUX_SYNCHRONES_MAX', 1):
+            premier = self.client.get(url)
+            self.assertEqual(premier.status_code, 200)
+            self.assertEqual(self.client.get(url).status_code, 503)
+            self.fermer(premier)
+            self.fermer(self.client.get(url))
+
+    def fermer(self, reponse):
+        """ Fin de la réponse, sans fermer la connexion de la transaction du test (comme le client de test). """
+        request_finished.disconnect(close_old_connections)
+        try:
+            reponse.close()
+        finally:
+            request_finished.connect(close_old_connections)
+
+    def test_page_sans_flux_sous_wsgi(self):
+        reponse = self.client.get(reverse('session_detail', args=[self.session.pk]))
+        self.assertContains(reponse, 'data-presences-url')
+        self.assertNotContains(reponse, 'data-flux-url')
+
+
+def hors_boucle(methode):
+    """ Méthode synchrone du cache qui échoue si elle est appelée dans la boucle d'événements. """
+    @functools.wraps(methode)
+    def appel(*args, **kwargs):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return methode(*args, **kwargs)
+        raise AssertionError(f"cache.{methode.__name__}() bloquant dans la boucle d'événements")
+    return appel
+
+
+# URLs de VuesAsynchronesTests : les vues de views_async aux adresses de leurs équivalents synchrones
+urlpatterns = [
+    path('api/valider-scan/', views_async.valider_scan, name='valider_scan'),
+    path('api/session/<int:session_id>/refresh-qr/', views_async.rafraichir_qr, name='rafraichir_qr'),
+    path('api/session/<int:session_id>/get-presences/', views_async.get_presences_api, name='get_presences_api'),
+    path('api/session/<int:session_id>/presences/flux/', views_async.presences_flux, name='presences_flux'),
+    path('', include('presence_projet.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__, PRESENCE_VUES_ASYNC=True)
+class VuesAsynchronesTests(ScenarioTests):
+    """
+    Vues de views_async (mode ASGI) par le client asynchrone. Le cache n'est
+    utilisé que par son API asynchrone : un appel synchrone dans la boucle
+    d'événements fait échouer le test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.lancer_session()
+        self.jeton = jeton_session(self.session)
+        self.async_client.force_login(self.enseignant.id)
+        cache.clear()  # registre et index relus en base par les vues asynchrones
+        for nom in ('get', 'set', 'add', 'get_many', 'set_many', 'delete_many'):
+            self.enterContext(mock.patch.object(LocMemCache, nom, hors_boucle(getattr(LocMemCache, nom))))
+
+    @staticmethod
+    def entetes(utilisateur):
+        return {'Authorization': f'Bearer {AccessToken.for_user(utilisateur.id)}'}
+
+    async def ascanner(self, jeton, entetes):
+        return await self.async_client.post(reverse('valider_scan'), json.dumps({'jeton': jeton}),
+                                            content_type='application/json', headers=entetes)
+
+    async def arreter(self):
+        await sync_to_async(self.client.force_login)(self.enseignant.id)
+        await sync_to_async(self.client.get)(reverse('arreter_session', args=[self.session.pk]))
+
+    async def test_scan(self):
+        reponse = await self.ascanner(self.jeton, self.entetes(self.etudiants[0]))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertTrue(reponse.json()['success'])
+        self.assertFalse((await self.ascanner(self.jeton, self.entetes(self.etudiants[0]))).json()['success'])
+        self.assertEqual(await Presence.objects.filter(session=self.session).acount(), 1)
+
+    async def test_scan_refuse(self):
+        # Sans jeton d'accès (la session Django ne suffit pas), ou avec celui d'un enseignant
+        self.assertEqual((await self.ascanner(self.jeton, {})).status_code, 401)
+        self.assertEqual((await self.ascanner(self.jeton, {'Authorization': 'Bearer invalide'})).status_code, 401)
+        self.assertEqual((await self.ascanner(self.jeton, self.entetes(self.enseignant))).status_code, 403)
+
+        reponse = await self.ascanner(self.jeton, self.entetes(self.etudiants[2]))
+        self.assertIn('pas inscrit', reponse.json()['message'])
+
+        await self.arreter()
+        reponse = await self.ascanner(self.jeton, self.entetes(self.etudiants[0]))
+        self.assertIn('terminée', reponse.json()['message'])
+        self.assertFalse(await Presence.objects.aexists())
+
+    async def test_rafraichir(self):
+        url = reverse('rafraichir_qr', args=[self.session.pk])
+        reponse = await self.async_client.get(url)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(list(reponse.json()), ['qr_image_url'])
+        # Le nouveau jeton remplace l'ancien dans le registre
+        reponse = await self.ascanner(self.jeton, self.entetes(self.etudiants[0]))
+        self.assertIn('périmé', reponse.json()['message'])
+
+        await self.async_client.alogout()
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        self.assertEqual((await self.async_client.get(url, headers=self.entetes(self.etudiants[0]))).status_code, 403)
+        await self.arreter()
+        self.assertEqual((await self.async_client.get(url, headers=self.entetes(self.enseignant))).status_code, 400)
+
+    async def test_presences(self):
+        url = reverse('get_presences_api', args=[self.session.pk])
+        await self.ascanner(self.jeton, self.entetes(self.etudiants[0]))
+        reponse = await self.async_client.get(url)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(len(reponse.json()['presences']), 1)
+        suivante = await self.async_client.get(url, headers={'If-None-Match': reponse['ETag']})
+        self.assertEqual(suivante.status_code, 304)
+
+        await self.async_client.alogout()
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        self.assertEqual((await self.async_client.get(url, headers=self.entetes(self.etudiants[0]))).status_code, 403)
+
+    async def test_flux(self):
+        url = reverse('presences_flux', args=[self.session.pk])
+        await self.ascanner(self.jeton, self.entetes(self.etudiants[0]))
+        await self.arreter()
+        reponse = await self.async_client.get(url)
+        self.assertEqual(reponse['Content-Type'], 'text/event-stream')
+        morceaux = [morceau.decode() async for morceau in reponse.streaming_content]
+        # Session arrêtée : la présence déjà enregistrée, puis la fin du flux
+        self.assertTrue(morceaux[0].startswith('retry:'))
+        self.assertIn('event: presence', ''.join(morceaux))
+        self.assertEqual(morceaux[-1], flux.EVENEMENT_FIN)
+
+        await self.async_client.alogout()
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        self.assertEqual((await self.async_client.get(url, headers=self.entetes(self.etudiants[0]))).status_code, 403)
+
+
+class AnalyseTests(ScenarioTests):
+    """ Indicateurs de analytics_api sur quatre séances, chiffres calculés à la main. """
+
+    # Présences de etudiants[0] et etudiants[1] aux séances, dans l'ordre chronologique
+    GRILLE = ((True, False, False, True), (True, False, False, False))
+
+    def setUp(self):
+        super().setUp()
+        debut = timezone.now() - datetime.timedelta(days=10)
+        self.sessions = []
+        for jour in range(4):
+            session = SessionCours.objects.create(cours=self.cours, enseignant=self.enseignant, actif=False)
+            SessionCours.objects.filter(pk=session.pk).update(date_debut=debut + datetime.timedelta(days=jour))
+            self.sessions.append(session)
+        for etudiant, ligne in zip(self.etudiants, self.GRILLE):
+            for session, present in zip(self.sessions, ligne):
+                if present:
+                    Presence.objects.create(session=session, etudiant=etudiant, qr_empreinte=b'x')
+        self.client.force_login(self.admin.id)
+
+    def analyser(self, portee, identifiant, **parametres):
+        return self.client.get(reverse('analytics_api', args=[portee, identifiant]), parametres)
+
+    def test_indicateurs_du_cours(self):
+        resume = self.analyser('cours', self.cours.pk, seuil='0.6').json()
+        self.assertEqual((resume['nb_etudiants'], resume['nb_sessions']), (2, 4))
+        self.assertEqual(resume['taux_global'], 0.375)
+        self.assertEqual(resume['taux_moyen_etudiants'], 0.375)
+        self.assertEqual([s['taux'] for s in resume['remplissage_sessions']], [1.0, 0.0, 0.0, 0.5])
+        self.assertEqual([s['session_id'] for s in resume['remplissage_sessions']], [s.pk for s in self.sessions])
+        self.assertEqual(
+            [(e['etudiant_id'], e['taux'], e['plus_longue_serie_absences'], e['serie_absences_en_cours'])
+             for e in resume['etudiants_a_risque']],
+            [(self.etudiants[1].pk, 0.25, 3, 3), (self.etudiants[0].pk, 0.5, 2, 0)],
+        )
+
+    def test_seuil(self):
+        resume = self.analyser('cours', self.cours.pk, seuil='0.3').json()
+        self.assertEqual([e['etudiant_id'] for e in resume['etudiants_a_risque']], [self.etudiants[1].pk])
+
+    def test_departement_par_code(self):
+        resume = self.analyser('departement', 'INFO').json()
+        self.assertEqual((resume['nb_etudiants'], resume['nb_sessions']), (2, 4))
+
+    def test_identifiant_invalide(self):
+        self.assertEqual(self.analyser('cours', 'abc').status_code, 400)
+        self.assertEqual(self.analyser('formation', 'abc').status_code, 400)
+        self.assertEqual(self.analyser('inconnu', '1').status_code, 404)
+
+
+class RapportsEnLotTests(ScenarioTests):
+
+    def setUp(self):
+        super().setUp()
+        repertoire = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, repertoire, ignore_errors=True)
+        self.enterContext(self.settings(
+            PRESENCE_RAPPORTS={'ASYNC': False, 'REPERTOIRE': repertoire, 'MOTEUR': 'reportlab', 'PROCESSUS': 1}
+        ))
+        # Magasin recréé avec les réglages du test, pool de processus arrêté à la fin
+        rapports._magasin = None
+        self.addCleanup(setattr, rapports, '_magasin', None)
+        self.addCleanup(lambda: rapports._magasin and rapports._magasin.abandonner_pool_processus())
+        self.sessions = [
+            SessionCours.objects.create(cours=self.cours, enseignant=self.enseignant, actif=False) for _ in range(2)
+        ]
+
+    def archive(self):
+        contenu = b''.join(rapports.archive_zip(rapports.rapports_en_lot(rapports.sessions_a_exporter([self.cours.pk]))))
+        return zipfile.ZipFile(io.BytesIO(contenu)).namelist()
+
+    def test_feuille_en_echec_omise(self):
+        magasin = rapports.get_rapports()
+        with mock.patch.object(magasin, 'enregistrer', side_effect=[OSError('disque plein'), None]):
+            with self.assertLogs('presence.rapports', 'ERROR'):
+                noms = self.archive()
+        self.assertEqual(noms, [rapports.nom_dans_archive(self.sessions[1])])
+
+    def test_pool_partage_entre_exports(self):
+        magasin = rapports.get_rapports()
+        self.assertEqual(len(self.archive()), 2)
+        pool = magasin.pool_processus()
+        SessionCours.objects.create(cours=self.cours, enseignant=self.enseignant, actif=False)
+        self.assertEqual(len(self.archive()), 3)
+        self.assertIs(magasin.pool_processus(), pool)
+
+
+class RapportSessionTests(ScenarioTests):
+    """ Feuille PDF d'une session servie par session_pdf_view, rendue en arrière-plan. """
+
+    def setUp(self):
+        super().setUp()
+        self.repertoire = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.repertoire, ignore_errors=True)
+        self.enterContext(self.settings(
+            PRESENCE_RAPPORTS={'ASYNC': True, 'REPERTOIRE': self.repertoire, 'MOTEUR': 'reportlab', 'WORKERS': 1}
+        ))
+        rapports._magasin = None
+        self.addCleanup(setattr, rapports, '_magasin', None)
+        self.rendus = self.enterContext(mock.patch.object(rapports, 'rendre_pdf', wraps=rapports.rendre_pdf))
+        self.session = self.lancer_session()
+        self.url = reverse('session_pdf', args=[self.session.pk])
+
+    def attendre_rendus(self):
+        for tache in list(rapports.get_rapports()._taches.values()):
+            tache.exception(timeout=30)
+
+    def telecharger(self):
+        """ PDF servi après le rendu en arrière-plan (202 puis 200). """
+        reponse = self.client.get(self.url)
+        self.assertEqual(reponse.status_code, 202)
+        self.assertEqual(reponse['Retry-After'], str(DELAI_RAPPORT_EN_COURS))
+        self.assertEqual(reponse['Location'], self.url)
+        self.attendre_rendus()
+        return self.contenu(self.client.get(self.url))
+
+    def contenu(self, reponse):
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse['Content-Type'], 'application/pdf')
+        # Le client de test ferme la réponse (et le fichier) en fin de lecture
+        return b''.join(reponse.streaming_content)
+
+    def fichiers(self):
+        return sorted(os.listdir(self.repertoire))
+
+    def test_rendu_puis_fichier_servi(self):
+        contenu = self.telecharger()
+        self.assertTrue(contenu.startswith(b'%PDF'))
+        self.assertEqual(len(self.fichiers()), 1)
+        with open(os.path.join(self.repertoire, self.fichiers()[0]), 'rb') as fichier:
+            self.assertEqual(fichier.read(), contenu)
+
+    def test_seconde_demande_servie_sans_rendu(self):
+        contenu = self.telecharger()
+        self.assertEqual(self.contenu(self.client.get(self.url)), contenu)
+        self.assertEqual(self.rendus.call_count, 1)
+
+    def test_nouveau_scan_nouveau_rendu(self):
+        self.telecharger()
+        avant = self.fichiers()
+        self.scanner(self.etudiants[0], jeton_session(self.session))
+        contenu = self.telecharger()
+        self.assertEqual(self.rendus.call_count, 2)
+        apres = self.fichiers()
+        # Nouvelle empreinte, ancien fichier supprimé
+        self.assertEqual(len(apres), 1)
+        self.assertNotEqual(apres, avant)
+        with open(os.path.join(self.repertoire, apres[0]), 'rb') as fichier:
+            self.assertEqual(fichier.read(), contenu)
+
+    def test_echec_du_rendu_relance(self):
+        self.rendus.side_effect = [ErreurRendu('police introuvable'), mock.DEFAULT]
+        with self.assertLogs('presence.rapports', 'ERROR'):
+            self.assertEqual(self.client.get(self.url).status_code, 202)
+            self.attendre_rendus()
+        self.assertEqual(self.client.get(self.url).status_code, 500)
+        self.assertEqual(self.fichiers(), [])
+        # L'échec n'est pas gardé : la demande suivante relance le rendu
+        self.assertTrue(self.telecharger().startswith(b'%PDF'))
+        self.assertEqual(self.rendus.call_count, 2)
+
+
+class RenduPdfTests(SimpleTestCase):
+    """ Même feuille rendue par chaque moteur de presence/rendu_pdf.py. """
+
+    def contexte(self, nb_etudiants):
+        liste = [
+            {'nom': f'Nom{i}', 'prenom': 'prénom', 'statut': 'PRÉSENT' if i % 2 else 'ABSENT',
+             'color': '#198754' if i % 2 else '#dc3545'}
+            for i in range(nb_etudiants)
+        ]
+        return {
+            'session': {'id': 1, 'cours': {'nom': 'Algorithmique', 'code': 'ALG'},
+                        'date_debut': timezone.now(), 'date_fin': None},
+            'liste_etudiants': liste,
+            'total_inscrits': len(liste),
+            'total_presents': sum(1 for etudiant in liste if etudiant['statut'] == 'PRÉSENT'),
+            'enseignant': {'id': {'nom': 'Enseignant', 'prenom': 'Test'}},
+        }
+
+    def pages(self, contenu):
+        return len(PdfReader(io.BytesIO(contenu)).pages)
+
+    def test_chaque_moteur_rend_un_pdf(self):
+        for moteur in rendu_pdf.MOTEURS:
+            with self.subTest(moteur=moteur):
+                contenu = rendu_pdf.rendre_pdf(self.contexte(3), moteur)
+                self.assertTrue(contenu.startswith(b'%PDF'))
+                self.assertEqual(self.pages(contenu), 1)
+
+    def test_liste_sur_plusieurs_pages(self):
+        for moteur in rendu_pdf.MOTEURS:
+            with self.subTest(moteur=moteur):
+                self.assertGreater(self.pages(rendu_pdf.rendre_pdf(self.contexte(100), moteur)), 1)
+
+    def test_pages_reportlab(self):
+        # Lignes par page (A4, marges de 40 points) : 29 sous l'en-tête de la feuille, 37 ensuite
+        for nb_etudiants, attendu in [(29, 1), (30, 2), (66, 2), (67, 3), (100, 3)]:
+            with self.subTest(nb_etudiants=nb_etudiants):
+                contenu = rendu_pdf.rendre_pdf(self.contexte(nb_etudiants), 'reportlab')
+                self.assertEqual(self.pages(contenu), attendu)
+
+
+class ExportCsvTests(ScenarioTests):
+    """ Export CSV des présences (export_presences_csv). """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        compte = Utilisateur.objects.create(username='autre@scenario.local', email='autre@scenario.local',
+                                            nom='autre', prenom='Test', role='enseignant')
+        cls.autre_enseignant = Enseignant.objects.create(id=compte, departement=cls.enseignant.departement)
+        cls.autre_cours = Cours.objects.create(nom='Réseaux', code='RES', semestre_cible='S1',
+                                               enseignant=cls.autre_enseignant, cree_par=cls.admin)
+        cls.autre_cours.etudiants.add(cls.etudiants[0])
+
+    def setUp(self):
+        super().setUp()
+        maintenant = timezone.now()
+        self.ancienne = SessionCours.objects.create(cours=self.cours, enseignant=self.enseignant, actif=False)
+        SessionCours.objects.filter(pk=self.ancienne.pk).update(date_debut=maintenant - datetime.timedelta(days=10))
+        self.recente = SessionCours.objects.create(cours=self.cours, enseignant=self.enseignant, actif=False)
+        self.autre = SessionCours.objects.create(cours=self.autre_cours, enseignant=self.autre_enseignant, actif=False)
+        for session, etudiants in [(self.ancienne, self.etudiants[:2]), (self.recente, self.etudiants[:1]),
+                                   (self.autre, self.etudiants[:1])]:
+            for etudiant in etudiants:
+                Presence.objects.create(session=session, etudiant=etudiant, qr_empreinte=b'x')
+
+    def exporter(self, **parametres):
+        reponse = self.client.get(reverse('export_presences_csv'), parametres)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse['Content-Type'], 'text/csv; charset=utf-8')
+        return b''.join(reponse.streaming_content).decode('utf-8')
+
+    def lignes(self, **parametres):
+        """ (session_id, etudiant_id) des lignes exportées. """
+        lecteur = csv.DictReader(io.StringIO(self.exporter(**parametres).lstrip('\ufeff')), delimiter=';')
+        return sorted((int(ligne['session_id']), int(ligne['etudiant_id'])) for ligne in lecteur)
+
+    def test_reserve_aux_enseignants_et_administrateurs(self):
+        self.client.force_login(self.etudiants[0].id)
+        self.assertEqual(self.client.get(reverse('export_presences_csv')).status_code, 403)
+
+    def test_cours_d_un_autre_enseignant_refuse(self):
+        self.client.force_login(self.autre_enseignant.id)
+        reponse = self.client.get(reverse('export_presences_csv'), {'cours': [self.autre_cours.pk, self.cours.pk]})
+        self.assertEqual(reponse.status_code, 403)
+
+    def test_bom_et_entete(self):
+        contenu = self.exporter()
+        self.assertTrue(contenu.startswith('\ufeff'))
+        self.assertEqual(contenu[1:].splitlines()[0], ';'.join(ENTETES_EXPORT))
+
+    def test_enseignant_limite_a_ses_cours(self):
+        e0, e1 = self.etudiants[0].pk, self.etudiants[1].pk
+        self.assertEqual(self.lignes(), [(self.ancienne.pk, e0), (self.ancienne.pk, e1), (self.recente.pk, e0)])
+        self.client.force_login(self.autre_enseignant.id)
+        self.assertEqual(self.lignes(), [(self.autre.pk, e0)])
+
+    def test_filtres(self):
+        self.client.force_login(self.admin.id)
+        e0 = self.etudiants[0].pk
+        self.assertEqual(len(self.lignes()), 4)
+        self.assertEqual(self.lignes(cours=self.autre_cours.pk), [(self.autre.pk, e0)])
+        depuis = (timezone.localdate() - datetime.timedelta(days=1)).isoformat()
+        self.assertEqual(self.lignes(cours=self.cours.pk, depuis=depuis), [(self.recente.pk, e0)])
+        self.assertEqual(len(self.lignes(cours=self.cours.pk, jusqu_a=depuis)), 2)
+        self.assertEqual(len(self.lignes(formation=self.etudiants[0].formation_id)), 4)
+        self.assertEqual(self.lignes(departement='AUTRE'), [])
+
+
+class ExportGzipTests(SimpleTestCase):
+
+    def test_chaque_paquet_decompressable_des_reception(self):
+        decompresseur = zlib.decompressobj(31)
+        morceaux = iter(['entete;\n', 'ligne 1;\n', 'ligne 2;\n'])
+        flux = compresser_gzip(morceaux)
+        # Avant la fin du flux, les paquets déjà envoyés se décompressent en entier
+        self.assertEqual(decompresseur.decompress(next(flux)), b'entete;\n')
+        self.assertEqual(decompresseur.decompress(next(flux)), b'ligne 1;\n')
+        reste = b''.join(flux)
+        self.assertEqual(decompresseur.decompress(reste) + decompresseur.flush(), b'ligne 2;\n')
+        self.assertTrue(decompresseur.eof)
+
+
+class ConnexionsTests(SimpleTestCase):
+    """ Réglages de connexion PostgreSQL (presence_projet/connexions.py), sans serveur. """
+
+    def base(self):
+        return {'ENGINE': 'django.db.backends.postgresql', 'NAME': 'presence'}
+
+    def test_pool(self):
+        with mock.patch.object(connexions, 'pool_disponible', return_value=True):
+            base = connexions.configurer_postgresql(self.base(), taille_min=4, taille_max=20, attente=5)
+        self.assertEqual(base['OPTIONS']['pool'], {'min_size': 4, 'max_size': 20, 'timeout': 5})
+        self.assertEqual(base['CONN_MAX_AGE'], 0)
+        self.assertTrue(base['CONN_HEALTH_CHECKS'])
+
+    def test_connexions_persistantes_sans_pool(self):
+        for pool, disponible in [(True, False), (False, True)]:
+            with self.subTest(pool=pool, disponible=disponible):
+                with mock.patch.object(connexions, 'pool_disponible', return_value=disponible):
+                    base = connexions.configurer_postgresql(self.base(), pool=pool)
+                self.assertNotIn('pool', base['OPTIONS'])
+                self.assertEqual(base['CONN_MAX_AGE'], connexions.DUREE_CONNEXION_PERSISTANTE)
+                self.assertTrue(base['CONN_HEALTH_CHECKS'])
+
+    def test_pgbouncer(self):
+        with mock.patch.object(connexions, 'pool_disponible', return_value=True):
+            base = connexions.configurer_postgresql(self.base(), pgbouncer=True)
+        self.assertTrue(base['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertIn('prepare_threshold', base['OPTIONS'])
+        self.assertIsNone(base['OPTIONS']['prepare_threshold'])
+        self.assertNotIn('DISABLE_SERVER_SIDE_CURSORS', connexions.configurer_postgresql(self.base()))
+
+    def test_options_existantes_gardees(self):
+        base = {**self.base(), 'OPTIONS': {'sslmode': 'require'}}
+        with mock.patch.object(connexions, 'pool_disponible', return_value=True):
+            connexions.configurer_postgresql(base)
+        self.assertEqual(base['OPTIONS']['sslmode'], 'require')
+        self.assertIn('pool', base['OPTIONS'])
+
+    def test_statistiques_sans_pool(self):
+        with mock.patch('django.db.connections', {'default': mock.Mock(spec=[])}):
+            self.assertIsNone(connexions.statistiques_pool())
+
+    def test_statistiques_pool(self):
+        pool = mock.Mock()
+        pool.get_stats.return_value = {'requests_num': 12, 'pool_size': 3, 'inconnu': 1}
+        with mock.patch('django.db.connections', {'default': mock.Mock(pool=pool)}):
+            statistiques = connexions.statistiques_pool()
+        self.assertEqual(set(statistiques), set(connexions.COMPTEURS_POOL.values()))
+        self.assertEqual(statistiques['emprunts'], 12)
+        self.assertEqual(statistiques['taille'], 3)
+        self.assertEqual(statistiques['expirations'], 0)
+
+
+class ArchivesTests(ScenarioTests):
+    """ Aller-retour : export d'une année close, suppression, puis lecture de l'archive. """
+
+    def setUp(self):
+        super().setUp()
+        self.repertoire = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.repertoire, ignore_errors=True)
+        # Année universitaire close depuis au moins un an
+        self.annee = timezone.now().year - 2
+        debut, _ = archives.bornes_annee(self.annee)
+        autre_cours = Cours.objects.create(nom='Réseaux', code='RES', semestre_cible='S1',
+                                           enseignant=self.enseignant, cree_par=self.admin)
+        autre_cours.etudiants.add(self.etudiants[1])
+        seances = []
+        for jour, cours in enumerate([self.cours] * 3 + [autre_cours]):
+            seance = SessionCours.objects.create(cours=cours, enseignant=self.enseignant, actif=False)
+            SessionCours.objects.filter(pk=seance.pk).update(date_debut=debut + datetime.timedelta(days=jour + 1))
+            seances.append(seance)
+        presences = [
+            (self.etudiants[0], seances[0], True), (self.etudiants[0], seances[1], True),
+            (self.etudiants[0], seances[2], False),  # scan invalidé
+            (self.etudiants[0], seances[3], True),   # cours non suivi
+            (self.etudiants[1], seances[3], True),
+            (self.etudiants[2], seances[0], True),   # non inscrit
+        ]
+        for etudiant, seance, valide in presences:
+            Presence.objects.create(etudiant=etudiant, session=seance, valide=valide, qr_empreinte=b'x')
+
+    def attendu(self, etudiant):
+        """ Taux calculé en base, avant l'export. """
+        cours = Cours.objects.filter(etudiants=etudiant)
+        seances = SessionCours.objects.filter(cours__in=cours).count()
+        presences = Presence.objects.filter(etudiant=etudiant, valide=True, session__cours__in=cours).count()
+        return {'annee': self.annee, 'seances': seances, 'presences': presences,
+                'taux': round(presences / seances, 4) if seances else 0.0}
+
+    def test_aller_retour(self):
+        attendus = {etudiant.pk: self.attendu(etudiant) for etudiant in self.etudiants}
+        self.assertEqual(archives.exporter_annee(self.annee, repertoire=self.repertoire), (4, 6))
+        self.assertFalse(Presence.objects.exists())
+        archive = archives.ArchiveAnnee(self.annee, self.repertoire)
+        for etudiant_id, attendu in attendus.items():
+            with self.subTest(etudiant=etudiant_id):
+                self.assertEqual(archive.taux_presence(etudiant_id), attendu)
+        self.assertEqual(attendus[self.etudiants[0].pk]['taux'], 0.6667)
+        self.assertEqual(len(archive.presences(self.etudiants[0].pk)), 4)
+
+
+class ResumesTests(ScenarioTests):
+    """ Les résumés restent égaux aux comptes de la table presence après une suppression. """
+
+    def setUp(self):
+        super().setUp()
+        self.sessions = [
+            SessionCours.objects.create(cours=self.cours, enseignant=self.enseignant, actif=False) for _ in range(2)
+        ]
+        for session in self.sessions:
+            for etudiant in self.etudiants[:2]:
+                Presence.objects.create(session=session, etudiant=etudiant, qr_empreinte=b'x')
+
+    def verifier_resumes(self):
+        par_session = {
+            session.pk: Presence.objects.filter(session=session).count() for session in SessionCours.objects.all()
+        }
+        self.assertEqual(dict(ResumePresenceSession.objects.values_list('session_id', 'nb_presences')), par_session)
+        for resume in ResumePresenceEtudiant.objects.all():
+            self.assertEqual(
+                resume.nb_presences,
+                Presence.objects.filter(etudiant_id=resume.etudiant_id, session__cours_id=resume.cours_id).count(),
+            )
+
+    def test_resumes_apres_scans(self):
+        session = self.lancer_session()
+        jeton = jeton_session(session)
+        for etudiant in (self.etudiants[0], self.etudiants[1], self.etudiants[0]):
+            self.scanner(etudiant, jeton)
+        self.verifier_resumes()
+        total = ResumePresenceSession.objects.aggregate(total=Sum('nb_presences'))['total']
+        self.assertEqual(total, Presence.objects.count())
+
+    def test_suppression_session(self):
+        self.sessions[0].delete()
+        self.verifier_resumes()
+        self.assertEqual(ResumePresenceEtudiant.objects.get(etudiant=self.etudiants[0]).nb_presences, 1)
+
+    def test_suppression_etudiant(self):
+        self.etudiants[0].id.delete()
+        self.verifier_resumes()
+        self.assertEqual(ResumePresenceSession.objects.get(session=self.sessions[0]).nb_presences, 1)
+
+    def test_suppression_par_l_api(self):
+        self.client.force_login(self.admin.id)
+        presence = Presence.objects.filter(session=self.sessions[0]).first()
+        reponse = self.client.delete(reverse('api-presence-detail', args=[presence.pk]))
+        self.assertEqual(reponse.status_code, 204)
+        self.verifier_resumes()
+
+    def test_suppression_cours_sans_charger_les_presences(self):
+        with CaptureQueriesContext(connection) as requetes:
+            self.cours.delete()
+        lectures = [q['sql'] for q in requetes if q['sql'].startswith('SELECT') and f'"{TABLE_SURVEILLEE}"' in q['sql']]
+        self.assertEqual(lectures, [])
+        self.assertFalse(Presence.objects.exists())
+        self.verifier_resumes()
+
+
+class BilansEnCacheTests(ScenarioTests):
+    """ Bilan étudiant et tableau de bord enseignant en cache, invalidés par les écritures. """
+
+    def bilan(self, etudiant):
+        return {cours['id']: (cours['total'], cours['present']) for cours in bilan_etudiant(etudiant.pk)['cours']}
+
+    def presences_du_jour(self):
+        return {cours['id']: cours['presences_aujourdhui'] for cours in tableau_enseignant(self.enseignant.pk)}
+
+    def test_nouveau_scan(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            session = self.lancer_session()
+        self.assertEqual(self.bilan(self.etudiants[0]), {self.cours.pk: (1, 0)})
+        self.assertEqual(self.presences_du_jour(), {self.cours.pk: 0})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.scanner(self.etudiants[0], jeton_session(session))
+        self.assertEqual(self.bilan(self.etudiants[0]), {self.cours.pk: (1, 1)})
+        self.assertEqual(self.presences_du_jour(), {self.cours.pk: 1})
+
+    def test_inscriptions_modifiees(self):
+        etudiant = self.etudiants[2]
+        self.assertEqual(self.bilan(etudiant), {})
+        self.cours.etudiants.add(etudiant)
+        self.assertEqual(self.bilan(etudiant), {self.cours.pk: (0, 0)})
+        etudiant.cours_inscrits.remove(self.cours)
+        self.assertEqual(self.bilan(etudiant), {})
+        etudiant.cours_inscrits.add(self.cours)
+        self.assertEqual(self.bilan(etudiant), {self.cours.pk: (0, 0)})
+        self.cours.etudiants.clear()
+        self.assertEqual(self.bilan(etudiant), {})
+
+    def test_suppression_session(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            session = SessionCours.objects.create(cours=self.cours, enseignant=self.enseignant, actif=False)
+            Presence.objects.create(session=session, etudiant=self.etudiants[0], qr_empreinte=b'x')
+        self.assertEqual(self.bilan(self.etudiants[0]), {self.cours.pk: (1, 1)})
+        self.assertEqual(self.bilan(self.etudiants[1]), {self.cours.pk: (1, 0)})
+        self.assertEqual(self.presences_du_jour(), {self.cours.pk: 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            session.delete()
+        self.assertEqual(self.bilan(self.etudiants[0]), {self.cours.pk: (0, 0)})
+        self.assertEqual(self.bilan(self.etudiants[1]), {self.cours.pk: (0, 0)})
+        self.assertEqual(self.presences_du_jour(), {self.cours.pk: 0})
+
+
+class IngestionTests(TransactionTestCase):
+    """
+    Écriture des lots de présences. TransactionTestCase : les clés étrangères
+    ne sont vérifiées qu'à la validation de la transaction.
+    """
+
+    def setUp(self):
+        cache.clear()
+        jeu_scenario(self)
+        self.session = demarrer_session(self.cours, self.enseignant)
+
+    def file_sans_thread(self):
+        file = IngestionPresences(asynchrone=True)
+        # Le test vide la file lui-même
+        file._demarrer = lambda: None
+        return file
+
+    def test_doublon_non_compte(self):
+        file = IngestionPresences(asynchrone=False)
+        self.assertTrue(file.soumettre(self.session.pk, self.etudiants[0].pk, 'jeton'))
+        self.assertFalse(file.soumettre(self.session.pk, self.etudiants[0].pk, 'jeton'))
+        self.assertEqual(Presence.objects.count(), 1)
+        self.assertEqual(ResumePresenceSession.objects.get(session=self.session).nb_presences, 1)
+
+    @skipUnless(connection.vendor == 'postgresql', "Verrou des sessions (SELECT ... FOR UPDATE) : PostgreSQL.")
+    def test_lots_concurrents_comptes_une_fois(self):
+        session_id, premier, second = self.session.pk, self.etudiants[0].pk, self.etudiants[1].pk
+        demarre = threading.Event()
+
+        def autre_processus():
+            demarre.set()
+            try:
+                lot = [(session_id, premier, 'jeton'), (session_id, second, 'jeton')]
+                IngestionPresences(asynchrone=False)._ecrire(lot)
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            IngestionPresences(asynchrone=False)._ecrire([(session_id, premier, 'jeton')])
+            thread = threading.Thread(target=autre_processus)
+            thread.start()
+            demarre.wait()
+            # Le second lot attend la validation du premier
+            time.sleep(0.5)
+        thread.join(10)
+
+        self.assertEqual(Presence.objects.filter(session=self.session).count(), 2)
+        self.assertEqual(ResumePresenceSession.objects.get(session=self.session).nb_presences, 2)
+        self.assertEqual(
+            dict(ResumePresenceEtudiant.objects.values_list('etudiant_id', 'nb_presences')), {premier: 1, second: 1}
+        )
+
+    def test_ligne_refusee_ecartee(self):
+        file = self.file_sans_thread()
+        file.soumettre(self.session.pk, self.etudiants[0].pk, 'jeton')
+        file.soumettre(self.session.pk, 999999, 'jeton')  # étudiant inexistant
+        file.soumettre(self.session.pk, self.etudiants[1].pk, 'jeton')
+        with self.assertLogs('presence.ingestion', 'ERROR') as journal:
+            self.assertEqual(file.vider(), 2)
+        self.assertIn('999999', journal.output[0])
+        self.assertEqual(
+            sorted(Presence.objects.values_list('etudiant_id', flat=True)), [e.pk for e in self.etudiants[:2]]
+        )
+        self.assertEqual(ResumePresenceSession.objects.get(session=self.session).nb_presences, 2)
+        # La ligne écartée n'est pas retentée
+        self.assertEqual(file.vider(), 0)
+
+    def test_mode_synchrone_sans_erreur(self):
+        file = IngestionPresences(asynchrone=False)
+        with self.assertLogs('presence.ingestion', 'ERROR'):
+            self.assertTrue(file.soumettre(self.session.pk, 999999, 'jeton'))
+        self.assertTrue(file.soumettre(self.session.pk, self.etudiants[0].pk, 'jeton'))
+        file.oublier_session(self.session.pk)
+        self.assertEqual(list(Presence.objects.values_list('etudiant_id', flat=True)), [self.etudiants[0].pk])
+
+    def test_session_inactive_oubliee(self):
+        file = IngestionPresences(asynchrone=False)
+        file.soumettre(self.session.pk, self.etudiants[0].pk, 'jeton')
+        file._activite[self.session.pk] -= DUREE_INACTIVITE_VUS + 1
+        file._purge -= DUREE_INACTIVITE_VUS
+        file.vider()
+        self.assertNotIn(self.session.pk, file._vus)
+        # Relu en base : le doublon reste refusé
+        self.assertFalse(file.soumettre(self.session.pk, self.etudiants[0].pk, 'jeton'))
+
+
+class MigrationEmpreintesTests(TransactionTestCase):
+    """
+    Migration 0006 : les jetons stockés (sessions, présences) sont remplacés
+    par leur empreinte. Calcul par PostgreSQL (sha256) ou jeton par jeton.
+    """
+    avant = [('presence', '0005_partitions_presence')]
+    apres = [('presence', '0006_empreintes_jetons_qr')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        derniers = executor.loader.graph.leaf_nodes()
+        self.addCleanup(lambda: MigrationExecutor(connection).migrate(derniers))
+        executor.migrate(self.avant)
+        apps = executor.loader.project_state(self.avant).apps
+
+        def modele(nom):
+            return apps.get_model(*nom.split('.'))
+
+        def compte(nom, role):
+            return modele('comptes.Utilisateur').objects.create(
+                username=f'{nom}@migration.local', email=f'{nom}@migration.local', password='x',
+                nom=nom, prenom='Test', role=role,
+            )
+
+        departement = modele('comptes.Departement').objects.create(code='INFO', nom='Informatique')
+        formation = modele('comptes.Formation').objects.create(nom='Génie Logiciel', departement=departement)
+        enseignant = modele('comptes.Enseignant').objects.create(id=compte('enseignant', 'enseignant'),
+                                                                 departement=departement)
+        admin = modele('comptes.Administrateur').objects.create(id=compte('admin', 'admin'))
+        etudiants = [
+            modele('comptes.Etudiant').objects.create(id=compte(f'etudiant{i}', 'etudiant'), formation=formation)
+            for i in range(3)
+        ]
+        cours = modele('presence.Cours').objects.create(nom='Algorithmique', code='ALG', semestre_cible='S1',
+                                                        enseignant=enseignant, cree_par=admin)
+        SessionCours, Presence = modele('presence.SessionCours'), modele('presence.Presence')
+        maintenant = timezone.now()
+        self.sessions = {
+            jeton: SessionCours.objects.create(cours=cours, enseignant=enseignant, qr_token=jeton,
+                                               qr_expiration=maintenant).pk
+            for jeton in ('jeton-1', 'jeton-2', None)
+        }
+        # Deux présences par jeton scanné, dont un jeton qui n'est plus celui de sa session
+        self.presences = {}
+        for etudiant, session, jeton in [(0, 'jeton-1', 'jeton-1'), (1, 'jeton-1', 'jeton-1'),
+                                         (0, 'jeton-2', 'jeton-0'), (2, 'jeton-2', 'jeton-0')]:
+            presence = Presence.objects.create(etudiant=etudiants[etudiant], session_id=self.sessions[session],
+                                               qr_token_utilise=jeton)
+            self.presences[presence.pk] = jeton
+
+    def migrer(self):
+        MigrationExecutor(connection).migrate(self.apres)
+        with connection.cursor() as curseur:
+            curseur.execute('SELECT id, qr_empreinte FROM session_cours')
+            sessions = {pk: None if empreinte is None else bytes(empreinte) for pk, empreinte in curseur.fetchall()}
+            curseur.execute('SELECT id, qr_empreinte FROM presence')
+            presences = {pk: bytes(empreinte) for pk, empreinte in curseur.fetchall()}
+        self.assertEqual(sessions, {
+            pk: None if jeton is None else empreinte_qr(jeton) for jeton, pk in self.sessions.items()
+        })
+        self.assertEqual(presences, {pk: empreinte_qr(jeton) for pk, jeton in self.presences.items()})
+
+    def test_empreintes(self):
+        self.migrer()
+
+    @skipUnless(connection.vendor == 'postgresql', "Hors PostgreSQL, test_empreintes suit déjà ce chemin.")
+    def test_empreintes_jeton_par_jeton(self):
+        # Chemin des autres bases (SQLite) : un UPDATE par jeton distinct
+        with mock.patch.object(connection, 'vendor', 'sqlite'):
+            self.migrer()
+
+
+@skipUnless(connection.vendor == 'postgresql', "Partitionnement de presence : PostgreSQL uniquement.")
+class PartitionsTests(TransactionTestCase):
+    """
+    Conversion, bascule et archivage des partitions de presence. Les
+    opérations prennent des verrous et changent le schéma : TransactionTestCase.
+    La table reste partitionnée après le test, pour les tests suivants.
+    """
+
+    def setUp(self):
+        if partitions.est_partitionnee():
+            self.skipTest("presence est déjà partitionnée (PRESENCE_PARTITIONS).")
+        self.addCleanup(self.vider_archive)
+        jeu_scenario(self)
+        self.maintenant = timezone.now()
+        annee = timezone.localtime(self.maintenant).year
+        self.ancienne = self.seance(timezone.make_aware(datetime.datetime(annee - 3, 10, 5)), self.etudiants[:2])
+        self.precedente = self.seance(timezone.make_aware(datetime.datetime(annee - 2, 3, 5)), self.etudiants[:1])
+        self.courante = self.seance(self.maintenant, self.etudiants[1:2])
+
+    @staticmethod
+    def vider_archive():
+        with connection.cursor() as curseur:
+            curseur.execute(f'DROP SCHEMA IF EXISTS {partitions.SCHEMA_ARCHIVE} CASCADE')
+
+    def seance(self, debut, etudiants):
+        session = SessionCours.objects.create(cours=self.cours, enseignant=self.enseignant, actif=False)
+        SessionCours.objects.filter(pk=session.pk).update(date_debut=debut)
+        session.date_debut = debut
+        for etudiant in etudiants:
+            Presence.objects.create(etudiant=etudiant, session=session, qr_empreinte=b'')
+        return session
+
+    def repartition(self):
+        with connection.cursor() as curseur:
+            curseur.execute('SELECT tableoid::regclass::text, count(*) FROM presence GROUP BY 1')
+            return dict(curseur.fetchall())
+
+    def nom(self, instant):
+        return partitions.nom_partition(partitions.debut_periode(instant, 'semestre'), 'semestre')
+
+    def resume_etudiant(self, etudiant):
+        return ResumePresenceEtudiant.objects.get(cours=self.cours, etudiant=etudiant).nb_presences
+
+    def test_convertir_basculer_archiver(self):
+        ancienne, precedente, courante = (
+            self.nom(seance.date_debut) for seance in (self.ancienne, self.precedente, self.courante)
+        )
+        self.assertEqual(partitions.convertir('semestre', self.maintenant), [ancienne, precedente, courante])
+        self.assertTrue(partitions.est_partitionnee())
+        self.assertEqual(self.repartition(), {ancienne: 2, precedente: 1, courante: 1})
+        with self.assertRaises(partitions.ErreurPartitions):
+            partitions.convertir('semestre', self.maintenant)
+        # La séquence des identifiants continue après la copie
+        presence = Presence.objects.create(etudiant=self.etudiants[0], session=self.courante, qr_empreinte=b'')
+        self.assertGreater(presence.pk, Presence.objects.exclude(pk=presence.pk).latest('pk').pk)
+
+        # Bascule : la partition courante est déjà ouverte, puis la séance du semestre suivant change de partition
+        self.assertIsNone(partitions.basculer('semestre', self.maintenant))
+        debut_suivant = partitions.periode_suivante(partitions.debut_periode(self.maintenant, 'semestre'), 'semestre')
+        self.seance(debut_suivant + datetime.timedelta(days=1), self.etudiants[:1])
+        suivante = partitions.basculer('semestre', debut_suivant)
+        self.assertEqual(suivante, self.nom(debut_suivant))
+        self.assertEqual(self.repartition(), {ancienne: 2, precedente: 1, courante: 2, suivante: 1})
+
+        # Archivage : les présences quittent la table, pas les résumés, même reconstruits
+        self.assertEqual(partitions.archiver(self.precedente.date_debut), [ancienne])
+        self.assertEqual(partitions.tables_archivees(), [ancienne])
+        self.assertEqual(Presence.objects.count(), 4)
+        reconstruire_resumes()
+        self.assertEqual(ResumePresenceSession.objects.get(session=self.ancienne).nb_presences, 2)
+        self.assertEqual([self.resume_etudiant(e) for e in self.etudiants[:2]], [4, 2])
+
+        # Suppression : la séance de la partition supprimée disparaît avec ses présences
+        self.assertEqual(partitions.archiver(self.courante.date_debut, supprimer=True), [precedente])
+        self.assertFalse(SessionCours.objects.filter(pk=self.precedente.pk).exists())
+        self.assertEqual(partitions.tables_archivees(), [ancienne])
+        self.assertEqual([self.resume_etudiant(e) for e in self.etudiants[:2]], [3, 2])
+        self.assertEqual(ResumePresenceSession.objects.get(session=self.ancienne).nb_presences, 2)
+
+
+@tag('replica')
+@skipUnless('replica' in settings.DATABASES, "Réplique non configurée (DB_REPLICA=True).")
+class RepliqueTests(TransactionTestCase):
+    """
+    Routage des lectures : sous test, l'alias replica est un miroir de la base
+    de test, ouvert par une autre connexion (données validées, d'où
+    TransactionTestCase).
+    """
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Le pool du miroir (PostgreSQL) garderait des connexions à la base de test à sa suppression
+        replica = connections['replica']
+        if hasattr(replica, 'close_pool'):
+            cls.addClassCleanup(replica.close_pool)
+
+    def setUp(self):
+        cache.clear()
+        self.compte = Utilisateur.objects.create(
+            username='admin@replica.local', email='admin@replica.local', password=make_password('replica'),
+            nom='Admin', prenom='Test', role='admin',
+        )
+        Administrateur.objects.create(id=self.compte)
+        Departement.objects.create(code='INFO', nom='Informatique')
+        self.client.force_login(self.compte)
+
+    def lectures(self, alias, requete):
+        """ Requêtes sur la table departement passées par l'alias (hors mesure du retard). """
+        with CaptureQueriesContext(connections[alias]) as requetes:
+            reponse = requete()
+        self.assertLess(reponse.status_code, 400)
+        return len([q for q in requetes.captured_queries if '"departement"' in q['sql']])
+
+    def test_liste_sur_replica(self):
+        self.assertGreater(self.lectures('replica', lambda: self.client.get(reverse('departement_list'))), 0)
+        self.assertContains(self.client.get(reverse('departement_list')), 'Informatique')
+
+    def test_liste_api_sur_replica(self):
+        entetes = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.compte)}'}
+        url = reverse('api-departement-list')
+        self.assertGreater(self.lectures('replica', lambda: self.client.get(url, **entetes)), 0)
+
+    def test_lecture_apres_ecriture_sur_primaire(self):
+        creation = lambda: self.client.post(reverse('departement_create'), {'code': 'MATH', 'nom': 'Mathématiques'})
+        self.assertEqual(self.lectures('replica', creation), 0)
+        self.assertEqual(self.lectures('replica', lambda: self.client.get(reverse('departement_list'))), 0)
+
+    @override_settings(PRESENCE_REPLICA={'RETARD_MAX_SECONDES': -1})
+    def test_replica_en_retard(self):
+        self.assertEqual(self.lectures('replica', lambda: self.client.get(reverse('departement_list'))), 0)
@@ -1,8 +1,9 @@
 
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from . import views
+from . import views, views_async
 from .views import EtudiantViewSet
 
 from .views import (
@@ -18,6 +19,10 @@ router.register(r'api/formations', FormationViewSet, basename='api-formation')
 router.register(r'api/cours', CoursViewSet, basename='api-cours')
 router.register(r'api/sessions', SessionCoursViewSet, basename='api-session')
 router.register(r'api/presences', PresenceViewSet, basename='api-presence')
+
+# En mode ASGI, les endpoints de scan et de suivi en direct sont servis par leurs versions asynchrones
+vues_temps_reel = views_async if settings.PRESENCE_VUES_ASYNC else views
+
 urlpatterns = [
     path('', views.home_view, name='home'),
     path('', include(router.urls)),
@@ -26,16 +31,23 @@ urlpatterns = [
     path('dashboard/enseignant/', views.dashboard_enseignant, name='dashboard_enseignant'),
     path('cours/<int:cours_id>/lancer-session/', views.lancer_session, name='lancer_session'),
     path('session/<int:session_id>/', views.session_detail, name='session_detail'),
+    path('session/<int:session_id>/qr/', views.session_qr_image, name='session_qr_image'),
     path('cours/<int:cours_id>/stats/', views.cours_statistiques, name='cours_stats'),
     path('session/<int:session_id>/arreter/', views.arreter_session, name='arreter_session'),
     path('session/<int:session_id>/pdf/', views.session_pdf_view, name='session_pdf'),
+    path('export/presences.csv', views.export_presences_csv, name='export_presences_csv'),
+    path('export/rapports.zip', views.export_rapports_zip, name='export_rapports_zip'),
     # URLs Étudiant
     path('scanner/', views.scanner_etudiant, name='scanner'),
+    path('api/etudiant/cours/<int:cours_id>/historique/', views.historique_cours_api, name='historique_cours_api'),
 
     # URLs API (pour JavaScript/AJAX)
-    path('api/valider-scan/', views.valider_scan, name='valider_scan'),
-    path('api/session/<int:session_id>/refresh-qr/', views.rafraichir_qr, name='rafraichir_qr'),
-    path('api/session/<int:session_id>/get-presences/', views.get_presences_api, name='get_presences_api'),
+    path('api/valider-scan/', vues_temps_reel.valider_scan, name='valider_scan'),
+    path('api/session/<int:session_id>/refresh-qr/', vues_temps_reel.rafraichir_qr, name='rafraichir_qr'),
+    path('api/session/<int:session_id>/get-presences/', vues_temps_reel.get_presences_api, name='get_presences_api'),
+    path('api/session/<int:session_id>/presences/flux/', vues_temps_reel.presences_flux, name='presences_flux'),
+    path('api/analytics/<str:portee>/<str:identifiant>/', views.analytics_api, name='analytics_api'),
+    path('api/connexions/', views.connexions_api, name='connexions_api'),
 
     # URLs Panneau Admin Personnalisé (Onglets)
     path('admin-custom/', views.admin_dashboard_view, name='admin_dashboard'),
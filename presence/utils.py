@@ -1,44 +1,294 @@
+import io
 import jwt
+import hmac
+import time
+import base64
+import hashlib
+import logging
 import datetime
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import qrcode
+from qrcode.image.svg import SvgPathImage
 from django.conf import settings
 from django.utils import timezone
 
+logger = logging.getLogger(__name__)
+
 # Durée de validité du QR code (10 minutes)
 QR_CODE_EXPIRATION_MINUTES = 10
 
+# Cache des jetons déjà vérifiés (voir CacheJetons)
+JETONS_CACHE_TAILLE = 1024
+JETONS_CACHE_NEGATIF_TAILLE = 1024
+JETONS_CACHE_NEGATIF_SECONDES = 5
+
+# Nombre d'images de QR code gardées en mémoire (voir rendre_qr)
+QR_CACHE_TAILLE = 256
+
+# Jetons compacts (réglage QR_TOKEN_MODE = 'compact')
+PREFIXE_JETON_COMPACT = 'P:'
+TAILLE_MAC_COMPACT = 10  # octets de HMAC-SHA256 conservés (80 bits)
+
+# Octets de SHA-256 gardés en base pour chaque jeton (voir empreinte_qr)
+TAILLE_EMPREINTE_QR = 16
+
+
+def jetons_compacts_actifs():
+    """ Vrai si les QR codes utilisent le format compact à fenêtre de temps. """
+    return getattr(settings, 'QR_TOKEN_MODE', 'jwt') == 'compact'
+
+
+def duree_fenetre_compacte():
+    """ Durée (en secondes) d'une fenêtre de rotation des jetons compacts. """
+    return getattr(settings, 'QR_COMPACT_FENETRE_SECONDES', 15)
+
+
+def _mac_compact(session_id, fenetre):
+    cle = hashlib.sha256(b'presence-qr-compact:' + settings.SECRET_KEY.encode('utf-8')).digest()
+    message = f'{session_id}:{fenetre}'.encode('ascii')
+    mac = hmac.new(cle, message, hashlib.sha256).digest()[:TAILLE_MAC_COMPACT]
+    return base64.b32encode(mac).decode('ascii').rstrip('=')
+
+
+def _base36(nombre):
+    chiffres = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    resultat = ''
+    while True:
+        nombre, reste = divmod(nombre, 36)
+        resultat = chiffres[reste] + resultat
+        if nombre == 0:
+            return resultat
+
+
+def generer_jeton_compact(session_id, instant=None):
+    """
+    Génère le jeton compact de la fenêtre de temps courante :
+    « P:<session en base 36>:<fenêtre en base 36>:<HMAC tronqué en base 32> ».
+
+    Le jeton se calcule sans état (ni écriture en base) à partir de l'ID de
+    session et de l'heure ; il change toutes les QR_COMPACT_FENETRE_SECONDES.
+    Il ne contient que des majuscules, chiffres et « : », ce qui permet
+    l'encodage alphanumérique : le QR code obtenu est bien plus petit qu'avec
+    un JWT et se lit plus vite.
+    Retourne (jeton, fin de la fenêtre d'affichage).
+    """
+    duree = duree_fenetre_compacte()
+    fenetre = int((instant if instant is not None else time.time()) // duree)
+    jeton = f'{PREFIXE_JETON_COMPACT}{_base36(session_id)}:{_base36(fenetre)}:{_mac_compact(session_id, fenetre)}'
+    fin = datetime.datetime.fromtimestamp((fenetre + 1) * duree, tz=datetime.timezone.utc)
+    return jeton, fin
+
+
+def _verifier_jeton_compact(token):
+    """
+    Vérifie un jeton compact. Le jeton de la fenêtre précédente reste accepté
+    (scan commencé juste avant la rotation). Retourne un payload ou None.
+    """
+    try:
+        session_b36, fenetre_b36, mac = token[len(PREFIXE_JETON_COMPACT):].split(':')
+        session_id, fenetre = int(session_b36, 36), int(fenetre_b36, 36)
+    except ValueError:
+        return None
+
+    duree = duree_fenetre_compacte()
+    fenetre_courante = int(time.time() // duree)
+    if fenetre not in (fenetre_courante, fenetre_courante - 1):
+        return None
+    if not hmac.compare_digest(mac, _mac_compact(session_id, fenetre)):
+        return None
+    return {'session_id': session_id, 'fenetre': fenetre, 'compact': True, 'exp': (fenetre + 2) * duree}
+
+
+def jeton_courant(session_id, jeton_stocke):
+    """ Jeton à afficher pour une session : calculé en mode compact, stocké sinon. """
+    if jetons_compacts_actifs():
+        return generer_jeton_compact(session_id)[0]
+    return jeton_stocke
+
 
 def generer_jeton_qr(session):
     """
     Génère un jeton JWT contenant l'ID de la session et une expiration.
+    En mode compact (QR_TOKEN_MODE), délègue à generer_jeton_compact.
     """
+    if jetons_compacts_actifs():
+        return generer_jeton_compact(session.id)
+
     expiration = timezone.now() + datetime.timedelta(minutes=QR_CODE_EXPIRATION_MINUTES)
+    return _encoder_jeton(session, expiration), expiration
 
+
+def _encoder_jeton(session, expiration):
     payload = {
         'session_id': session.id,
-        'cours_id': session.cours.id,
-        'enseignant_id': session.enseignant.pk,
+        'cours_id': session.cours_id,
+        'enseignant_id': session.enseignant_id,
         'exp': expiration.timestamp()  # Horodatage d'expiration
     }
 
     # Utilise la SECRET_KEY de Django pour chiffrer le jeton
-    token = jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256')
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256')
+
+
+def empreinte_qr(token):
+    """
+    Empreinte binaire d'un jeton (SHA-256 tronqué à TAILLE_EMPREINTE_QR
+    octets), gardée en base à la place du jeton : jeton courant d'une
+    session, jeton scanné d'une présence.
+    """
+    return hashlib.sha256(token.encode('utf-8')).digest()[:TAILLE_EMPREINTE_QR]
+
+
+def jeton_session(session):
+    """
+    Jeton JWT courant d'une session (SessionCours), recalculé depuis sa date
+    d'expiration : l'encodage HS256 est déterministe, seule l'empreinte est
+    stockée. None si la session n'a pas de jeton, ou si le jeton recalculé ne
+    correspond plus à l'empreinte (SECRET_KEY changée) : le prochain
+    rafraîchissement du QR code en génère un nouveau.
+    """
+    if session.qr_empreinte is None or session.qr_expiration is None:
+        return None
+    jeton = _encoder_jeton(session, session.qr_expiration)
+    if not hmac.compare_digest(empreinte_qr(jeton), bytes(session.qr_empreinte)):
+        return None
+    return jeton
+
+
+class CacheJetons:
+    """
+    Cache LRU des jetons QR déjà vérifiés, indexé par empreinte SHA-256.
+
+    Pendant un début de cours, tous les étudiants scannent le même jeton :
+    seul le premier scan paie jwt.decode. Une entrée valide expire avec le
+    jeton lui-même (champ 'exp') ; un jeton invalide ou expiré est mémorisé
+    JETONS_CACHE_NEGATIF_SECONDES secondes pour que les rejeux ne coûtent rien.
+    Les refus ont leur propre LRU : une avalanche de jetons invalides n'évince
+    pas les jetons valides.
+    """
+
+    def __init__(self, taille=JETONS_CACHE_TAILLE, duree_negative=JETONS_CACHE_NEGATIF_SECONDES,
+                 taille_negative=JETONS_CACHE_NEGATIF_TAILLE):
+        self.taille = taille
+        self.taille_negative = taille_negative
+        self.duree_negative = duree_negative
+        self._entrees = OrderedDict()
+        self._refus = OrderedDict()
+        self._verrou = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lire(self, cle):
+        """ Retourne (trouvé, payload) ; payload vaut None pour un jeton refusé. """
+        maintenant = time.time()
+        with self._verrou:
+            for entrees in (self._entrees, self._refus):
+                entree = entrees.get(cle)
+                if entree is None:
+                    continue
+                if entree[0] <= maintenant:
+                    del entrees[cle]
+                    break
+                entrees.move_to_end(cle)
+                self.hits += 1
+                return True, entree[1]
+            self.misses += 1
+            return False, None
+
+    def ecrire(self, cle, payload):
+        if payload is None:
+            entrees, taille, expiration = self._refus, self.taille_negative, time.time() + self.duree_negative
+        else:
+            entrees, taille, expiration = self._entrees, self.taille, payload.get('exp', 0)
+        with self._verrou:
+            entrees[cle] = (expiration, payload)
+            entrees.move_to_end(cle)
+            if len(entrees) > taille:
+                entrees.popitem(last=False)
+
+    def vider(self):
+        with self._verrou:
+            self._entrees.clear()
+            self._refus.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def statistiques(self):
+        with self._verrou:
+            return {'hits': self.hits, 'misses': self.misses, 'taille': len(self._entrees), 'refus': len(self._refus)}
+
 
-    return token, expiration
+cache_jetons = CacheJetons()
 
 
 def valider_jeton_qr(token):
     """
-    Valide le jeton JWT.
-    Retourne le payload (contenant 'session_id') s'il est valide.
-    Lève une exception sinon (ExpiredSignatureError, InvalidTokenError).
+    Valide le jeton JWT (ou compact).
+    Retourne le payload (contenant 'session_id') s'il est valide, None sinon
+    (jeton expiré ou invalide, ou qui n'est pas une chaîne). Les résultats
+    sont mis en cache (CacheJetons).
     """
+    # Le jeton vient du corps de la requête : un nombre ou une liste JSON est refusé
+    if not isinstance(token, str):
+        return None
+    cle = hashlib.sha256(token.encode('utf-8')).digest()
+    trouve, payload = cache_jetons.lire(cle)
+    if trouve:
+        return None if payload is None else dict(payload)
+
     try:
-        # Vérifie la signature et l'expiration
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-        return payload
+        if token.startswith(PREFIXE_JETON_COMPACT):
+            payload = _verifier_jeton_compact(token)
+        else:
+            # Vérifie la signature et l'expiration
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
     except jwt.ExpiredSignatureError:
-        print("Erreur: Jeton expiré.")
-        return None
+        logger.debug("Jeton QR expiré.")
+        payload = None
     except jwt.InvalidTokenError:
-        print("Erreur: Jeton invalide.")
-        return None
\ No newline at end of file
+        logger.debug("Jeton QR invalide.")
+        payload = None
+
+    cache_jetons.ecrire(cle, payload)
+    return None if payload is None else dict(payload)
+
+
+def statistiques_cache_jetons():
+    """ Compteurs du cache des jetons vérifiés : {'hits', 'misses', 'taille', 'refus'}. """
+    return cache_jetons.statistiques()
+
+
+@lru_cache(maxsize=QR_CACHE_TAILLE)
+def rendre_qr(token, format_image='png', compact=False):
+    """
+    Retourne les octets de l'image du QR code d'un jeton.
+    format_image : 'png' (1 bit par pixel) ou 'svg'.
+    compact : PNG à un pixel par module, à agrandir côté navigateur
+    (CSS image-rendering: pixelated) ; sans effet sur le SVG.
+    Le rendu est mis en cache : un même jeton n'est dessiné qu'une fois.
+    """
+    if format_image == 'svg':
+        return qrcode.make(token, image_factory=SvgPathImage).to_string()
+
+    qr = qrcode.QRCode(box_size=1 if compact else 10)
+    qr.add_data(token)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image().save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def generer_qr_base64(token):
+    """
+    Génère l'image PNG compacte du QR code d'un jeton, encodée en base64 :
+    même rendu en cache que l'image servie par session_qr_image (compact=1).
+    """
+    return base64.b64encode(rendre_qr(token, 'png', True)).decode('utf-8')
+
+
+def empreinte_jeton(token):
+    """ Empreinte courte d'un jeton, utilisée comme ETag et pour versionner les URLs d'image. """
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]
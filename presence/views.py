@@ -1,18 +1,22 @@
+import os
 import json
-import io
-import base64
-import qrcode
+import datetime
 from rest_framework import viewsets
-from xhtml2pdf import pisa
-from psycopg2 import IntegrityError
+from django.db import IntegrityError
 
-from django.template.loader import get_template
+from django.conf import settings
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.contrib import messages
 from django.db import transaction
+from django.db.models import Count, Max, F, Q, FilteredRelation
+from django.db.models.functions import Coalesce
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import JsonResponse, HttpResponseForbidden, HttpResponse
+from django.http import (
+    JsonResponse, HttpResponseForbidden, HttpResponse, HttpResponseNotModified, Http404, StreamingHttpResponse,
+    FileResponse
+)
 from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 
@@ -24,18 +28,36 @@ from rest_framework.response import Response
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
+from presence_projet.connexions import statistiques_pool
 from comptes import models
 from comptes.models import Utilisateur, Departement, Formation
 from .forms import CoursForm, EtudiantUpdateForm, EtudiantCreationForm, EnseignantCreationForm, EnseignantUpdateForm, \
     FormationForm, DepartementForm
 from .models import Cours, SessionCours, Presence, Enseignant, Etudiant
-from .utils import generer_jeton_qr, valider_jeton_qr
+from .utils import (
+    generer_jeton_qr, valider_jeton_qr, generer_qr_base64, rendre_qr, empreinte_jeton,
+    jetons_compacts_actifs, generer_jeton_compact, jeton_courant, jeton_session, empreinte_qr,
+    QR_CODE_EXPIRATION_MINUTES
+)
+from .ingestion import get_ingestion
+from .flux import ouvrir_flux_presences, curseur_depart, reponse_sse
+from .analytics import matrice_cours, matrice_formation, matrice_departement, SEUIL_RISQUE
+from .exports import presences_a_exporter, lignes_csv, compresser_gzip
+from .rapports import (
+    get_rapports, nom_fichier_rapport, ErreurRendu, sessions_a_exporter, rapports_en_lot, archive_zip
+)
+from .rendu_pdf import MOTEURS
+from .resumes import bilan_etudiant, tableau_enseignant, invalider_tableaux_enseignants, supprimer_presences
+from .registry import (
+    enregistrer_session, retirer_session, get_session_active, construire_index_inscrits, est_inscrit
+)
 from rest_framework import viewsets, permissions
 from .serializers import (
     DepartementSerializer, FormationSerializer, EnseignantSerializer,
     EtudiantSerializer, CoursSerializer, SessionCoursSerializer, PresenceSerializer
 )
 from .permissions import IsEnseignant, IsEtudiant, IsAdmin
+from .replica import lecture_replica, LectureReplicaMixin
 
 # --- Helpers de rôle (Deprecated for API, kept for Template Views) ---
 def est_enseignant(user):
@@ -60,16 +82,9 @@ def home_view(request):
 # --- Vues Enseignant ---
 @user_passes_test(est_enseignant, login_url='/comptes/login/')
 def dashboard_enseignant(request):
-    profil_enseignant = request.user.enseignant
-    cours_list = Cours.objects.filter(enseignant=profil_enseignant)
-
-    # --- AJOUT : On vérifie s'il y a une session active pour chaque cours ---
-    for cours in cours_list:
-        # On cherche une session active pour ce cours
-        session_active = SessionCours.objects.filter(cours=cours, actif=True).first()
-        # On "attache" cette session temporairement à l'objet cours pour l'utiliser dans le HTML
-        cours.session_en_cours = session_active
-
+    # Une requête pour tous les cours (session active, présences du jour),
+    # mise en cache par enseignant (voir presence/resumes.py)
+    cours_list = tableau_enseignant(request.user.pk)
     return render(request, 'presence/dashboard_enseignant.html', {'cours_list': cours_list})
 
 
@@ -77,149 +92,476 @@ def dashboard_enseignant(request):
 def lancer_session(request, cours_id):
     profil_enseignant = request.user.enseignant
     cours = get_object_or_404(Cours, id=cours_id, enseignant=profil_enseignant)
-    SessionCours.objects.filter(cours=cours, actif=True).update(actif=False)
-    session = SessionCours.objects.create(cours=cours, enseignant=profil_enseignant)
-    jeton, expiration = generer_jeton_qr(session)
-    session.qr_token = jeton
-    session.qr_expiration = expiration
-    session.save()
+    session = demarrer_session(cours, profil_enseignant)
     return redirect('session_detail', session_id=session.id)
 
 
+def demarrer_session(cours, profil_enseignant):
+    """
+    Clôt les sessions actives du cours, en ouvre une nouvelle et prépare le
+    registre et l'index des inscrits pour les scans.
+    En mode compact, aucun jeton n'est stocké : il est recalculé à l'affichage.
+    """
+    anciennes_sessions = SessionCours.objects.filter(cours=cours, actif=True)
+    for ancienne_id in anciennes_sessions.values_list('id', flat=True):
+        retirer_session(ancienne_id)
+        get_ingestion().oublier_session(ancienne_id)
+    anciennes_sessions.update(actif=False)
+    session = SessionCours.objects.create(cours=cours, enseignant=profil_enseignant)
+    if not jetons_compacts_actifs():
+        jeton, expiration = generer_jeton_qr(session)
+        session.qr_empreinte = empreinte_qr(jeton)
+        session.qr_expiration = expiration
+        session.save()
+    enregistrer_session(session)
+    construire_index_inscrits(cours.id)
+    invalider_tableaux_enseignants({cours.enseignant_id, profil_enseignant.pk})
+    return session
+
+
 @user_passes_test(est_enseignant)
 def session_detail(request, session_id):
     profil_enseignant = request.user.enseignant
     session = get_object_or_404(SessionCours, id=session_id, enseignant=profil_enseignant)
-    qr_img = qrcode.make(session.qr_token)
-    buffer = io.BytesIO()
-    qr_img.save(buffer, format="PNG")
-    qr_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+    jeton = jeton_courant(session.id, jeton_session(session)) if session.actif else jeton_session(session)
+    if session.actif and jeton is None:
+        # Jeton stocké impossible à réencoder (SECRET_KEY ou contenu du JWT changés) : un nouveau est émis
+        jeton = renouveler_jeton(session)
+    if jetons_compacts_actifs():
+        intervalle_rafraichissement = settings.QR_COMPACT_FENETRE_SECONDES
+    else:
+        intervalle_rafraichissement = QR_CODE_EXPIRATION_MINUTES * 60
+    # L'image est servie par session_qr_image (mise en cache), on ne la génère plus ici
     return render(request, 'presence/session_detail.html', {
         'session': session,
-        'qr_image_base64': qr_base64
+        'qr_image_url': url_image_qr(session.id, jeton) if jeton else '',
+        'qr_rafraichissement_secondes': intervalle_rafraichissement,
+        # Flux SSE seulement servi par les vues asynchrones ; polling de get_presences_api sinon
+        'flux_presences': settings.PRESENCE_VUES_ASYNC,
     })
 
 
+def url_image_qr(session_id, jeton):
+    """ URL de l'image du QR code, versionnée par le jeton pour être mise en cache par le navigateur. """
+    return f"{reverse('session_qr_image', args=[session_id])}?compact=1&v={empreinte_jeton(jeton)}"
+
+
+@user_passes_test(est_enseignant)
+def session_qr_image(request, session_id):
+    """
+    Image brute du QR code courant d'une session, avec en-têtes de cache.
+    Paramètres : format=png|svg, compact=1 (PNG à un pixel par module).
+    """
+    profil_enseignant = request.user.enseignant
+    entree = get_session_active(session_id)
+    if entree is not None and entree.enseignant_id == profil_enseignant.pk:
+        if jetons_compacts_actifs():
+            jeton, expiration = generer_jeton_compact(session_id)
+        else:
+            jeton, expiration = entree.qr_token, entree.qr_expiration
+    else:
+        session = get_object_or_404(SessionCours, id=session_id, enseignant=profil_enseignant)
+        jeton, expiration = jeton_session(session), session.qr_expiration
+    if not jeton:
+        raise Http404("Aucun QR code pour cette session.")
+
+    format_image = 'svg' if request.GET.get('format') == 'svg' else 'png'
+    compact = request.GET.get('compact') == '1' and format_image == 'png'
+    etag = f'"{empreinte_jeton(jeton)}-{format_image}{"-compact" if compact else ""}"'
+
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        content_type = 'image/svg+xml' if format_image == 'svg' else 'image/png'
+        response = HttpResponse(rendre_qr(jeton, format_image, compact), content_type=content_type)
+
+    duree_restante = int((expiration - timezone.now()).total_seconds()) if expiration else 0
+    response['ETag'] = etag
+    response['Cache-Control'] = f'private, max-age={max(duree_restante, 0)}'
+    return response
+
+
 @swagger_auto_schema(
     method='get',
     operation_description="Rafraîchir le QR code d'une session active",
-    responses={200: openapi.Response("QR Code Base64", examples={"application/json": {"qr_image_base64": "..."}})}
+    manual_parameters=[
+        openapi.Parameter('base64', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description="1 : ajoute l'image PNG encodée en base64 (qr_image_base64)"),
+    ],
+    responses={200: openapi.Response("URL de l'image du QR code", examples={"application/json": {"qr_image_url": "..."}})}
 )
 @api_view(['GET'])
 @permission_classes([IsEnseignant])
 def rafraichir_qr(request, session_id):
     # Utilisation de la permission IsEnseignant
+    if jetons_compacts_actifs():
+        # Jeton calculé sans état depuis le registre (relu en base, en lecture
+        # seule, s'il n'a pas la session) : aucune écriture en base par rotation
+        entree = get_session_active(session_id)
+        if entree is None or entree.enseignant_id != request.user.pk:
+            get_object_or_404(SessionCours.objects.only('id'), id=session_id, enseignant_id=request.user.pk)
+            return JsonResponse({'error': 'Session terminée'}, status=400)
+        return reponse_qr(request, session_id, generer_jeton_compact(session_id)[0])
+
     profil_enseignant = request.user.enseignant
-    session = get_object_or_404(SessionCours, id=session_id, enseignant=profil_enseignant)
+    session = get_object_or_404(SessionCours.objects.select_related('cours'), id=session_id, enseignant=profil_enseignant)
     if not session.actif:
         return JsonResponse({'error': 'Session terminée'}, status=400)
+    return reponse_qr(request, session.id, renouveler_jeton(session))
+
+
+def renouveler_jeton(session):
+    """ Émet un nouveau jeton JWT pour une session active ; empreinte, expiration et registre mis à jour. """
     jeton, expiration = generer_jeton_qr(session)
-    session.qr_token = jeton
+    session.qr_empreinte = empreinte_qr(jeton)
     session.qr_expiration = expiration
     session.save()
-    qr_img = qrcode.make(jeton)
-    buffer = io.BytesIO()
-    qr_img.save(buffer, format="PNG")
-    qr_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    return JsonResponse({'qr_image_base64': qr_base64})
+    enregistrer_session(session)
+    return jeton
+
+
+def reponse_qr(request, session_id, jeton):
+    """
+    Réponse de rafraichir_qr : URL de l'image mise en cache (session_qr_image).
+    L'image en base64 n'est rendue que sur demande (?base64=1).
+    """
+    donnees = {'qr_image_url': url_image_qr(session_id, jeton)}
+    if demande_base64(request):
+        donnees['qr_image_base64'] = generer_qr_base64(jeton)
+    return JsonResponse(donnees)
+
+
+def demande_base64(request):
+    """ Vrai si le client demande l'image en base64 (paramètre base64=1). """
+    return request.GET.get('base64') == '1'
 
 
 @swagger_auto_schema(
     method='get',
-    operation_description="Récupérer la liste des étudiants présents pour une session",
-    responses={200: "Liste JSON des présences"}
+    operation_description=(
+        "Récupérer la liste des étudiants présents pour une session. "
+        "Avec since, seules les présences postérieures sont renvoyées. "
+        "Répond 304 si l'ETag envoyé (If-None-Match) est toujours valable."
+    ),
+    manual_parameters=[
+        openapi.Parameter('since', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description="Curseur renvoyé par l'appel précédent (id de présence) ou date ISO 8601"),
+    ],
+    responses={200: "Liste JSON des présences", 304: "Aucune nouvelle présence"}
 )
 @api_view(['GET'])
 @permission_classes([IsEnseignant | IsAdmin])
 def get_presences_api(request, session_id):
-    session = get_object_or_404(SessionCours, id=session_id)
+    session = get_object_or_404(SessionCours.objects.only('id', 'enseignant_id'), id=session_id)
 
     # Check ownership if not admin
     if not request.user.role == 'admin':
-        if session.enseignant != request.user.enseignant:
+        if session.enseignant_id != request.user.pk:
              return HttpResponseForbidden("Vous n'êtes pas le propriétaire de cette session.")
 
-    presences = Presence.objects.filter(session=session).order_by('horodatage_scan')
+    filtre = filtre_since(request.GET.get('since'))
+    if filtre is None:
+        return JsonResponse({'error': 'Paramètre since invalide.'}, status=400)
+
+    presences = Presence.objects.filter(session_id=session.id)
+    etag = etag_presences(session.id, presences.aggregate(dernier=Max('id'))['dernier'])
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    lignes = presences.filter(**filtre).order_by('id').values_list(*CHAMPS_PRESENCES_API)
+    response = JsonResponse(donnees_presences(lignes, filtre))
+    response['ETag'] = etag
+    return response
+
+
+# Une seule requête : les noms sont lus par jointure, sans requête par présence.
+CHAMPS_PRESENCES_API = ('id', 'etudiant__id__nom', 'etudiant__id__prenom', 'horodatage_scan')
+
+# Intervalle de polling de get_presences_api par la page de session (static/js/realtime_presence.js)
+INTERVALLE_POLLING_SECONDES = 5
+
+
+def filtre_since(since):
+    """
+    Filtre correspondant au paramètre since de get_presences_api : un id de
+    présence (curseur renvoyé par l'appel précédent) ou une date ISO 8601.
+    Retourne None si le paramètre est invalide (y compris une date
+    impossible, comme le 30 février).
+    """
+    if not since:
+        return {}
+    if since.isdigit():
+        return {'id__gt': int(since)}
+    try:
+        date = parse_datetime(since)
+    except ValueError:
+        return None
+    if date is None:
+        return None
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return {'horodatage_scan__gt': date}
+
+
+def etag_presences(session_id, dernier):
+    """
+    ETag de get_presences_api : session et id de sa dernière présence. Il ne
+    dépend pas de since, qui avance à chaque appel : le client qui a tout
+    reçu obtient 304 tant qu'aucun scan n'est enregistré.
+    """
+    return f'"{session_id}-{dernier or 0}"'
+
+
+def donnees_presences(lignes, filtre):
+    """ Corps de get_presences_api ; curseur est à repasser dans since au prochain appel. """
     presences_data = []
-    for p in presences:
+    curseur = filtre.get('id__gt', 0)
+    for presence_id, nom, prenom, horodatage in lignes:
         presences_data.append({
-            'nom': p.etudiant.id.nom,
-            'prenom': p.etudiant.id.prenom,
-            'heure': p.horodatage_scan.strftime('%H:%M:%S')
+            'id': presence_id,
+            'nom': nom,
+            'prenom': prenom,
+            'heure': horodatage.strftime('%H:%M:%S')
         })
-    return JsonResponse({'presences': presences_data})
+        curseur = presence_id
+    return {'presences': presences_data, 'curseur': curseur}
+
+
+@login_required(login_url='/comptes/login/')
+def presences_flux(request, session_id):
+    """
+    Flux SSE des présences de la session : seules les nouvelles présences
+    sont envoyées (voir presence/flux.py). Chaque flux occupe un thread :
+    503 au-delà de flux.FLUX_SYNCHRONES_MAX flux dans ce processus.
+    """
+    session = get_object_or_404(SessionCours.objects.only('id', 'enseignant_id'), id=session_id)
+    if request.user.role != 'admin' and session.enseignant_id != request.user.pk:
+        return HttpResponseForbidden("Vous n'êtes pas le propriétaire de cette session.")
+    flux = ouvrir_flux_presences(session.id, curseur_depart(request))
+    if flux is None:
+        response = JsonResponse({'error': 'Trop de flux ouverts, utiliser get-presences.'}, status=503)
+        response['Retry-After'] = str(INTERVALLE_POLLING_SECONDES)
+        return response
+    return reponse_sse(flux)
+
+
+@swagger_auto_schema(
+    method='get',
+    operation_description=(
+        "Indicateurs d'assiduité d'un cours, d'une formation ou d'un département : taux, "
+        "séries d'absences, étudiants à risque et remplissage des séances (presence/analytics.py)."
+    ),
+    manual_parameters=[
+        openapi.Parameter('seuil', openapi.IN_QUERY, type=openapi.TYPE_NUMBER,
+                          description=f"Taux en dessous duquel un étudiant est à risque (défaut {SEUIL_RISQUE})"),
+        openapi.Parameter('depuis', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Date ISO 8601 (incluse)"),
+        openapi.Parameter('jusqu_a', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Date ISO 8601 (exclue)"),
+    ],
+    responses={200: "Indicateurs JSON"}
+)
+@api_view(['GET'])
+@permission_classes([IsAdmin | IsEnseignant])
+@lecture_replica
+def analytics_api(request, portee, identifiant):
+    if portee not in ('cours', 'formation', 'departement'):
+        raise Http404("Périmètre inconnu.")
+    if portee != 'departement':
+        # Un département est désigné par son code ('INFO'), un cours ou une formation par son id
+        try:
+            identifiant = int(identifiant)
+        except ValueError:
+            return JsonResponse({'error': 'Identifiant invalide.'}, status=400)
+
+    # Les enseignants n'ont accès qu'aux cours qu'ils enseignent
+    if request.user.role != 'admin':
+        if portee != 'cours' or not Cours.objects.filter(id=identifiant, enseignant_id=request.user.pk).exists():
+            return HttpResponseForbidden("Accès réservé aux administrateurs.")
+
+    try:
+        seuil = float(request.GET.get('seuil', SEUIL_RISQUE))
+    except ValueError:
+        return JsonResponse({'error': 'Paramètre seuil invalide.'}, status=400)
+    try:
+        bornes = bornes_dates(request)
+    except ValueError as erreur:
+        return JsonResponse({'error': str(erreur)}, status=400)
+
+    if portee == 'cours':
+        matrice = matrice_cours(identifiant, **bornes)
+    elif portee == 'formation':
+        matrice = matrice_formation(identifiant, **bornes)
+    else:
+        matrice = matrice_departement(identifiant, **bornes)
+    return JsonResponse(matrice.resume(seuil))
+
+
+@swagger_auto_schema(
+    method='get',
+    operation_description=(
+        "Compteurs du pool de connexions PostgreSQL du processus qui répond (emprunts, attentes, "
+        "expirations, taille...), pour chaque base ; null sans pool (presence_projet/connexions.py)."
+    ),
+    responses={200: "Compteurs JSON"}
+)
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def connexions_api(request):
+    # Chaque worker a son propre pool : le pid distingue les réponses
+    return JsonResponse({
+        'pid': os.getpid(),
+        'bases': {alias: statistiques_pool(alias) for alias in settings.DATABASES},
+    })
+
+
+def bornes_dates(request):
+    """
+    Lit les paramètres depuis / jusqu_a (date ou date-heure ISO 8601) de la requête.
+    Lève ValueError si l'un d'eux est invalide.
+    """
+    bornes = {}
+    for parametre in ('depuis', 'jusqu_a'):
+        if request.GET.get(parametre):
+            valeur = parse_datetime(request.GET[parametre]) or parse_date(request.GET[parametre])
+            if valeur is None:
+                raise ValueError(f'Paramètre {parametre} invalide.')
+            if not isinstance(valeur, datetime.datetime):
+                valeur = datetime.datetime.combine(valeur, datetime.time.min)
+            bornes[parametre] = timezone.make_aware(valeur) if timezone.is_naive(valeur) else valeur
+    return bornes
+
+
+@login_required(login_url='/comptes/login/')
+def export_presences_csv(request):
+    """
+    Export CSV des présences, diffusé en continu (voir presence/exports.py).
+    Filtres : cours (répétable), formation, departement, depuis, jusqu_a.
+    Avec compression=gzip, le fichier est compressé à la volée.
+    Les enseignants n'exportent que leurs propres cours : demander le cours
+    d'un autre enseignant est refusé.
+    """
+    if request.user.role not in ('admin', 'enseignant'):
+        return HttpResponseForbidden("Accès réservé aux enseignants et administrateurs.")
+
+    try:
+        bornes = bornes_dates(request)
+        cours_ids = [int(cours_id) for cours_id in request.GET.getlist('cours')] or None
+        formation_id = int(request.GET['formation']) if request.GET.get('formation') else None
+    except ValueError as erreur:
+        return JsonResponse({'error': str(erreur)}, status=400)
+
+    if request.user.role == 'enseignant':
+        cours_enseignant = Cours.objects.filter(enseignant_id=request.user.pk)
+        if cours_ids is not None:
+            cours_enseignant = cours_enseignant.filter(id__in=cours_ids)
+        demandes, cours_ids = cours_ids, list(cours_enseignant.values_list('id', flat=True))
+        if demandes is not None and set(demandes) - set(cours_ids):
+            return HttpResponseForbidden("Vous ne pouvez exporter que vos propres cours.")
+
+    presences = presences_a_exporter(
+        cours_ids=cours_ids,
+        formation_id=formation_id,
+        departement_code=request.GET.get('departement') or None,
+        **bornes,
+    )
+    nom_fichier = f"presences_{timezone.localdate():%Y%m%d}.csv"
+
+    if request.GET.get('compression') == 'gzip':
+        response = StreamingHttpResponse(compresser_gzip(lignes_csv(presences)), content_type='application/gzip')
+        nom_fichier += '.gz'
+    else:
+        response = StreamingHttpResponse(lignes_csv(presences), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{nom_fichier}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 # --- Vues Étudiant ---
 @user_passes_test(est_etudiant, login_url='/comptes/login/')
+@lecture_replica
 def scanner_etudiant(request):
     profil_etudiant = request.user.etudiant
 
-    # 1. On garde l'historique global pour l'affichage par défaut
-    historique_global = Presence.objects.filter(etudiant=profil_etudiant).order_by('-horodatage_scan')[:5]
-
-    # 2. On récupère les cours
-    cours_inscrits = profil_etudiant.cours_inscrits.all()
-
-    # 3. On prépare les données détaillées pour chaque cours
-    cours_stats = {}
-
-    for cours in cours_inscrits:
-        # Récupérer toutes les sessions *terminées* ou *commencées* pour ce cours
-        sessions_passees = SessionCours.objects.filter(cours=cours).order_by('-date_debut')
-        total_sessions = sessions_passees.count()
-
-        # Récupérer les présences de l'étudiant pour ce cours
-        presences = Presence.objects.filter(etudiant=profil_etudiant, session__cours=cours).select_related('session')
-        nb_presences = presences.count()
-
-        # Calcul des absences
-        nb_absences = total_sessions - nb_presences
-        if nb_absences < 0: nb_absences = 0
-
-        # Liste détaillée des dates de présence
-        historique_cours = []
-        ids_sessions_presentes = []
-
-        for p in presences:
-            historique_cours.append({
-                'date': p.session.date_debut.strftime("%d/%m/%Y"),
-                'heure': p.session.date_debut.strftime("%H:%M"),
-                'statut': 'Présent',
-                'couleur': 'success'
-            })
-            ids_sessions_presentes.append(p.session.id)
-
-        for s in sessions_passees:
-            if s.id not in ids_sessions_presentes:
-                historique_cours.append({
-                    'date': s.date_debut.strftime("%d/%m/%Y"),
-                    'heure': s.date_debut.strftime("%H:%M"),
-                    'statut': 'Absent',
-                    'couleur': 'danger'
-                })
-
-        historique_cours.sort(key=lambda x: x['date'], reverse=True)
-
-        cours_stats[cours.id] = {
-            'nom': cours.nom,
-            'code': cours.code,
-            'total': total_sessions,
-            'present': nb_presences,
-            'absent': nb_absences,
-            'historique': historique_cours
-        }
+    # Bilan par cours (séances, présences, absences, historique) et présences
+    # récentes, mis en cache par étudiant (voir presence/resumes.py)
+    bilan = bilan_etudiant(profil_etudiant.pk)
+    cours_stats = {cours['id']: cours for cours in bilan['cours']}
 
     cours_stats_json = json.dumps(cours_stats)
 
     return render(request, 'presence/scanner_etudiant.html', {
         'profil': profil_etudiant,
-        'cours_inscrits': cours_inscrits,
-        'historique': historique_global,
+        'cours_inscrits': bilan['cours'],
+        'historique': bilan['recentes'],
         'cours_stats_json': cours_stats_json,
     })
 
 
+# Taille d'une page d'historique (historique_cours_api)
+TAILLE_PAGE_HISTORIQUE = 20
+TAILLE_PAGE_HISTORIQUE_MAX = 100
+
+
+@swagger_auto_schema(
+    method='get',
+    operation_description=(
+        "Historique présent/absent de l'étudiant connecté pour un cours, des séances les plus "
+        "récentes aux plus anciennes. Pour la page suivante, repasser la valeur 'suivant' dans curseur."
+    ),
+    manual_parameters=[
+        openapi.Parameter('curseur', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description="Curseur renvoyé par la page précédente"),
+        openapi.Parameter('limite', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description=f"Nombre de séances (défaut {TAILLE_PAGE_HISTORIQUE}, max {TAILLE_PAGE_HISTORIQUE_MAX})"),
+    ],
+    responses={200: "Page d'historique", 404: "Cours non suivi"}
+)
+@api_view(['GET'])
+@permission_classes([IsEtudiant])
+def historique_cours_api(request, cours_id):
+    etudiant_id = request.user.pk
+    if not est_inscrit(cours_id, etudiant_id):
+        raise Http404("Cours non suivi.")
+
+    try:
+        limite = min(max(int(request.GET.get('limite', TAILLE_PAGE_HISTORIQUE)), 1), TAILLE_PAGE_HISTORIQUE_MAX)
+    except ValueError:
+        limite = TAILLE_PAGE_HISTORIQUE
+
+    # Pagination par clé (date_debut, id) : le coût d'une page ne dépend pas de sa position.
+    seances = SessionCours.objects.filter(cours_id=cours_id)
+    curseur = request.GET.get('curseur')
+    if curseur:
+        date_curseur, _, id_curseur = curseur.rpartition('|')
+        date_curseur = parse_datetime(date_curseur)
+        if date_curseur is None or not id_curseur.isdigit():
+            return JsonResponse({'error': 'Curseur invalide.'}, status=400)
+        seances = seances.filter(
+            Q(date_debut__lt=date_curseur) | Q(date_debut=date_curseur, id__lt=int(id_curseur))
+        )
+
+    # Une seule jointure externe vers la présence de l'étudiant à chaque séance
+    seances = seances.annotate(
+        presence_etudiant=FilteredRelation('presence', condition=Q(presence__etudiant_id=etudiant_id)),
+    ).order_by('-date_debut', '-id').values_list('id', 'date_debut', 'presence_etudiant__id')[:limite + 1]
+
+    lignes = list(seances)
+    page, reste = lignes[:limite], lignes[limite:]
+    historique = [{
+        'date': date_debut.strftime("%d/%m/%Y"),
+        'heure': date_debut.strftime("%H:%M"),
+        'statut': 'Présent' if presence_id else 'Absent',
+        'couleur': 'success' if presence_id else 'danger'
+    } for _, date_debut, presence_id in page]
+
+    suivant = None
+    if reste:
+        dernier_id, derniere_date, _ = page[-1]
+        suivant = f'{derniere_date.isoformat()}|{dernier_id}'
+    return JsonResponse({'historique': historique, 'suivant': suivant})
+
+
 # =======================================================
 # ==== API VALIDER SCAN (ADAPTÉE POUR SWAGGER) ====
 # =======================================================
@@ -251,7 +593,8 @@ def valider_scan(request):
     # Avec @api_view, request.data contient les données POST (JSON ou Form)
     # Plus besoin de vérifier request.user.etudiant manuellement grâce à IsEtudiant
 
-    jeton_scanne = request.data.get('jeton')
+    # Un corps JSON qui n'est pas un objet (liste...) ne contient pas de jeton
+    jeton_scanne = request.data.get('jeton') if hasattr(request.data, 'get') else None
 
     if not jeton_scanne:
         return JsonResponse({'success': False, 'message': 'Aucun jeton fourni.'})
@@ -262,34 +605,32 @@ def valider_scan(request):
     if payload is None:
         return JsonResponse({'success': False, 'message': 'QR Code expiré ou invalide.'})
 
-    # Récupérer la session
-    try:
-        session = SessionCours.objects.get(id=payload['session_id'], actif=True)
-    except SessionCours.DoesNotExist:
+    # Récupérer la session depuis le registre des sessions actives (sans requête SQL)
+    session = get_session_active(payload['session_id'])
+    if session is None:
         return JsonResponse({'success': False, 'message': 'Session de cours introuvable ou terminée.'})
 
-    # Vérifier que le QR code correspond
-    if session.qr_token != jeton_scanne:
-        return JsonResponse({'success': False, 'message': 'QR Code périmé.'})
+    # Vérifier que le QR code correspond (les jetons compacts sont déjà bornés par leur fenêtre de temps).
+    # Le jeton a pu être rafraîchi par un autre processus : on relit la base avant de refuser.
+    if not payload.get('compact') and not session.jeton_correspond(jeton_scanne):
+        session = get_session_active(payload['session_id'], rafraichir=True)
+        if session is None or not session.jeton_correspond(jeton_scanne):
+            return JsonResponse({'success': False, 'message': 'QR Code périmé.'})
 
     profil_etudiant = request.user.etudiant
 
-    # Utiliser profil_etudiant.id
-    if not session.cours.etudiants.filter(id=profil_etudiant.id).exists():
-        return JsonResponse({'success': False, 'message': f'Vous n\'êtes pas inscrit au cours {session.cours.nom}.'})
+    # Vérification d'inscription via l'index trié du cours (sans requête SQL)
+    if not est_inscrit(session.cours_id, profil_etudiant.pk):
+        return JsonResponse({'success': False, 'message': f'Vous n\'êtes pas inscrit au cours {session.cours_nom}.'})
 
-    # Enregistrer la présence
-    presence, created = Presence.objects.get_or_create(
-        etudiant=profil_etudiant,
-        session=session,
-        defaults={'qr_token_utilise': jeton_scanne}
-    )
+    # Enregistrer la présence (écriture différée par lots, doublons détectés en mémoire)
+    created = get_ingestion().soumettre(session.session_id, profil_etudiant.pk, jeton_scanne)
 
     if created:
         return JsonResponse({
             'success': True,
-            'message': f'Présence validée pour {session.cours.nom} !',
-            'cours_nom': session.cours.nom
+            'message': f'Présence validée pour {session.cours_nom} !',
+            'cours_nom': session.cours_nom
         })
     else:
         return JsonResponse({'success': False, 'message': 'Présence déjà enregistrée pour cette session.'})
@@ -359,6 +700,7 @@ def creer_cours_view(request):
 
 # --- Vues de Gestion (CRUD) ---
 @user_passes_test(est_admin)
+@lecture_replica
 def cours_list_view(request):
     cours_list = Cours.objects.all().select_related('enseignant__id')
     return render(request, 'presence/cours/cours_list.html', {'cours_list': cours_list})
@@ -409,6 +751,7 @@ def cours_delete_view(request, pk):
 
 # --- CRUD Département ---
 @user_passes_test(est_admin)
+@lecture_replica
 def departement_list_view(request):
     departements = Departement.objects.all()
     return render(request, 'presence/departement/departement_list.html', {'departements': departements})
@@ -460,6 +803,7 @@ def departement_delete_view(request, pk):
 
 # --- CRUD Formation ---
 @user_passes_test(est_admin)
+@lecture_replica
 def formation_list_view(request):
     formations = Formation.objects.all().select_related('departement')
     return render(request, 'presence/formation/formation_list.html', {'formations': formations})
@@ -517,6 +861,7 @@ def formation_delete_view(request, pk):
 
 # --- CRUD Enseignant ---
 @user_passes_test(est_admin)
+@lecture_replica
 def enseignant_list_view(request):
     enseignants = Enseignant.objects.all().select_related('id', 'departement')
     return render(request, 'presence/Enseignant/Enseignant_list.html', {'enseignants': enseignants})
@@ -603,6 +948,7 @@ def enseignant_delete_view(request, pk):
 
 # --- CRUD Étudiant ---
 @user_passes_test(est_admin)
+@lecture_replica
 def etudiant_list_view(request):
     etudiants = Etudiant.objects.all().select_related('id', 'formation')
     return render(request, 'presence/Etudiant/etudiant_list.html', {'etudiants': etudiants})
@@ -867,26 +1213,35 @@ def arreter_session(request, session_id):
         session.actif = False
         session.date_fin = timezone.now()
         session.save()
+        retirer_session(session.id)
+        get_ingestion().oublier_session(session.id)
+        invalider_tableaux_enseignants([profil_enseignant.pk])
         messages.success(request, "La session a été clôturée avec succès.")
 
     return redirect('dashboard_enseignant')
 
 
 @user_passes_test(est_enseignant)
+@lecture_replica
 def cours_statistiques(request, cours_id):
     profil_enseignant = request.user.enseignant
     cours = get_object_or_404(Cours, id=cours_id, enseignant=profil_enseignant)
 
-    sessions = SessionCours.objects.filter(cours=cours).order_by('-date_debut')
-    total_sessions = sessions.count()
-    etudiants = cours.etudiants.all()
+    # Deux lectures indexées des résumés (voir presence/resumes.py) au lieu d'un COUNT par étudiant et par séance
+    sessions = list(
+        SessionCours.objects.filter(cours=cours).annotate(
+            nb_presences=Coalesce(F('resume__nb_presences'), 0)
+        ).order_by('-date_debut')
+    )
+    total_sessions = len(sessions)
+    etudiants = cours.etudiants.select_related('id').annotate(
+        resume_cours=FilteredRelation('resumepresenceetudiant', condition=Q(resumepresenceetudiant__cours=cours)),
+        nb_presences=Coalesce(F('resume_cours__nb_presences'), 0),
+    )
 
     data_etudiants = []
     for etudiant in etudiants:
-        presences_count = Presence.objects.filter(
-            etudiant=etudiant,
-            session__cours=cours
-        ).count()
+        presences_count = etudiant.nb_presences
 
         taux = 0
         if total_sessions > 0:
@@ -901,10 +1256,9 @@ def cours_statistiques(request, cours_id):
     graph_dates = []
     graph_counts = []
 
-    for sess in sessions.reverse():
-        count = Presence.objects.filter(session=sess).count()
+    for sess in reversed(sessions):
         graph_dates.append(sess.date_debut.strftime("%d/%m"))
-        graph_counts.append(count)
+        graph_counts.append(sess.nb_presences)
 
     context = {
         'cours': cours,
@@ -917,89 +1271,125 @@ def cours_statistiques(request, cours_id):
     return render(request, 'presence/cours_statistiques.html', context)
 
 
+# Délai conseillé entre deux interrogations d'un rapport en cours de rendu (secondes)
+DELAI_RAPPORT_EN_COURS = 2
+
+
 @user_passes_test(est_enseignant)
+@lecture_replica
 def session_pdf_view(request, session_id):
+    """
+    Feuille de présence PDF de la session (voir presence/rapports.py).
+    Le fichier déjà rendu est servi directement ; sinon le rendu est lancé en
+    arrière-plan et la réponse est un 202 à interroger de nouveau.
+    ?moteur=reportlab|xhtml2pdf choisit le moteur de rendu (défaut : réglage MOTEUR).
+    """
+    moteur = request.GET.get('moteur') or None
+    if moteur is not None and moteur not in MOTEURS:
+        return JsonResponse({'error': 'Paramètre moteur invalide.'}, status=400)
     profil_enseignant = request.user.enseignant
-    session = get_object_or_404(SessionCours, id=session_id, enseignant=profil_enseignant)
-
-    etudiants_inscrits = session.cours.etudiants.all().select_related('id').order_by('id__nom')
-    ids_presents = Presence.objects.filter(session=session).values_list('etudiant_id', flat=True)
-
-    liste_etudiants = []
-    present_count = 0
-
-    for etu in etudiants_inscrits:
-        est_present = etu.id.id in ids_presents
-        if est_present:
-            present_count += 1
-
-        liste_etudiants.append({
-            'nom': etu.id.nom,
-            'prenom': etu.id.prenom,
-            'statut': 'PRÉSENT' if est_present else 'ABSENT',
-            'color': '#198754' if est_present else '#dc3545'
-        })
+    session = get_object_or_404(
+        SessionCours.objects.select_related('cours', 'enseignant__id'), id=session_id, enseignant=profil_enseignant
+    )
 
-    context = {
-        'session': session,
-        'liste_etudiants': liste_etudiants,
-        'total_inscrits': etudiants_inscrits.count(),
-        'total_presents': present_count,
-        'enseignant': profil_enseignant
-    }
+    try:
+        chemin = get_rapports().demander(session, moteur)
+    except ErreurRendu:
+        return HttpResponse('Erreur lors de la génération du PDF', status=500)
+
+    if chemin is None:
+        url = request.get_full_path()
+        if 'text/html' in request.headers.get('Accept', ''):
+            response = render(request, 'presence/pdf/rapport_en_cours.html', {
+                'session': session, 'url': url, 'delai': DELAI_RAPPORT_EN_COURS,
+            }, status=202)
+        else:
+            response = JsonResponse({'statut': 'en_cours', 'url': url}, status=202)
+        response['Location'] = url
+        response['Retry-After'] = str(DELAI_RAPPORT_EN_COURS)
+        return response
 
-    template_path = 'presence/pdf/session_report.html'
-    response = HttpResponse(content_type='application/pdf')
-    filename = f"Presence_{session.cours.nom}_{session.date_debut.strftime('%d-%m-%Y')}.pdf"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return FileResponse(
+        open(chemin, 'rb'), as_attachment=True, filename=nom_fichier_rapport(session), content_type='application/pdf'
+    )
 
-    template = get_template(template_path)
-    html = template.render(context)
-    pisa_status = pisa.CreatePDF(html, dest=response)
 
-    if pisa_status.err:
-        return HttpResponse('Erreur lors de la génération du PDF <pre>' + html + '</pre>')
+@login_required(login_url='/comptes/login/')
+def export_rapports_zip(request):
+    """
+    Archive ZIP des feuilles de présence de toutes les sessions d'un ou
+    plusieurs cours (cours, répétable) ou des cours d'une formation
+    (formation), rendues en parallèle et diffusées au fil des rendus (voir
+    presence/rapports.py). Filtres optionnels : depuis, jusqu_a, moteur.
+    Les enseignants n'exportent que leurs propres cours.
+    """
+    if request.user.role not in ('admin', 'enseignant'):
+        return HttpResponseForbidden("Accès réservé aux enseignants et administrateurs.")
 
+    try:
+        bornes = bornes_dates(request)
+        cours_ids = [int(cours_id) for cours_id in request.GET.getlist('cours')] or None
+        formation_id = int(request.GET['formation']) if request.GET.get('formation') else None
+    except ValueError as erreur:
+        return JsonResponse({'error': str(erreur)}, status=400)
+    if cours_ids is None and formation_id is None:
+        return JsonResponse({'error': 'Paramètre cours ou formation requis.'}, status=400)
+    moteur = request.GET.get('moteur') or None
+    if moteur is not None and moteur not in MOTEURS:
+        return JsonResponse({'error': 'Paramètre moteur invalide.'}, status=400)
+
+    sessions = sessions_a_exporter(cours_ids=cours_ids, formation_id=formation_id, **bornes)
+    if request.user.role == 'enseignant':
+        sessions = sessions.filter(cours__enseignant_id=request.user.pk)
+
+    response = StreamingHttpResponse(archive_zip(rapports_en_lot(sessions, moteur=moteur)), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="feuilles_presence_{timezone.localdate():%Y%m%d}.zip"'
+    response['X-Accel-Buffering'] = 'no'
     return response
 
-class DepartementViewSet(viewsets.ModelViewSet):
+
+class DepartementViewSet(LectureReplicaMixin, viewsets.ModelViewSet):
     """ API Admin : Gérer les départements """
     queryset = Departement.objects.all()
     serializer_class = DepartementSerializer
     permission_classes = [IsAdmin] # Security: Only Admins can modify departments
 
-class FormationViewSet(viewsets.ModelViewSet):
+class FormationViewSet(LectureReplicaMixin, viewsets.ModelViewSet):
     """ API Admin : Gérer les formations """
     queryset = Formation.objects.all()
     serializer_class = FormationSerializer
     permission_classes = [IsAdmin] # Security: Only Admins can modify formations
 
-class EnseignantViewSet(viewsets.ModelViewSet):
+class EnseignantViewSet(LectureReplicaMixin, viewsets.ModelViewSet):
     """ API Admin : Gérer les enseignants """
     queryset = Enseignant.objects.all()
     serializer_class = EnseignantSerializer
     permission_classes = [IsAdmin] # Security: Only Admins can manage teachers
 
-class EtudiantViewSet(viewsets.ModelViewSet):
+class EtudiantViewSet(LectureReplicaMixin, viewsets.ModelViewSet):
     """ API Admin : Gérer les étudiants """
     queryset = Etudiant.objects.all()
     serializer_class = EtudiantSerializer
     permission_classes = [IsAdmin] # Security: Only Admins can manage students
 
-class CoursViewSet(viewsets.ModelViewSet):
+class CoursViewSet(LectureReplicaMixin, viewsets.ModelViewSet):
     """ API Admin/Enseignant : Gérer les cours """
     queryset = Cours.objects.all()
     serializer_class = CoursSerializer
     permission_classes = [IsAdmin] # Security: Admins manage course structure
 
-class SessionCoursViewSet(viewsets.ModelViewSet):
+class SessionCoursViewSet(LectureReplicaMixin, viewsets.ModelViewSet):
     """ API Enseignant : Gérer les sessions """
     queryset = SessionCours.objects.all()
     serializer_class = SessionCoursSerializer
     permission_classes = [IsAdmin] # Security: Legacy API, Admins only. Teachers use custom endpoints.
 
-class PresenceViewSet(viewsets.ModelViewSet):
+class PresenceViewSet(LectureReplicaMixin, viewsets.ModelViewSet):
     """ API : Voir les présences """
     queryset = Presence.objects.all()
     serializer_class = PresenceSerializer
-    permission_classes = [IsAdmin] # Security: Admins only. Real-time presence is handled via custom endpoints.
\ No newline at end of file
+    permission_classes = [IsAdmin] # Security: Admins only. Real-time presence is handled via custom endpoints.
+
+    def perform_destroy(self, instance):
+        # Pas de signal de suppression sur Presence : les résumés sont mis à jour ici
+        supprimer_presences(Presence.objects.filter(pk=instance.pk))
\ No newline at end of file
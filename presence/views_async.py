@@ -0,0 +1,151 @@
+"""
+Versions asynchrones des endpoints les plus sollicités (scan et suivi en direct).
+
+Elles sont branchées sur les mêmes URLs que leurs équivalents de views.py
+lorsque PRESENCE_VUES_ASYNC est activé et que le projet est servi par un
+serveur ASGI (voir presence_projet/asgi.py). Une connexion en attente ne
+mobilise alors plus de thread : un seul worker peut servir des milliers de
+scans et de requêtes de suivi simultanés.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.db.models import Max
+from django.http import JsonResponse, HttpResponseForbidden, HttpResponseNotModified
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .authentication import acces_async
+from .flux import aflux_presences, curseur_depart, reponse_sse
+from .ingestion import get_ingestion
+from .models import SessionCours, Presence
+from .registry import aenregistrer_session, aget_session_active, aest_inscrit
+from .utils import (
+    generer_jeton_qr, valider_jeton_qr, generer_qr_base64, jetons_compacts_actifs, generer_jeton_compact,
+    empreinte_qr
+)
+from .views import url_image_qr, demande_base64, filtre_since, etag_presences, donnees_presences, CHAMPS_PRESENCES_API
+
+
+def _donnees_requete(request):
+    """ Équivalent de request.data (DRF) : corps JSON ou formulaire. """
+    if request.content_type == 'application/json':
+        try:
+            donnees = json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+        return donnees if isinstance(donnees, dict) else {}
+    return request.POST
+
+
+@csrf_exempt
+@require_POST
+@acces_async('etudiant', jwt_seulement=True)
+async def valider_scan(request):
+    """
+    Validation du scan QR code par un étudiant (version asynchrone).
+    """
+    jeton_scanne = _donnees_requete(request).get('jeton')
+
+    if not jeton_scanne:
+        return JsonResponse({'success': False, 'message': 'Aucun jeton fourni.'})
+
+    payload = valider_jeton_qr(jeton_scanne)
+
+    if payload is None:
+        return JsonResponse({'success': False, 'message': 'QR Code expiré ou invalide.'})
+
+    session = await aget_session_active(payload['session_id'])
+    if session is None:
+        return JsonResponse({'success': False, 'message': 'Session de cours introuvable ou terminée.'})
+
+    if not payload.get('compact') and not session.jeton_correspond(jeton_scanne):
+        session = await aget_session_active(payload['session_id'], rafraichir=True)
+        if session is None or not session.jeton_correspond(jeton_scanne):
+            return JsonResponse({'success': False, 'message': 'QR Code périmé.'})
+
+    etudiant_id = request.user.pk
+
+    if not await aest_inscrit(session.cours_id, etudiant_id):
+        return JsonResponse({'success': False, 'message': f'Vous n\'êtes pas inscrit au cours {session.cours_nom}.'})
+
+    created = await get_ingestion().asoumettre(session.session_id, etudiant_id, jeton_scanne)
+
+    if created:
+        return JsonResponse({
+            'success': True,
+            'message': f'Présence validée pour {session.cours_nom} !',
+            'cours_nom': session.cours_nom
+        })
+    else:
+        return JsonResponse({'success': False, 'message': 'Présence déjà enregistrée pour cette session.'})
+
+
+@require_GET
+@acces_async('enseignant')
+async def rafraichir_qr(request, session_id):
+    if jetons_compacts_actifs():
+        # Registre relu en base en lecture seule : aucune écriture par rotation
+        entree = await aget_session_active(session_id)
+        if entree is None or entree.enseignant_id != request.user.pk:
+            await aget_object_or_404(SessionCours.objects.only('id'), id=session_id, enseignant_id=request.user.pk)
+            return JsonResponse({'error': 'Session terminée'}, status=400)
+        return await reponse_qr(request, session_id, generer_jeton_compact(session_id)[0])
+
+    session = await aget_object_or_404(
+        SessionCours.objects.select_related('cours'), id=session_id, enseignant_id=request.user.pk
+    )
+    if not session.actif:
+        return JsonResponse({'error': 'Session terminée'}, status=400)
+    jeton, expiration = generer_jeton_qr(session)
+    session.qr_empreinte = empreinte_qr(jeton)
+    session.qr_expiration = expiration
+    await session.asave(update_fields=['qr_empreinte', 'qr_expiration'])
+    await aenregistrer_session(session)
+    return await reponse_qr(request, session.id, jeton)
+
+
+async def reponse_qr(request, session_id, jeton):
+    """ Variante asynchrone de views.reponse_qr. """
+    donnees = {'qr_image_url': url_image_qr(session_id, jeton)}
+    if demande_base64(request):
+        # Le rendu de l'image (Pillow) est fait hors de la boucle d'événements.
+        donnees['qr_image_base64'] = await sync_to_async(generer_qr_base64, thread_sensitive=False)(jeton)
+    return JsonResponse(donnees)
+
+
+@require_GET
+@acces_async('enseignant', 'admin')
+async def get_presences_api(request, session_id):
+    session = await aget_object_or_404(SessionCours.objects.only('id', 'enseignant_id'), id=session_id)
+
+    if request.user.role != 'admin' and session.enseignant_id != request.user.pk:
+        return HttpResponseForbidden("Vous n'êtes pas le propriétaire de cette session.")
+
+    filtre = filtre_since(request.GET.get('since'))
+    if filtre is None:
+        return JsonResponse({'error': 'Paramètre since invalide.'}, status=400)
+
+    presences = Presence.objects.filter(session_id=session.id)
+    etag = etag_presences(session.id, (await presences.aaggregate(dernier=Max('id')))['dernier'])
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    lignes = presences.filter(**filtre).order_by('id').values_list(*CHAMPS_PRESENCES_API)
+    response = JsonResponse(donnees_presences([ligne async for ligne in lignes], filtre))
+    response['ETag'] = etag
+    return response
+
+
+@require_GET
+@acces_async('enseignant', 'admin')
+async def presences_flux(request, session_id):
+    session = await aget_object_or_404(SessionCours.objects.only('id', 'enseignant_id'), id=session_id)
+
+    if request.user.role != 'admin' and session.enseignant_id != request.user.pk:
+        return HttpResponseForbidden("Vous n'êtes pas le propriétaire de cette session.")
+
+    return reponse_sse(aflux_presences(session.id, curseur_depart(request)))
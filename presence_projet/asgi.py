@@ -3,6 +3,10 @@ ASGI config for presence_projet project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+To serve the project in ASGI mode (async scan and live-presence endpoints)::
+
+    PRESENCE_VUES_ASYNC=True uvicorn presence_projet.asgi:application --host 0.0.0.0 --port 8000
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -0,0 +1,87 @@
+"""
+Connexions PostgreSQL : pool de connexions par processus et compteurs.
+
+Sans réglage, Django ouvre une connexion par requête (CONN_MAX_AGE = 0) : pendant
+une tempête de scans, chaque scan paie la connexion TCP et l'authentification.
+`configurer_postgresql` complète l'entrée DATABASES :
+
+- avec psycopg 3 et psycopg_pool, le pool natif de Django (OPTIONS['pool']) :
+  `taille_min` connexions gardées ouvertes, jusqu'à `taille_max`, et une requête
+  qui attend plus de `attente` secondes une connexion libre échoue ;
+- avec psycopg2 seul, des connexions persistantes par thread (CONN_MAX_AGE).
+
+Dans les deux cas, une connexion fermée côté serveur est détectée avant d'être
+réutilisée (CONN_HEALTH_CHECKS). Derrière pgbouncer en mode transaction, une
+connexion serveur change d'une transaction à l'autre : `pgbouncer=True` désactive
+les curseurs côté serveur et les requêtes préparées de psycopg 3.
+
+Une connexion du pool est empruntée à la première requête SQL d'un thread et
+rendue à la fin de la requête HTTP. Les traitements longs la rendent
+eux-mêmes après chaque lecture (flux SSE de presence/flux.py, thread
+d'ingestion) : le pool se dimensionne sur le nombre de requêtes HTTP traitées
+en même temps par le processus (threads du worker), plus un pour l'ingestion,
+et non sur le nombre de pages de suivi ouvertes.
+
+`statistiques_pool` relève les compteurs du pool du processus (emprunts,
+attentes, expirations...) pour le dimensionner à partir de mesures.
+"""
+import importlib.util
+
+# Durée de vie d'une connexion persistante sans pool (psycopg2), en secondes
+DUREE_CONNEXION_PERSISTANTE = 60
+
+# Compteurs de psycopg_pool.ConnectionPool.get_stats(), sous leurs noms ici
+COMPTEURS_POOL = {
+    'requests_num': 'emprunts',
+    'requests_queued': 'attentes',
+    'requests_wait_ms': 'attente_ms',
+    'requests_errors': 'expirations',
+    'returns_bad': 'retours_invalides',
+    'connections_num': 'connexions_ouvertes',
+    'connections_lost': 'connexions_perdues',
+    'pool_min': 'taille_min',
+    'pool_max': 'taille_max',
+    'pool_size': 'taille',
+    'pool_available': 'disponibles',
+    'requests_waiting': 'en_attente',
+}
+
+
+def pool_disponible():
+    """ Vrai si le pool natif de Django est utilisable (psycopg 3 et psycopg_pool). """
+    return all(importlib.util.find_spec(module) is not None for module in ('psycopg', 'psycopg_pool'))
+
+
+def configurer_postgresql(base, pool=True, taille_min=2, taille_max=10, attente=10, pgbouncer=False):
+    """ Complète (et retourne) une entrée DATABASES PostgreSQL, voir l'en-tête du module. """
+    options = base.setdefault('OPTIONS', {})
+    base['CONN_HEALTH_CHECKS'] = True
+    if pool and pool_disponible():
+        # Le pool de Django refuse les connexions persistantes
+        base['CONN_MAX_AGE'] = 0
+        options['pool'] = {'min_size': taille_min, 'max_size': taille_max, 'timeout': attente}
+    else:
+        base['CONN_MAX_AGE'] = DUREE_CONNEXION_PERSISTANTE
+
+    if pgbouncer:
+        base['DISABLE_SERVER_SIDE_CURSORS'] = True
+        if importlib.util.find_spec('psycopg') is not None:
+            # Une requête préparée n'existe que sur la connexion serveur qui l'a préparée
+            options['prepare_threshold'] = None
+    return base
+
+
+def statistiques_pool(alias='default'):
+    """
+    Compteurs du pool de connexions de la base `alias` dans ce processus,
+    None si elle n'en a pas (psycopg2, SQLite, pool désactivé).
+    Les compteurs cumulés (emprunts, attentes, expirations...) partent du
+    démarrage du processus ; `attente_ms` est le temps d'attente cumulé.
+    """
+    from django.db import connections
+
+    pool = getattr(connections[alias], 'pool', None)
+    if pool is None:
+        return None
+    compteurs = pool.get_stats()
+    return {nom: compteurs.get(cle, 0) for cle, nom in COMPTEURS_POOL.items()}
@@ -1,8 +1,11 @@
+import copy
 import os
 from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
 
+from .connexions import configurer_postgresql
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -44,7 +47,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'corsheaders.middleware.CorsMiddleware'
+    'corsheaders.middleware.CorsMiddleware',
+    'presence.replica.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'presence_projet.urls'
@@ -97,6 +101,94 @@ DATABASES = {
     }
 }
 
+# Pool de connexions PostgreSQL par processus (presence_projet/connexions.py) :
+# DB_POOL_MIN connexions gardées ouvertes, au plus DB_POOL_MAX, attente d'une
+# connexion libre limitée à DB_POOL_ATTENTE secondes. DB_PGBOUNCER=True derrière
+# pgbouncer en mode transaction.
+configurer_postgresql(
+    DATABASES['default'],
+    pool=os.environ.get('DB_POOL', 'True') == 'True',
+    taille_min=int(os.environ.get('DB_POOL_MIN', '2')),
+    taille_max=int(os.environ.get('DB_POOL_MAX', '10')),
+    attente=float(os.environ.get('DB_POOL_ATTENTE', '10')),
+    pgbouncer=os.environ.get('DB_PGBOUNCER', 'False') == 'True',
+)
+
+# Base SQLite locale (DB_ENGINE=sqlite) : développement et benchmarks sans PostgreSQL
+if os.environ.get('DB_ENGINE') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', os.path.join(BASE_DIR, 'db.sqlite3')),
+        'OPTIONS': {'timeout': 30},
+    }
+
+# Réplique en lecture (presence/replica.py) : DB_REPLICA=True ajoute l'alias
+# 'replica', copie de 'default' dont DB_REPLICA_HOST, DB_REPLICA_PORT et
+# DB_REPLICA_NAME remplacent l'hôte, le port et la base. Sans eux, les deux
+# alias visent la même base (essais en local, y compris avec DB_ENGINE=sqlite).
+if os.environ.get('DB_REPLICA', 'False') == 'True':
+    DATABASES['replica'] = copy.deepcopy(DATABASES['default'])
+    for cle in ('HOST', 'PORT', 'NAME'):
+        if os.environ.get(f'DB_REPLICA_{cle}'):
+            DATABASES['replica'][cle] = os.environ[f'DB_REPLICA_{cle}']
+    # Sous test, la réplique lit la base de test du primaire
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['presence.replica.RouteurReplica']
+
+PRESENCE_REPLICA = {
+    # Après une écriture, l'utilisateur lit sur le primaire pendant ce délai (secondes)
+    'COLLANT_SECONDES': float(os.environ.get('PRESENCE_REPLICA_COLLANT_SECONDES', '5')),
+    # Au-delà de ce retard de réplication (secondes), les lectures restent sur le primaire
+    'RETARD_MAX_SECONDES': float(os.environ.get('PRESENCE_REPLICA_RETARD_MAX_SECONDES', '2')),
+}
+
+# Mode ASGI : sert valider_scan, rafraichir_qr et get_presences_api par leurs
+# versions asynchrones (presence/views_async.py). À activer avec uvicorn.
+PRESENCE_VUES_ASYNC = os.environ.get('PRESENCE_VUES_ASYNC', 'False') == 'True'
+
+# Cache du registre des sessions actives (presence/registry.py).
+# Sans CACHES configuré, Django utilise un LocMemCache propre à chaque processus ;
+# déclarer un cache partagé (Redis...) pour partager le registre entre workers
+# (avertissement presence.W001 au démarrage sinon, hors DEBUG).
+PRESENCE_CACHE_ALIAS = os.environ.get('PRESENCE_CACHE_ALIAS', 'default')
+
+# Format des jetons QR : 'jwt' (défaut, jeton stocké, valable 10 minutes) ou
+# 'compact' (session + fenêtre de temps + HMAC tronqué, recalculé sans écriture
+# en base toutes les QR_COMPACT_FENETRE_SECONDES secondes)
+QR_TOKEN_MODE = os.environ.get('QR_TOKEN_MODE', 'jwt')
+QR_COMPACT_FENETRE_SECONDES = int(os.environ.get('QR_COMPACT_FENETRE_SECONDES', '15'))
+
+# Écriture différée des présences (presence/ingestion.py)
+PRESENCE_INGESTION = {
+    'ASYNC': os.environ.get('PRESENCE_INGESTION_ASYNC', 'True') == 'True',
+    'INTERVALLE_MS': int(os.environ.get('PRESENCE_INGESTION_INTERVALLE_MS', '200')),
+    'TAILLE_LOT': int(os.environ.get('PRESENCE_INGESTION_TAILLE_LOT', '200')),
+}
+
+# Feuilles de présence PDF rendues en arrière-plan et gardées sur disque (presence/rapports.py)
+PRESENCE_RAPPORTS = {
+    'ASYNC': os.environ.get('PRESENCE_RAPPORTS_ASYNC', 'True') == 'True',
+    'REPERTOIRE': os.environ.get('PRESENCE_RAPPORTS_REPERTOIRE', os.path.join(BASE_DIR, 'rapports')),
+    'WORKERS': int(os.environ.get('PRESENCE_RAPPORTS_WORKERS', '2')),
+    # Rendus en lot (archive ZIP) : taille du pool de processus, nombre de cœurs par défaut
+    'PROCESSUS': int(os.environ['PRESENCE_RAPPORTS_PROCESSUS']) if os.environ.get('PRESENCE_RAPPORTS_PROCESSUS') else None,
+    # Moteur de rendu : 'xhtml2pdf' (gabarit HTML) ou 'reportlab' (dessin direct, plus rapide)
+    'MOTEUR': os.environ.get('PRESENCE_RAPPORTS_MOTEUR', 'xhtml2pdf'),
+}
+
+# Partitionnement de la table presence sous PostgreSQL (presence/partitions.py) :
+# une partition par semestre ou par mois, appliqué par la migration presence 0005
+PRESENCE_PARTITIONS = {
+    'ACTIF': os.environ.get('PRESENCE_PARTITIONS', 'False') == 'True',
+    'PERIODE': os.environ.get('PRESENCE_PARTITIONS_PERIODE', 'semestre'),
+}
+
+# Archives colonnaires des années universitaires closes (presence/archives.py)
+PRESENCE_ARCHIVES = {
+    'REPERTOIRE': os.environ.get('PRESENCE_ARCHIVES_REPERTOIRE', os.path.join(BASE_DIR, 'archives')),
+}
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
 ]
@@ -74,32 +74,75 @@ document.addEventListener('DOMContentLoaded', function() {
 
             <h6 class="border-bottom pb-2 mt-3 mb-2">Historique du cours</h6>
             <div style="max-height: 200px; overflow-y: auto;">
-                <ul class="list-group list-group-flush">
+                <ul class="list-group list-group-flush" id="historique-cours">
+                    <li class="list-group-item text-center small text-muted" id="historique-chargement">Chargement...</li>
         `;
 
-        if (data.historique.length === 0) {
-            html += `<li class="list-group-item text-center small text-muted">Aucune séance passée.</li>`;
-        } else {
-            data.historique.forEach(seance => {
-                html += `
-                    <li class="list-group-item d-flex justify-content-between px-0 py-2">
-                        <span>${seance.date} <small class="text-muted">(${seance.heure})</small></span>
-                        <span class="badge bg-${seance.couleur}">${seance.statut}</span>
-                    </li>
-                `;
-            });
-        }
-
-        html += `</ul></div>`;
+        html += `</ul></div>
+            <button class="btn btn-sm btn-outline-primary w-100 mt-2" id="btn-historique-plus" style="display:none;">
+                Voir plus
+            </button>`;
 
         if (statsContent) statsContent.innerHTML = html;
 
+        // L'historique est chargé page par page depuis l'API
+        loadHistorique(coursId, null);
+
         // Mettre en surbrillance l'élément de la liste à gauche
         document.querySelectorAll('.cours-item').forEach(el => el.classList.remove('active'));
         const activeItem = document.querySelector(`.cours-item[data-cours-id="${coursId}"]`);
         if(activeItem) activeItem.classList.add('active');
     };
 
+    /**
+     * Charge une page de l'historique d'un cours et l'ajoute à la liste.
+     * curseur vaut null pour la première page.
+     */
+    async function loadHistorique(coursId, curseur) {
+        const baseUrl = window.DJANGO_DATA.historiqueUrl.replace('/0/', `/${coursId}/`);
+        const url = curseur ? `${baseUrl}?curseur=${encodeURIComponent(curseur)}` : baseUrl;
+        const liste = document.getElementById('historique-cours');
+        const btnPlus = document.getElementById('btn-historique-plus');
+
+        try {
+            const response = await fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } });
+            if (!response.ok) throw new Error('Erreur réseau');
+            const data = await response.json();
+
+            // Le cours a pu changer pendant le chargement
+            if (courseSelect && courseSelect.value !== String(coursId)) return;
+
+            const chargement = document.getElementById('historique-chargement');
+            if (chargement) chargement.remove();
+
+            if (!curseur && data.historique.length === 0) {
+                liste.innerHTML = `<li class="list-group-item text-center small text-muted">Aucune séance passée.</li>`;
+            }
+            data.historique.forEach(seance => {
+                liste.insertAdjacentHTML('beforeend', `
+                    <li class="list-group-item d-flex justify-content-between px-0 py-2">
+                        <span>${seance.date} <small class="text-muted">(${seance.heure})</small></span>
+                        <span class="badge bg-${seance.couleur}">${seance.statut}</span>
+                    </li>
+                `);
+            });
+
+            if (data.suivant) {
+                btnPlus.style.display = 'block';
+                btnPlus.onclick = () => {
+                    btnPlus.style.display = 'none';
+                    loadHistorique(coursId, data.suivant);
+                };
+            } else {
+                btnPlus.style.display = 'none';
+            }
+        } catch (error) {
+            console.error("Erreur lors du chargement de l'historique:", error);
+            const chargement = document.getElementById('historique-chargement');
+            if (chargement) chargement.textContent = "Erreur de chargement de l'historique.";
+        }
+    }
+
     /**
      * Fonction pour remettre l'affichage par défaut
      */
@@ -12,18 +12,30 @@ document.addEventListener("DOMContentLoaded", function() {
     // Intervalle de polling (toutes les 5 secondes)
     const POLLING_INTERVAL = 5000;
 
+    // Curseur et ETag du dernier appel : seules les nouvelles présences sont
+    // renvoyées, et le serveur répond 304 si rien n'a changé.
+    let cursor = 0;
+    let etag = null;
+    // Ids déjà affichés : le flux renvoie les présences récentes à chaque reconnexion
+    const displayedIds = new Set();
+
     async function updatePresenceList() {
         try {
-            const response = await fetch(presencesUrl, {
+            const headers = { 'X-Requested-With': 'XMLHttpRequest' };
+            if (etag) headers['If-None-Match'] = etag;
+            const response = await fetch(`${presencesUrl}?since=${cursor}`, {
                 method: 'GET',
-                headers: { 'X-Requested-With': 'XMLHttpRequest' },
+                headers: headers,
             });
+            if (response.status === 304) return;
             if (!response.ok) throw new Error('Erreur réseau');
 
+            etag = response.headers.get('ETag');
             const data = await response.json();
 
-            // Met à jour la liste
-            renderList(data.presences);
+            // Ajoute les nouvelles présences à la liste
+            data.presences.forEach(addPresence);
+            cursor = data.curseur;
 
         } catch (error) {
             console.error("Erreur lors de la mise à jour des présences:", error);
@@ -33,33 +45,57 @@ document.addEventListener("DOMContentLoaded", function() {
         }
     }
 
-    function renderList(presences) {
-        // Vide la liste
-        listePresences.innerHTML = '';
+    // --- Flux SSE : le serveur pousse chaque nouvelle présence ---
+    function addPresence(p) {
+        if (displayedIds.has(p.id)) return;
+        displayedIds.add(p.id);
+        if (noPresenceLi && noPresenceLi.parentNode) {
+            noPresenceLi.remove();
+        }
+        const li = document.createElement('li');
+        li.className = 'list-group-item';
+        li.innerHTML = `${p.prenom} ${p.nom}
+                      <span class="text-muted float-end">${p.heure}</span>`;
+        listePresences.appendChild(li);
+        presenceCount.textContent = listePresences.querySelectorAll('li:not(#aucune-presence)').length;
+    }
+
+    function startStream() {
+        // À la reconnexion, le navigateur renvoie Last-Event-ID : le serveur
+        // n'envoie que les présences non encore reçues.
+        const source = new EventSource(presenceCard.dataset.fluxUrl);
 
-        // Met à jour le compteur
-        presenceCount.textContent = presences.length;
+        source.addEventListener('presence', function(event) {
+            addPresence({ id: Number(event.lastEventId), ...JSON.parse(event.data) });
+        });
 
-        if (presences.length === 0) {
-            // Remet le message "Aucun étudiant"
-            if (noPresenceLi) {
-                listePresences.appendChild(noPresenceLi);
+        // Session terminée : plus rien à recevoir
+        source.addEventListener('fin', function() {
+            source.close();
+        });
+
+        source.onerror = function() {
+            if (source.readyState === EventSource.CLOSED) {
+                // Refusé par le serveur (503 : trop de flux ouverts) : polling
+                console.warn("Flux des présences refusé, passage au polling.");
+                startPolling();
+            } else {
+                console.warn("Flux des présences interrompu, reconnexion...");
             }
-        } else {
-            // Remplit la liste avec les nouveaux présents
-            presences.forEach(p => {
-                const li = document.createElement('li');
-                li.className = 'list-group-item';
-                li.innerHTML = `${p.prenom} ${p.nom}
-                              <span class="text-muted float-end">${p.heure}</span>`;
-                listePresences.appendChild(li);
-            });
-        }
+        };
     }
 
-    // Lancement du polling
-    setInterval(updatePresenceList, POLLING_INTERVAL);
-    // Lancement immédiat au chargement de la page
-    updatePresenceList();
+    function startPolling() {
+        setInterval(updatePresenceList, POLLING_INTERVAL);
+        // Lancement immédiat au chargement de la page
+        updatePresenceList();
+    }
+
+    if (presenceCard.dataset.fluxUrl && window.EventSource) {
+        startStream();
+    } else {
+        // Vues synchrones (WSGI) ou navigateur sans EventSource : polling
+        startPolling();
+    }
 });
 
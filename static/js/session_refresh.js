@@ -9,9 +9,10 @@ document.addEventListener("DOMContentLoaded", function() {
     const timerDisplay = document.getElementById('qr-timer');
     const spinner = document.getElementById('qr-spinner');
 
-    // Intervalle de 10 minutes (en millisecondes)
-    const REFRESH_INTERVAL = 600000;
-    let timerDuration = 600; // 10 minutes en secondes pour l'affichage
+    // Intervalle fourni par la page (10 minutes en mode JWT, quelques secondes en mode compact)
+    const REFRESH_SECONDS = parseInt(qrContainer.dataset.refreshSeconds, 10) || 600;
+    const REFRESH_INTERVAL = REFRESH_SECONDS * 1000;
+    let timerDuration = REFRESH_SECONDS; // en secondes pour l'affichage
 
     // --- 1. Fonction de rafraîchissement du QR Code ---
     async function refreshQRCode() {
@@ -29,10 +30,11 @@ document.addEventListener("DOMContentLoaded", function() {
 
             const data = await response.json();
 
-            if (data.qr_image_base64) {
-                qrImage.src = 'data:image/png;base64,' + data.qr_image_base64;
+            if (data.qr_image_url) {
+                // L'URL versionnée par le jeton est mise en cache par le navigateur
+                qrImage.src = data.qr_image_url;
                 console.log("QR Code rafraîchi !");
-                timerDuration = 600; // Réinitialiser le minuteur
+                timerDuration = REFRESH_SECONDS; // Réinitialiser le minuteur
             } else if (data.error) {
                 console.error(data.error);
                 if(timerDisplay) timerDisplay.textContent = data.error;